@@ -0,0 +1,146 @@
+# Fusion API call tracing for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk: the modules to trace are
+# passed in. Most of the time of a preview is spent in API calls, so their
+# number is the figure to watch when a combination of inputs turns slow.
+#
+# Wrapping every object the API returns would mean unwrapping it again before
+# it is passed back into the API, static casts included. Instead, while a trace
+# is running, every public method and property of the classes of the traced
+# modules is replaced by a proxy that counts the call and forwards it. The
+# proxies are removed again when the trace stops, so an untraced invocation
+# runs the original API untouched.
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Calls made while the profile is not inside any phase are counted here.
+OUTSIDE_PHASES = '(outside phases)'
+
+
+class ApiTrace:
+    """The API calls of one command invocation, by phase and by method."""
+
+    def __init__(self, name: str, profile=None):
+        """
+        Arguments:
+        name -- The invocation, for example 'preview'.
+        profile -- The profiler.Profile of the invocation, whose active phase
+                   each call is counted in.
+        """
+        self.name = name
+        self.profile = profile
+        self.calls: Dict[str, Counter] = {}
+
+    def record(self, method: str):
+        phase = getattr(self.profile, 'active_phase', None) or OUTSIDE_PHASES
+        counts = self.calls.get(phase)
+        if counts is None:
+            counts = self.calls[phase] = Counter()
+        counts[method] += 1
+
+    @property
+    def total_calls(self) -> int:
+        return sum(sum(counts.values()) for counts in self.calls.values())
+
+    def calls_by_method(self) -> Counter:
+        total = Counter()
+        for counts in self.calls.values():
+            total.update(counts)
+        return total
+
+    def calls_by_phase(self) -> Dict[str, int]:
+        return {phase: sum(counts.values()) for phase, counts in self.calls.items()}
+
+    def calls_per_copy(self, num_copies: int) -> float:
+        return self.total_calls / max(num_copies, 1)
+
+    def is_over_budget(self, num_copies: int, budget_per_copy: float) -> bool:
+        """Returns True if the invocation made more than budget_per_copy calls per copy.
+
+        A budget of zero or less is never exceeded.
+        """
+        return budget_per_copy > 0 and self.calls_per_copy(num_copies) > budget_per_copy
+
+    def report_lines(self, num_copies: int, top: int = 10) -> List[str]:
+        """Returns one line for the invocation, one per phase and the top most called methods."""
+        lines = [f'{self.name}: {self.total_calls} API calls, {self.calls_per_copy(num_copies):.1f} per copy']
+        for phase, calls in sorted(self.calls_by_phase().items(), key=lambda item: -item[1]):
+            lines.append(f'  {phase}: {calls} calls')
+        for method, calls in self.calls_by_method().most_common(top):
+            lines.append(f'  {method}(): {calls} calls')
+        return lines
+
+    def to_dict(self, num_copies: int) -> dict:
+        return {
+            'name': self.name,
+            'copies': num_copies,
+            'calls': self.total_calls,
+            'calls_per_copy': self.calls_per_copy(num_copies),
+            'phases': {phase: dict(counts.most_common()) for phase, counts in self.calls.items()},
+        }
+
+
+# The running trace, if any, and the proxies installed for it as
+# (class, attribute, original, proxy) tuples.
+_active: Optional[ApiTrace] = None
+_patches = []
+
+
+def start(trace: ApiTrace, modules):
+    """Counts the calls to the classes of modules in trace until stop() is called."""
+    global _active
+    stop()
+    for module in modules:
+        for cls in list(vars(module).values()):
+            if isinstance(cls, type) and cls.__module__ == module.__name__:
+                _patch_class(cls)
+    _active = trace
+
+
+def stop() -> Optional[ApiTrace]:
+    """Removes the proxies and returns the trace that was running, if any."""
+    global _active
+    trace, _active = _active, None
+    for cls, attribute, original, proxy in reversed(_patches):
+        if cls.__dict__.get(attribute) is proxy:
+            setattr(cls, attribute, original)
+    _patches.clear()
+    return trace
+
+
+def _patch_class(cls: type):
+    for attribute, original in list(vars(cls).items()):
+        if attribute.startswith('_'):
+            continue
+        proxy = _proxy(f'{cls.__name__}.{attribute}', original)
+        if proxy is not None:
+            setattr(cls, attribute, proxy)
+            _patches.append((cls, attribute, original, proxy))
+
+
+def _proxy(method: str, original):
+    # Returns a proxy for a function, static or class method or property, or
+    # None for anything else (constants, nested classes).
+    if isinstance(original, staticmethod):
+        return staticmethod(_counting(method, original.__func__))
+    if isinstance(original, classmethod):
+        return classmethod(_counting(method, original.__func__))
+    if isinstance(original, property):
+        return property(original.fget and _counting(method, original.fget),
+                        original.fset and _counting(method, original.fset),
+                        original.fdel, original.__doc__)
+    if callable(original) and not isinstance(original, type):
+        return _counting(method, original)
+    return None
+
+
+def _counting(method: str, function):
+    def proxy(*args, **kwargs):
+        trace = _active
+        if trace is not None:
+            trace.record(method)
+        return function(*args, **kwargs)
+    proxy.__name__ = getattr(function, '__name__', method)
+    proxy.__doc__ = getattr(function, '__doc__', None)
+    return proxy
@@ -1,8 +1,12 @@
+import itertools
 import json
-import adsk.core, adsk.fusion, adsk.cam, traceback, math, random
+import adsk.core, adsk.fusion, adsk.cam
 import os
+import time
+import numpy as np
 from ...lib import fusion360utils as futil
 from ... import config
+from . import api_trace, expressions, fractal, geometry, graphics, interference, mesh_export, plan, plan_store, preview_budget, profiler, proxies
 
 app = adsk.core.Application.get()
 ui = app.userInterface
@@ -30,6 +34,16 @@ ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource
 # Local list of event handlers used to maintain a reference so
 # they are not released and garbage collected.
 local_handlers = []
+# The proxy of each preview option that stands in for the selected bodies.
+PROXY_KINDS = {
+    "use cube as body": proxies.CUBE,
+    "use sphere as body": proxies.SPHERE,
+    "use bounding box of selection as body": proxies.BOUNDING_BOX,
+}
+# The last transform plan of the running command, reused by later previews.
+plan_cache = plan.PlanCache()
+# How long one copy took to build in earlier previews of the running command.
+copy_cost_model = preview_budget.CopyCostModel()
 global scale_transform
 global internal_rotation_transform
 global translation_transform
@@ -175,9 +189,70 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     copyRadioButtonItems.add("remove original bodies", False)
 
     # Create a checkbox.
-    newComponentBoolean = tabCopyChildInputs.addBoolValueInput('create new components', 'create new component for each body', True, "", True)
+    newComponentBoolean = tabCopyChildInputs.addBoolValueInput('create new components', 'create new components', True, "", True)
+    # Create radio button group input.
+    componentRadioButtonGroup = tabCopyChildInputs.addRadioButtonGroupCommandInput('componentRadioButtonGroup', 'Component Options')
+    componentRadioButtonItems = componentRadioButtonGroup.listItems
+    componentRadioButtonItems.add("one component for each copy", True)
+    componentRadioButtonItems.add("one component for each source body", False)
+    componentRadioButtonItems.add("one component for each generation", False)
+    componentRadioButtonItems.add("one component for each body", False)
     applyRecursivelyBoolean = tabCopyChildInputs.addBoolValueInput('apply transformations recursively', 'apply transformations recursively to newly generated bodies', True, "", True)
 
+    # Create radio button group input.
+    outputRadioButtonGroup = tabCopyChildInputs.addRadioButtonGroupCommandInput('outputRadioButtonGroup', 'Output Options')
+    outputRadioButtonItems = outputRadioButtonGroup.listItems
+    outputRadioButtonItems.add("parametric features for each copy", True)
+    outputRadioButtonItems.add("single base feature for all copies", False)
+    outputRadioButtonItems.add("component occurrences for each copy", False)
+    outputRadioButtonItems.add("export mesh file (STL, OBJ, 3MF)", False)
+
+    # Create a text box for the file the mesh is exported to, its extension picks the format.
+    exportFileInput = tabCopyChildInputs.addTextBoxCommandInput('export_file', 'Export File', os.path.join(os.path.expanduser('~'), 'pattern.3mf'), 1, False)
+    exportFileInput.tooltip = 'A .stl, .obj or .3mf file. 3MF stores each body once and every copy as a placement of it'
+    exportFileInput.isVisible = False
+
+    # Create a value input with the current length units.
+    users_current_units = app.activeProduct.unitsManager.defaultLengthUnits
+    minimumCopySizeInput = tabCopyChildInputs.addValueInput('minimum_copy_size', 'Minimum Copy Size', users_current_units, adsk.core.ValueInput.createByReal(0))
+    minimumCopySizeInput.minimumValue = 0
+    minimumCopySizeInput.isMinimumValueInclusive = True
+    minimumCopySizeInput.tooltip = 'Copies smaller than this are left out of the pattern, 0 keeps every copy'
+
+    # Create integer spinner input for the seed of the randomization sliders.
+    randomSeedInput = tabCopyChildInputs.addIntegerSpinnerCommandInput('random_seed', 'Random Seed', 0, 999999, 1, 0)
+    randomSeedInput.tooltip = 'The same seed gives the same random scales, angles and offsets, in the preview and in the result'
+
+    # Create group input.
+    fractalGroupCmdInput = tabCopyChildInputs.addGroupCommandInput('fractal', 'Fractal (Iterated Function System)')
+    fractalGroupCmdInput.isExpanded = False
+    fractalGroupCmdInput.isEnabledCheckBoxDisplayed = True
+    fractalGroupCmdInput.isEnabledCheckBoxChecked = False
+    fractalGroupChildInputs = fractalGroupCmdInput.children
+    # Create a read only textbox input.
+    fractalGroupChildInputs.addTextBoxCommandInput('fractal_instructions', 'Fractal Instructions', 'The first copies defined on the other tabs become the maps of the fractal.  Every generation applies each map to every copy of the generation before it.', 3, True)
+    # Create integer slider inputs.
+    fractalMapsSlider = fractalGroupChildInputs.addIntegerSliderCommandInput('fractal_num_maps', 'number of maps', 1, 10, False)
+    fractalMapsSlider.valueOne = 3
+    fractalDepthSlider = fractalGroupChildInputs.addIntegerSliderCommandInput('fractal_depth', 'number of generations', 1, 12, False)
+    fractalDepthSlider.valueOne = 3
+    # Create integer spinner input, since fractals expanded to disk can have millions of copies.
+    fractalMaximumInput = fractalGroupChildInputs.addIntegerSpinnerCommandInput('fractal_maximum_instances', 'maximum number of copies', 1, config.MAXIMUM_STORED_INSTANCES, 1000, 1000)
+    fractalMaximumInput.tooltip = 'Fractals with a minimum scale are expanded in memory and keep at most ' + str(fractal.MAXIMUM_INSTANCES) + ' copies'
+    # Create texbox value input.
+    fractalGroupChildInputs.addTextBoxCommandInput('fractal_minimum_scale', 'Minimum Scale', '0.0', 1, False)
+
+    # Create group input.
+    savedPlanGroupCmdInput = tabCopyChildInputs.addGroupCommandInput('saved_plan', 'Saved Plan')
+    savedPlanGroupCmdInput.isExpanded = False
+    savedPlanGroupChildInputs = savedPlanGroupCmdInput.children
+    # Create a read only textbox input.
+    savedPlanGroupChildInputs.addTextBoxCommandInput('plan_instructions', 'Plan Instructions', 'Save the transform of every copy to a file, and replay it later instead of computing the copies from the other inputs.', 3, True)
+    savedPlanGroupChildInputs.addTextBoxCommandInput('plan_file', 'Plan File', os.path.join(os.path.expanduser('~'), 'pattern.json'), 1, False)
+    # Create a save button and a checkbox.
+    savedPlanGroupChildInputs.addBoolValueInput('save plan', 'Save Plan', False, '', False)
+    savedPlanGroupChildInputs.addBoolValueInput('replay plan', 'replay the saved plan', True, '', False)
+
 
 ## SCALE
     # Create group input.
@@ -198,16 +273,21 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     scaleEquationRadioButtonItems.add("scale uniformly", True)
     scaleEquationRadioButtonItems.add("scale X,Y,Z axes separately", False)
     # Create texbox value inputs.
+    scale_expression_tooltip = 'A number, or an expression of the copy index k and the copy count n such as 0.9**k or 1 + 0.1*sin(k)'
     scaleValueInput = scaleGroupChildInputs.addTextBoxCommandInput('scale_value', 'Scale Ratio', '1.0', 1, False)
+    scaleValueInput.tooltip = scale_expression_tooltip
     scaleValueInput.isEnabled = True
     scaleValueInput.isVisible = True
     scaleValueInputX = scaleGroupChildInputs.addTextBoxCommandInput('scale_value_x', 'Scale Ratio X-axis', '1.0', 1, False)
+    scaleValueInputX.tooltip = scale_expression_tooltip
     scaleValueInputX.isEnabled = False
     scaleValueInputX.isVisible = False    
     scaleValueInputY = scaleGroupChildInputs.addTextBoxCommandInput('scale_value_y', 'Scale Ratio Y-axis', '1.0', 1, False)
+    scaleValueInputY.tooltip = scale_expression_tooltip
     scaleValueInputY.isEnabled = False
     scaleValueInputY.isVisible = False
     scaleValueInputZ = scaleGroupChildInputs.addTextBoxCommandInput('scale_value_z', 'Scale Ratio Z-axis', '1.0', 1, False)
+    scaleValueInputZ.tooltip = scale_expression_tooltip
     scaleValueInputZ.isEnabled = False
     scaleValueInputZ.isVisible = False
     # Create integer slider input.
@@ -242,6 +322,10 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     internal_rotation_transform = adsk.core.Matrix3D.create()
     internalRotationTriadOutput = internalRotationGroupChildInputs.addTriadCommandInput('internal_rotation_triad', internal_rotation_transform)
     internalRotationTriadOutput.hideAll()
+    # Create texbox value input, left blank to use the angle of the triad.
+    angle_expression_tooltip = 'Blank to use the triad, or an angle in degrees that can depend on the copy index k and the copy count n such as 10*k'
+    internalRotationAngleInput = internalRotationGroupChildInputs.addTextBoxCommandInput('internal_rotation_angle', 'Angle (deg)', '', 1, False)
+    internalRotationAngleInput.tooltip = angle_expression_tooltip
     # Create integer slider input.
     internalRotationRandomization = internalRotationGroupChildInputs.addIntegerSliderCommandInput('internal_rotation_randomization', 'Internal Rotation Randomization (deg)', 0, 360, False)
     # Create a reset button.
@@ -263,6 +347,14 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     translation_transform = adsk.core.Matrix3D.create()
     translationTriadOutput = translationGroupChildInputs.addTriadCommandInput('translation_triad', translation_transform)
     translationTriadOutput.hideAll()
+    # Create texbox value inputs, left blank to use the offsets of the triad.
+    offset_expression_tooltip = 'Blank to use the triad, or an offset in cm that can depend on the copy index k and the copy count n such as 2*sin(k)'
+    translationInputX = translationGroupChildInputs.addTextBoxCommandInput('translation_x', 'Offset X (cm)', '', 1, False)
+    translationInputX.tooltip = offset_expression_tooltip
+    translationInputY = translationGroupChildInputs.addTextBoxCommandInput('translation_y', 'Offset Y (cm)', '', 1, False)
+    translationInputY.tooltip = offset_expression_tooltip
+    translationInputZ = translationGroupChildInputs.addTextBoxCommandInput('translation_z', 'Offset Z (cm)', '', 1, False)
+    translationInputZ.tooltip = offset_expression_tooltip
     # Create integer slider input.
     translationRandomizationX = translationGroupChildInputs.addIntegerSliderCommandInput('translation_randomization_x', 'Translation X Randomization %', 0, 100, False)
     translationRandomizationY = translationGroupChildInputs.addIntegerSliderCommandInput('translation_randomization_y', 'Translation Y Randomization %', 0, 100, False)
@@ -285,6 +377,9 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     external_rotation_transform = adsk.core.Matrix3D.create()
     externalRotationTriadOutput = externalRotationGroupChildInputs.addTriadCommandInput('external_rotation_triad', external_rotation_transform)
     externalRotationTriadOutput.hideAll()
+    # Create texbox value input, left blank to use the angle of the triad.
+    externalRotationAngleInput = externalRotationGroupChildInputs.addTextBoxCommandInput('external_rotation_angle', 'Angle (deg)', '', 1, False)
+    externalRotationAngleInput.tooltip = angle_expression_tooltip
     # Create integer slider input.
     externalRotationRandomization = externalRotationGroupChildInputs.addIntegerSliderCommandInput('external_rotation_randomization', 'External Rotation Randomization (deg)', 0, 360, False)
     # Create a reset button.
@@ -306,6 +401,14 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     previewRadioButtonItems.add("use actual bodies", True)
     previewRadioButtonItems.add("use cube as body", False)
     previewRadioButtonItems.add("use sphere as body", False)
+    previewRadioButtonItems.add("use bounding box of selection as body", False)
+    previewRadioButtonItems.add("draw actual bodies as graphics", False)
+
+    # Create integer slider input.
+    previewBudgetSlider = previewGroupChildInputs.addIntegerSliderCommandInput('preview_budget', 'Preview Time Budget (ms)', 0, 5000, False)
+    previewBudgetSlider.valueOne = 1000
+    # Create a read only textbox input.
+    previewGroupChildInputs.addTextBoxCommandInput('preview_status', 'Preview Status', 'Copies beyond the time budget are drawn as graphics.  Set the budget to 0 to always build every copy.', 2, True)
 
     # Create a interference button.
     interferenceBoolean = previewGroupChildInputs.addBoolValueInput('preview interference', 'Show Interference', False, interference_button_icons, False)
@@ -319,12 +422,56 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
 
 
 # This function will be called when the user hits the OK button in the command dialog
+# Fusion only fires it when the last preview was not a valid result: when the preview is off, shows
+# proxy bodies or graphics, or was cut short by its time budget. So the result is built here from the
+# selected bodies, with every copy and without any time budget.
 def command_execute(args: adsk.core.CommandEventArgs):
     futil.log(f'{CMD_NAME} Command Execute Event')
+    inputs = args.command.commandInputs
+    profile = profiler.Profile('execute')
+    start_api_trace(profile)
     design = adsk.fusion.Design.cast(app.activeProduct)
-    design.designType = adsk.fusion.DesignTypes.ParametricDesignType
-    # General logging for debug
-    futil.log(f'{CMD_NAME} Command Execute Event')
+    with profile.phase('set design type'):
+        design.designType = adsk.fusion.DesignTypes.ParametricDesignType
+    rootComp = design.rootComponent
+    graphics.remove_graphics()
+
+    copy_radio_button: adsk.core.RadioButtonGroupCommandInput = inputs.itemById('copyRadioButtonGroup')
+    do_copy_original_bodies = (copy_radio_button.selectedItem.name == 'copy and remove original bodies') or (copy_radio_button.selectedItem.name == 'copy and keep original bodies')
+    do_remove_original_bodies = (copy_radio_button.selectedItem.name == 'copy and remove original bodies') or (copy_radio_button.selectedItem.name == 'remove original bodies')
+    do_create_new_component_for_each_body = inputs.itemById('create new components').value
+
+    with profile.phase('collect bodies'):
+        originalBodiesCollection = get_selected_bodies()
+    if (originalBodiesCollection.count == 0):
+        futil.log('  EXECUTE: no bodies selected, nothing to build', adsk.core.LogLevels.WarningLogLevel)
+        report_profile(profile)
+        return
+
+    phase_start = profile.enter('plan')
+    transform_plan, net_matrices, num_copies, first_changed_row, do_expand_fractal, copy_generations = get_copy_matrices(inputs, originalBodiesCollection.count)
+    copy_indices = range(0 if do_copy_original_bodies else 1, num_copies+1)
+    profile.add('plan', time.perf_counter() - phase_start, copies=num_copies)
+
+    phase_start = profile.enter('cull')
+    copy_indices, culled_indices = cull_copies(inputs, originalBodiesCollection, net_matrices, copy_indices)
+    profile.add('cull', time.perf_counter() - phase_start, copies=len(culled_indices))
+
+    outputRadioButtonGroupSelection = get_output_option(inputs, net_matrices)
+    if (outputRadioButtonGroupSelection == "export mesh file (STL, OBJ, 3MF)"):
+        # WRITE THE COPIES TO A MESH FILE WITHOUT CHANGING THE DESIGN
+        export_mesh(inputs, originalBodiesCollection, net_matrices, copy_indices, profile)
+        report_profile(profile, len(copy_indices))
+        return
+    bodiesCollection, built_indices = build_copies(rootComp, originalBodiesCollection, transform_plan, net_matrices, copy_indices, num_copies, do_expand_fractal, outputRadioButtonGroupSelection, preview_budget.PreviewBudget(0), profile)
+
+    if (do_remove_original_bodies):
+        remove_original_bodies(rootComp, originalBodiesCollection, profile)
+    if (do_create_new_component_for_each_body == True and outputRadioButtonGroupSelection != "component occurrences for each copy"):
+        create_components(rootComp, inputs, originalBodiesCollection, bodiesCollection, copy_generations, profile)
+
+    futil.log(f'  EXECUTE: built {len(built_indices)} copies with {outputRadioButtonGroupSelection}, culled {len(culled_indices)}, in {profile.total_seconds:.3f} s')
+    report_profile(profile, len(built_indices))
 
 # This function will be called when the command needs to compute a new preview in the graphics window
 def command_preview(args: adsk.core.CommandEventArgs):
@@ -339,381 +486,160 @@ def command_preview(args: adsk.core.CommandEventArgs):
     preview_input: adsk.core.GroupCommandInput = inputs.itemById('preview')
     show_preview_flag = preview_input.isEnabledCheckBoxChecked
     if (show_preview_flag == False):
+        graphics.remove_graphics()
         args.isValidResult = False
     else:
         futil.log(f'{CMD_NAME} Command Preview Event')
+        profile = profiler.Profile('preview')
+        start_api_trace(profile)
         design = adsk.fusion.Design.cast(app.activeProduct)
         # Get the root component of the active design.
         rootComp = design.rootComponent
-        features = rootComp.features
-        # Get the selection.
-        selection = ui.activeSelections
-        # Create a scales feature
-        scaleFeats = rootComp.features.scaleFeatures
-        # Create a move feature
-        moveFeats = features.moveFeatures
-        # Create remove feature
-        removeFeats = features.removeFeatures
 
         num_copies = inputs.itemById('num_copies').valueOne
 
-        do_scaling_flag = inputs.itemById('scale').isEnabledCheckBoxChecked
-        do_internal_rotation_flag = inputs.itemById('internal rotation').isEnabledCheckBoxChecked
-        do_translation_flag = inputs.itemById('translation').isEnabledCheckBoxChecked
-        do_external_rotation_flag = inputs.itemById('external rotation').isEnabledCheckBoxChecked
         copy_radio_button: adsk.core.RadioButtonGroupCommandInput = inputs.itemById('copyRadioButtonGroup')
         do_copy_original_bodies = (copy_radio_button.selectedItem.name == 'copy and remove original bodies') or (copy_radio_button.selectedItem.name == 'copy and keep original bodies')
         do_remove_original_bodies = (copy_radio_button.selectedItem.name == 'copy and remove original bodies') or (copy_radio_button.selectedItem.name == 'remove original bodies')
         do_create_new_component_for_each_body = inputs.itemById('create new components').value
-        do_apply_transformations_recursively = inputs.itemById('apply transformations recursively').value
 
+        phase_start = profile.enter('collect bodies')
         originalBodiesCollection = adsk.core.ObjectCollection.create()
-        bodiesCollection = []
+        bodiesCollection = {}
 
         previewRadioButtonGroupSelection = inputs.itemById('previewRadioButtonGroup').selectedItem.name
-        if (previewRadioButtonGroupSelection == "use actual bodies"):
+        if (previewRadioButtonGroupSelection != "draw actual bodies as graphics"):
+            graphics.remove_graphics()
+        if (previewRadioButtonGroupSelection == "use actual bodies") or (previewRadioButtonGroupSelection == "draw actual bodies as graphics"):
             # GRAB BODIES FROM SELECTION
-            for selected_body_index in range(selection.count):
-                # Get the first selected object.
-                selectedObject = selection.item(selected_body_index).entity
-
-                # Cast the selected object to a body.
-                body = adsk.fusion.BRepBody.cast(selectedObject)
+            originalBodiesCollection = get_selected_bodies()
+        else:
+            # ADD A PROXY SIZED FROM THE SELECTION
+            # (its solid is built once per session and reused by later previews)
+            proxy_kind = PROXY_KINDS[previewRadioButtonGroupSelection]
+            proxy_shape = get_proxy_shape(proxy_kind)
+            originalBodiesCollection.add(proxies.add_proxy_body(rootComp, proxy_kind, proxy_shape))
 
-                # Check that the selected object is a body.
-                if not body:
-                    app.log('WARNING: selected object is not a body. skipping...  ')
-                    ui.messageBox('The selected object is not a body', 'Not a Body')
-                    # return
-                else:
-                    originalBodiesCollection.add(body)
-                    app.log('  USING ' + body.name)
-        else: 
-            sample_dimension_size = 0.5
-            if (previewRadioButtonGroupSelection == "use cube as body"):
-                # Create a cube with a base edge length of sample_dimension_size 
-
-                # Create a new sketch on the xy plane.
-                sketches = rootComp.sketches;
-                xyPlane = rootComp.xYConstructionPlane;
-                sketch = sketches.add(xyPlane)
-
-                # Get sketch lines
-                sketchLines = sketch.sketchCurves.sketchLines
-
-                # Create sketch rectangle
-                startPoint = adsk.core.Point3D.create(0, 0, 0)
-                endPoint = adsk.core.Point3D.create(sample_dimension_size, sample_dimension_size, 0)
-                sketchLines.addTwoPointRectangle(startPoint, endPoint)
-                
-                # Get the profile defined by half of the circle.
-                prof = sketch.profiles.item(0)
-
-                # Create a simple extrusion of the profile
-                extrudeFeat = rootComp.features.extrudeFeatures
-                distance = adsk.core.ValueInput.createByReal(sample_dimension_size)
-
-                # Create the extrusion.
-                ext = extrudeFeat.addSimple(prof, distance, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)  
-                body = ext.bodies[0]
-
-            elif (previewRadioButtonGroupSelection == "use sphere as body"):
-                # Create a new sketch on the xy plane.
-                sketches = rootComp.sketches;
-                xyPlane = rootComp.xYConstructionPlane;
-                sketch = sketches.add(xyPlane)
-
-                # Draw a circle.
-                circles = sketch.sketchCurves.sketchCircles
-                circle = circles.addByCenterRadius(adsk.core.Point3D.create(0, 0, 0), sample_dimension_size)
-                
-                # Draw a line to use as the axis of revolution.
-                lines = sketch.sketchCurves.sketchLines
-                axisLine = lines.addByTwoPoints(adsk.core.Point3D.create(-sample_dimension_size, 0, 0), adsk.core.Point3D.create(sample_dimension_size, 0, 0))
-
-                # Get the profile defined by half of the circle.
-                prof = sketch.profiles.item(0)
-
-                # Create an revolution input to be able to define the input needed for a revolution
-                # while specifying the profile and that a new component is to be created
-                revolveFeat = rootComp.features.revolveFeatures
-                revInput = revolveFeat.createInput(prof, axisLine, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-
-                # Define that the extent is an angle of 2*pi to get a sphere
-                angle = adsk.core.ValueInput.createByReal(2*math.pi)
-                revInput.setAngleExtent(False, angle)
-
-                # Create the extrusion.
-                rev = revolveFeat.add(revInput)
-                body = rev.bodies[0]
-            
-
-            if not body:
-                app.log('WARNING: selected object is not a body. skipping...  ')
-                ui.messageBox('The selected object is not a body', 'Not a Body')
-                # return
-            else:
-                originalBodiesCollection.add(body)
-    
+        profile.add('collect bodies', time.perf_counter() - phase_start, bodies=originalBodiesCollection.count)
 
         if (len(originalBodiesCollection) > 0):
-            # Create centerpoint
-            sketches = rootComp.sketches
-            sketch = sketches.add(rootComp.xZConstructionPlane)
-            centerPoint = adsk.core.Point3D.create(0, 0, 0)
-            basePt = sketch.sketchPoints.item(0)
-
-            cumulativeBodiesCollection = adsk.core.ObjectCollection.create()
-
-            # COPY ORIGINAL BODIES
-            # copy over original bodies and keep as copies
-            if (do_copy_original_bodies):
-                for selected_body_index in range(originalBodiesCollection.count):
-                    app.log('copying iteration ' + str(0))
-                    app.log('  original bodies collection count: ' + str(originalBodiesCollection.count))
-                    bodiesCollection.append(adsk.core.ObjectCollection.create())
-                    app.log('    copying body number ' + str(selected_body_index))
-                    # Get the first selected object.
-                    body = originalBodiesCollection.item(selected_body_index)
-                    
-                    # Copy the body.
-                    copy = body.copyToComponent(rootComp)
-                    copy.name = body.name + "_" + str(0)
-                    app.log('  CREATED BODY: ' + copy.name + ' from original body ' + body.name)
-
-                    # Add body to collection
-                    bodiesCollection[0].add(copy)
-                    cumulativeBodiesCollection.add(copy)
+            # COMPUTE THE TRANSFORMS OF EVERY COPY UP FRONT
+            # (reusing whatever did not change since the last preview)
+            phase_start = profile.enter('plan')
+            transform_plan, net_matrices, num_copies, first_changed_row, do_expand_fractal, copy_generations = get_copy_matrices(inputs, originalBodiesCollection.count)
+            copy_indices = range(0 if do_copy_original_bodies else 1, num_copies+1)
+            profile.add('plan', time.perf_counter() - phase_start, copies=num_copies)
+
+            # CULL THE COPIES TOO SMALL TO MATTER
+            # (compound scales below 1 shrink the tail of a pattern below the model tolerance)
+            phase_start = profile.enter('cull')
+            copy_indices, culled_indices = cull_copies(inputs, originalBodiesCollection, net_matrices, copy_indices)
+            culled_status = ''
+            if (len(culled_indices) > 0):
+                culled_status = ', ' + str(len(culled_indices)) + ' smaller copies culled'
+            profile.add('cull', time.perf_counter() - phase_start, copies=len(culled_indices))
+
+            # An exported pattern only exists in its file, so its preview is drawn as graphics as well
+            if (previewRadioButtonGroupSelection == "draw actual bodies as graphics" or inputs.itemById('outputRadioButtonGroup').selectedItem.name == "export mesh file (STL, OBJ, 3MF)"):
+                # DRAW THE COPIES AS CUSTOM GRAPHICS WITHOUT CREATING ANY BODIES
+                # (a pattern too large to draw in full is shown by an even sample of its copies)
+                drawn_indices = graphics.sample_rows(list(originalBodiesCollection), copy_indices, config.MAXIMUM_GRAPHICS_TRIANGLES)
+                with profile.phase('graphics', copies=len(drawn_indices)):
+                    graphics.draw_instances(rootComp, list(originalBodiesCollection), net_matrices, drawn_indices, first_changed_row)
+                if (len(drawn_indices) < len(copy_indices)):
+                    inputs.itemById('preview_status').text = 'showing ' + str(len(drawn_indices)) + ' of ' + str(len(copy_indices)) + ' copies as graphics' + culled_status
+                else:
+                    inputs.itemById('preview_status').text = 'drawing ' + str(len(copy_indices)) + ' copies as graphics' + culled_status
+                futil.log(f'  PREVIEW: drew {len(drawn_indices)} of {len(copy_indices)} copies as graphics, culled {len(culled_indices)}, in {profile.total_seconds:.3f} s')
+                report_profile(profile, len(copy_indices))
+                args.isValidResult = False
+                preview_interference_flag = False
+                return
+
+            outputRadioButtonGroupSelection = get_output_option(inputs, net_matrices)
+
+            # Copies are only built as bodies while they are expected to fit in the time budget
+            budget = preview_budget.PreviewBudget(inputs.itemById('preview_budget').valueOne / 1000.0)
+            build_start = time.perf_counter()
+
+            bodiesCollection, built_indices = build_copies(rootComp, originalBodiesCollection, transform_plan, net_matrices, copy_indices, num_copies, do_expand_fractal, outputRadioButtonGroupSelection, budget, profile)
+
+            copy_cost_model.record(outputRadioButtonGroupSelection, len(built_indices), time.perf_counter() - build_start)
+
+            # DRAW THE COPIES BEYOND THE TIME BUDGET AS GRAPHICS
+            # (copies are built in order, so the rest follow the ones built, and
+            # only as many of them are drawn as the graphics of a preview can hold)
+            remaining_indices = copy_indices[len(built_indices):]
+            drawn_indices = remaining_indices
+            if (len(remaining_indices) > 0):
+                drawn_indices = graphics.sample_rows(list(originalBodiesCollection), remaining_indices, config.MAXIMUM_GRAPHICS_TRIANGLES)
+                with profile.phase('graphics', copies=len(drawn_indices)):
+                    graphics.draw_instances(rootComp, list(originalBodiesCollection), net_matrices, drawn_indices, first_changed_row)
+                if (len(drawn_indices) < len(remaining_indices)):
+                    inputs.itemById('preview_status').text = 'showing ' + str(len(built_indices)) + ' of ' + str(len(copy_indices)) + ' copies as bodies and ' + str(len(drawn_indices)) + ' more as graphics' + culled_status
+                else:
+                    inputs.itemById('preview_status').text = 'showing ' + str(len(built_indices)) + ' of ' + str(len(copy_indices)) + ' copies as bodies, the rest as graphics' + culled_status
             else:
-                bodiesCollection.append(adsk.core.ObjectCollection.create())
-
-            for k in range(num_copies):
-                app.log('copying iteration ' + str(k+1))
-                app.log('  original bodies collection count: ' + str(originalBodiesCollection.count))
-                bodiesCollection.append(adsk.core.ObjectCollection.create())
-
-                for selected_body_index in range(originalBodiesCollection.count):
-                    app.log('    copying body number ' + str(selected_body_index))
-                    # Get the first selected object.
-
-                    body = originalBodiesCollection.item(selected_body_index)
-                    
-                    # Copy the body.
-                    copy = body.copyToComponent(rootComp)
-                    copy.name = body.name + "_" + str(k+1)
-                    app.log('  CREATED BODY: ' + copy.name + ' from original body ' + body.name)
-                    app.log('  selection count: ' + str(selected_body_index))
-
-                    bodiesCollection[k+1].add(copy)
-                    cumulativeBodiesCollection.add(copy)
-                    
-                if (do_scaling_flag == True):
-                    app.log('  SCALING: ' + ' copy ' + str(k+1) + ' body: ' + str(selected_body_index))
-                    scale_equation_radio_button: adsk.core.RadioButtonGroupCommandInput = inputs.itemById('scaleEquationRadioButtonGroup')
-                    scale_uniformly = (scale_equation_radio_button.selectedItem.name == 'scale uniformly')
-                    scale_randomization = inputs.itemById('scale_randomization').valueOne
-                    scale_randomization_x = inputs.itemById('scale_randomization_x').valueOne
-                    scale_randomization_y = inputs.itemById('scale_randomization_y').valueOne
-                    scale_randomization_z = inputs.itemById('scale_randomization_z').valueOne
-                    if (scale_uniformly):
-                        scale_value = eval(inputs.itemById('scale_value').text)
-                        if (scale_value == 0):
-                            app.log("     cannot scale by (" + str(scale_value) + ")")
-                        else:
-                            app.log("     scaling uniformly by (" + str(scale_value) + ")")
-                            scale_transform = adsk.core.Matrix3D.create()
-                            scale_transform.setCell(0, 0, scale_value)
-                            scale_transform.setCell(1, 1, scale_value)
-                            scale_transform.setCell(2, 2, scale_value)
-                    else:
-                    # Set the scale to be non-uniform
-                        scale_value_x = eval(inputs.itemById('scale_value_x').text)
-                        scale_value_y = eval(inputs.itemById('scale_value_y').text)
-                        scale_value_z = eval(inputs.itemById('scale_value_z').text)
-                        if ((scale_value_x == 0) or (scale_value_y == 0) or (scale_value_z == 0)):
-                            app.log("     cannot scale by (" + str(scale_value_x) + ", " + str(scale_value_y) + ", " + str(scale_value_z) + ")")
-                        else:
-                            app.log("     scaling non-uniformly by (" + str(scale_value_x) + ", " + str(scale_value_y) + ", " + str(scale_value_z) + ")")
-                            scale_transform = adsk.core.Matrix3D.create()
-                            scale_transform.setCell(0, 0, scale_value_x)
-                            scale_transform.setCell(1, 1, scale_value_y)
-                            scale_transform.setCell(2, 2, scale_value_z)
-
-                    scaleCompoundRadioButtonGroupSelection = inputs.itemById('scaleCompoundRadioButtonGroup').selectedItem.name
-                    if (scaleCompoundRadioButtonGroupSelection == "constant scale for all bodies"):
-                        apply_scale_transform = scale_transform
-                    elif (scaleCompoundRadioButtonGroupSelection == "compound scale for each copy"):
-                        apply_scale_transform = compound_transform(scale_transform, k+1)
-                    app.log('    with transformation array: ' + str(apply_scale_transform.asArray()))
-                    xScale = apply_scale_transform.getCell(0, 0)
-                    yScale = apply_scale_transform.getCell(1, 1)
-                    zScale = apply_scale_transform.getCell(2, 2)
-                    xScaleRandomization = 1
-                    yScaleRandomization = 1
-                    zScaleRandomization = 1
-                    if (scale_uniformly and (scale_randomization > 0)):
-                        uniformScale = (1 + random.uniform(-1.0, 1.0) * scale_randomization / 100)
-                        xScaleRandomization = uniformScale
-                        yScaleRandomization = uniformScale
-                        zScaleRandomization = uniformScale
-                    elif (not scale_uniformly):
-                        if (scale_randomization_x > 0):
-                            xScaleRandomization = (1 + random.uniform(-1.0, 1.0) * scale_randomization_x / 100)
-                        if (scale_randomization_y > 0):
-                            yScaleRandomization = (1 + random.uniform(-1.0, 1.0) * scale_randomization_y / 100)
-                        if (scale_randomization_z > 0):
-                            zScaleRandomization = (1 + random.uniform(-1.0, 1.0) * scale_randomization_z / 100)
-                    xScale = xScale * xScaleRandomization
-                    yScale = yScale * yScaleRandomization
-                    zScale = zScale * zScaleRandomization
-                    if ((xScale == 1.0) and (yScale == 1.0) and (zScale == 1.0)):
-                        app.log('    which is identity matrix, so not performing matrix transformation')
-                    else:
-                        if (do_apply_transformations_recursively == True):
-                            app.log('    !!!!!!! applying transformations recursively for scaling')
-                            scaleInput = scaleFeats.createInput(cumulativeBodiesCollection, basePt, adsk.core.ValueInput.createByReal(1.0))
-                        else:
-                            scaleInput = scaleFeats.createInput(bodiesCollection[k+1], basePt, adsk.core.ValueInput.createByReal(1.0))
-                        scaleInput.setToNonUniform(adsk.core.ValueInput.createByReal(xScale), adsk.core.ValueInput.createByReal(yScale), adsk.core.ValueInput.createByReal(zScale))
-                        scaleFeats.add(scaleInput)        
-
-                if (do_internal_rotation_flag == True):
-                    app.log('  INTERNALLY ROTATING: ' + ' copy ' + str(k+1) + ' body: ' + str(selected_body_index))
-                    internalRotationRadioButtonGroupSelection = inputs.itemById('internalRotationRadioButtonGroup').selectedItem.name
-                    if (internalRotationRadioButtonGroupSelection == "constant angle for all bodies"):
-                        apply_internal_rotation_transform = internal_rotation_transform
-                    elif (internalRotationRadioButtonGroupSelection == "compound angle for each copy"):
-                        apply_internal_rotation_transform = compound_transform(internal_rotation_transform, k+1)
-
-                    internal_rotation_randomization = inputs.itemById('internal_rotation_randomization').valueOne
-                    if (internal_rotation_randomization > 0):
-                        random_internal_rotation_transform = adsk.core.Matrix3D.create()
-                        random_internal_rotation_transform.setToRotation((math.pi / 180.0) * random.uniform(0,internal_rotation_randomization), get_random_vector(), centerPoint)
-                        apply_internal_rotation_transform.transformBy(random_internal_rotation_transform)
-
-                    app.log('    with transformation array: ' + str(apply_internal_rotation_transform.asArray()))
-                    if (apply_internal_rotation_transform.isEqualTo(adsk.core.Matrix3D.create())):
-                        app.log('    which is identity matrix, so not performing matrix transformation')
-                    else:
-                        if (do_apply_transformations_recursively == True):
-                            app.log('    !!!!!!! applying transformations recursively for internal rotation')
-                            internal_rotateFeatureInput = moveFeats.createInput(cumulativeBodiesCollection, apply_internal_rotation_transform)
-                        else:
-                            internal_rotateFeatureInput = moveFeats.createInput(bodiesCollection[k+1], apply_internal_rotation_transform)
-                        moveFeats.add(internal_rotateFeatureInput)        
-
-
-                if (do_translation_flag == True):
-                    app.log('  TRANSLATING: ' + ' copy ' + str(k+1) + ' body: ' + str(selected_body_index))
-                    translationRadioButtonGroupSelection = inputs.itemById('translationRadioButtonGroup').selectedItem.name
-                    if (translationRadioButtonGroupSelection == "constant distance for all bodies"):
-                        apply_translation_transform = translation_transform
-                    elif (translationRadioButtonGroupSelection == "compound distance for each copy"):
-                        apply_translation_transform = compound_transform(translation_transform, k+1)
-                    elif (translationRadioButtonGroupSelection == "compound distance and scale for each copy"):
-                        apply_translation_transform = compound_translation_scaling(translation_transform, scale_transform, k+1)
-
-                    translation_randomization_x = inputs.itemById('translation_randomization_x').valueOne
-                    translation_randomization_y = inputs.itemById('translation_randomization_y').valueOne
-                    translation_randomization_z = inputs.itemById('translation_randomization_z').valueOne
-                    x_translation = translation_transform.getCell(0,3)
-                    y_translation = translation_transform.getCell(1,3)
-                    z_translation = translation_transform.getCell(2,3)
-                    total_x_translation = apply_translation_transform.getCell(0,3)
-                    total_y_translation = apply_translation_transform.getCell(1,3)
-                    total_z_translation = apply_translation_transform.getCell(2,3)
-                    total_x_translation = total_x_translation + x_translation * translation_randomization_x * random.uniform(-1,1) / 100
-                    total_y_translation = total_y_translation + y_translation * translation_randomization_y * random.uniform(-1,1) / 100
-                    total_z_translation = total_z_translation + z_translation * translation_randomization_z * random.uniform(-1,1) / 100
-                    apply_translation_transform.setCell(0, 3, total_x_translation)
-                    apply_translation_transform.setCell(1, 3, total_y_translation)
-                    apply_translation_transform.setCell(2, 3, total_z_translation)
-    
-                    app.log('    with transformation array: ' + str(apply_translation_transform.asArray()))
-                    if (apply_translation_transform.isEqualTo(adsk.core.Matrix3D.create())):
-                        app.log('    which is identity matrix, so not performing matrix transformation')
-                    else:
-                        if (do_apply_transformations_recursively == True):
-                            app.log('    !!!!!!! applying transformations recursively for translation')
-                            translateFeatureInput = moveFeats.createInput(cumulativeBodiesCollection, apply_translation_transform)
-                        else:
-                            translateFeatureInput = moveFeats.createInput(bodiesCollection[k+1], apply_translation_transform)
-                        moveFeats.add(translateFeatureInput)
-
-                if (do_external_rotation_flag == True):
-                    app.log('  EXTERNALLY ROTATING: ' + ' copy ' + str(k+1) + ' body: ' + str(selected_body_index))
-                    externalRotationRadioButtonGroupSelection = inputs.itemById('externalRotationRadioButtonGroup').selectedItem.name
-                    if (externalRotationRadioButtonGroupSelection == "constant angle for all bodies"):
-                        apply_external_rotation_transform = external_rotation_transform
-                    elif (externalRotationRadioButtonGroupSelection == "compound angle for each copy"):
-                        apply_external_rotation_transform = compound_transform(external_rotation_transform, k+1)
-
-                    external_rotation_randomization = inputs.itemById('external_rotation_randomization').valueOne
-                    if (external_rotation_randomization > 0):
-                        random_external_rotation_transform = adsk.core.Matrix3D.create()
-                        random_external_rotation_transform.setToRotation((math.pi / 180.0) * random.uniform(0,external_rotation_randomization), get_random_vector(), centerPoint)
-                        apply_external_rotation_transform.transformBy(random_external_rotation_transform)
-
-
-                    app.log('    with transformation array: ' + str(apply_external_rotation_transform.asArray()))
-                    if (apply_external_rotation_transform.isEqualTo(adsk.core.Matrix3D.create())):
-                        app.log('    which is identity matrix, so not performing matrix transformation')
-                    else:
-                        if (do_apply_transformations_recursively == True):
-                            app.log('    !!!!!!! applying transformations recursively for external rotation')
-                            external_rotateFeatureInput = moveFeats.createInput(cumulativeBodiesCollection, apply_external_rotation_transform)
-                        else:
-                            external_rotateFeatureInput = moveFeats.createInput(bodiesCollection[k+1], apply_external_rotation_transform)
-                        moveFeats.add(external_rotateFeatureInput)        
+                inputs.itemById('preview_status').text = 'showing all ' + str(len(copy_indices)) + ' copies as bodies' + culled_status
 
             # REMOVE ORIGINAL BODIES
             if (do_remove_original_bodies):
-                for selected_body_index in range(originalBodiesCollection.count):
-                    # delete the selected body.
-                    body = originalBodiesCollection.item(selected_body_index)
-                    app.log('  REMOVING ORIGINAL BODY: ' + body.name)
-                    #body.deleteMe()
-                    removeFeat = removeFeats.add(body)
+                remove_original_bodies(rootComp, originalBodiesCollection, profile)
 
             ## INTERFERENCE CHECK        
-            if (preview_interference_flag):
-                app.log('  CHECKING INTERFERENCES BETWEEN BODIES')
+            if (preview_interference_flag and previewRadioButtonGroupSelection in PROXY_KINDS):
+                # The proxies are a known box or sphere, so the interference of the
+                # whole pattern is decided in closed form from the plan, without
+                # creating or analyzing any interference BRep.
+                futil.debug('  CHECKING INTERFERENCES BETWEEN PROXIES ANALYTICALLY')
+                proxyBody = originalBodiesCollection.item(0)
+                proxyNames = [proxyBody.name + "_" + str(copy_index) for copy_index in copy_indices]
+                proxyMatrices = [net_matrices[copy_index] for copy_index in copy_indices]
+                if (not do_remove_original_bodies):
+                    proxyNames.insert(0, proxyBody.name)
+                    proxyMatrices.insert(0, np.identity(4))
+                with profile.phase('interference', bodies=len(proxyMatrices)):
+                    interferingPairs = interference.interfering_proxy_pairs(proxies.interference_kind(proxy_kind), 1.0, np.array(proxyMatrices) @ proxy_shape)
+                futil.debug('   interference results size: %d', len(interferingPairs))
+
+                if (len(interferingPairs) == 0):
+                    ui.messageBox('There is NO interference between any of the ' + str(len(proxyNames)) + ' bodies')
+                else:
+                    ui.messageBox('\n'.join('There is interference between ' + proxyNames[first] + ' and ' + proxyNames[second] for first, second in interferingPairs))
+
+            elif (preview_interference_flag):
+                futil.debug('  CHECKING INTERFERENCES BETWEEN BODIES')
 
                 allBodiesCollection = adsk.core.ObjectCollection.create()
 
                 if (not do_remove_original_bodies):
                     for body in originalBodiesCollection:
                         allBodiesCollection.add(body)
-                for k in range(num_copies+1):
-                    for body in bodiesCollection[k]:
-                        app.log('   adding entity to allBodiesCollection with name:' + str(body.name))                       
+                for copy_bodies in bodiesCollection.values():
+                    for body in copy_bodies:
                         allBodiesCollection.add(body)
-                
-                app.log('   for ' + str(allBodiesCollection.count) + ' bodies')
-
-                # Set the design type to DirectDesignType (for non-parametric modelling)        
-                design.designType = adsk.fusion.DesignTypes.DirectDesignType
 
-                # Create the interferenceInput object and run the analysis.
-                interferenceInput = design.createInterferenceInput(allBodiesCollection)
-                interferenceInput.areCoincidentFacesIncluded = False
-                results = design.analyzeInterference(interferenceInput)    
-                app.log('   interference results size: ' + str(results.count))
-
-                if (results.count == 0):
+                # Only bodies whose bounding boxes overlap can interfere, so only
+                # those pairs are passed on to the exact (and expensive) check.
+                allBodies = list(allBodiesCollection)
+                futil.debug('   for %d bodies', len(allBodies))
+                with profile.phase('interference', bodies=len(allBodies)):
+                    candidatePairs = interference.candidate_pairs(*geometry.bounding_boxes(allBodies))
+                    futil.debug('   %d pairs with overlapping bounding boxes', len(candidatePairs))
+                    results = geometry.analyze_interference_pairs(design, allBodies, candidatePairs)
+                profile.count('interference', pairs=len(candidatePairs))
+                futil.debug('   interference results size: %d', len(results))
+
+                if (len(results) == 0):
                     ui.messageBox('There is NO interference between any of the ' + str(allBodiesCollection.count) + ' bodies')
                 else:
-                    # Create bodies for every intersection.  This is not supported in Parametric designs.
-                    interferenceBodies = results.createBodies(True)
-                    
-                    # Activate the Intersections component created by Fusion that stores the interference bodies
-                    occurrences = rootComp.occurrences
-                    app.log('   number of occurrences: ' + str(occurrences.count))
-
-#                    if (occurrences.count == 0):
-#                        occurrences = new 
+                    # Set the design type to DirectDesignType (for non-parametric modelling),
+                    # since creating the interference bodies is not supported in Parametric designs.
+                    design.designType = adsk.fusion.DesignTypes.DirectDesignType
 
-                    resultsOccurrence = occurrences.item(occurrences.count-1)
+                    # Collect the interference bodies in one component and activate it
+                    resultsOccurrence = rootComp.occurrences.addNewComponent(adsk.core.Matrix3D.create())
+                    resultsOccurrence.component.name = 'Interference'
                     resultsOccurrence.activate()
                     
                     # Fit the view        
@@ -721,70 +647,544 @@ def command_preview(args: adsk.core.CommandEventArgs):
                     viewport.fit()
                     
                     # Report the results
-                    bod = 0        
+                    messages = []
                     for res in results:
-                        comp1Name = res.entityOne.parentComponent.name
-                        comp2Name = res.entityTwo.parentComponent.name
+                        body1Name = res.entityOne.name
+                        body2Name = res.entityTwo.name
                         bodyVolume = str(round(res.interferenceBody.volume, 2))
-                        interferenceBodies.item(bod).name = 'Interference between ' + comp1Name + ' & ' + comp2Name
-                        ui.messageBox('There is interference between ' + comp1Name + ' and ' + comp2Name + ' with a volume of ' + bodyVolume + ' cubic centimeters')
-                        bod += 1
+                        interferenceBody = resultsOccurrence.component.bRepBodies.add(res.interferenceBody)
+                        interferenceBody.name = 'Interference between ' + body1Name + ' & ' + body2Name
+                        messages.append('There is interference between ' + body1Name + ' and ' + body2Name + ' with a volume of ' + bodyVolume + ' cubic centimeters')
+                    ui.messageBox('\n'.join(messages))
 
-                # Set that the preview results can be used as the execute result.
-                design.designType = adsk.fusion.DesignTypes.ParametricDesignType
+                    # Set that the preview results can be used as the execute result.
+                    design.designType = adsk.fusion.DesignTypes.ParametricDesignType
 
             # CREATE COMPONENT FOR NEW BODY
-            if (do_create_new_component_for_each_body == True):
-                for k in range(num_copies+1):
-                    for new_body in bodiesCollection[k]:
-                        new_component_body = new_body.createComponent()
-                        new_component_body.parentComponent.name = new_body.name
+            # (occurrence copies already live in their own component)
+            if (do_create_new_component_for_each_body == True and outputRadioButtonGroupSelection != "component occurrences for each copy"):
+                create_components(rootComp, inputs, originalBodiesCollection, bodiesCollection, copy_generations, profile)
                         
-            args.isValidResult = True
+            futil.log(f'  PREVIEW: built {len(built_indices)} copies with {outputRadioButtonGroupSelection}, drew {len(drawn_indices)} of the other {len(remaining_indices)} as graphics, culled {len(culled_indices)}, in {profile.total_seconds:.3f} s')
+            report_profile(profile, len(copy_indices))
+
+            # A preview of proxy bodies or cut short by the time budget is not the
+            # result of the command, so command_execute builds the result instead.
+            args.isValidResult = (previewRadioButtonGroupSelection == "use actual bodies" and len(remaining_indices) == 0)
+        else:
+            report_profile(profile)
     preview_interference_flag = False
 
-def get_random_vector():
-    x = random.uniform(-1.0, 1.0) 
-    y = random.uniform(-1.0, 1.0) 
-    z = random.uniform(-1.0, 1.0) 
-    if ((x**2 + y**2 + z**2) > 1):
-        return get_random_vector()
+# This function will build the copies with the chosen output option, as many as the budget allows, and return the bodies of each copy built by its copy index and the indices of the copies built
+def build_copies(rootComp: adsk.fusion.Component, originalBodiesCollection: adsk.core.ObjectCollection, transform_plan: plan.TransformPlan, net_matrices: np.ndarray, copy_indices: list, num_copies: int, do_expand_fractal: bool, outputRadioButtonGroupSelection: str, budget: preview_budget.PreviewBudget, profile: profiler.Profile):
+    # Only the copies that are built have bodies, so a large pattern cut short
+    # by the budget or culled does not cost an empty collection per copy.
+    bodiesCollection = {}
+    built_indices = []
+    rigid_matrices = transform_plan.rigid_matrices()
+
+    if (outputRadioButtonGroupSelection == "single base feature for all copies"):
+        # BUILD ALL COPIES AS TRANSIENT BODIES IN ONE BASE FEATURE
+        built_indices = copy_indices[:copy_cost_model.affordable_copies(outputRadioButtonGroupSelection, budget, len(copy_indices))]
+        with profile.phase('base feature', copies=len(built_indices), bodies=len(built_indices) * originalBodiesCollection.count):
+            created_bodies = geometry.create_base_feature_copies(rootComp, list(originalBodiesCollection), net_matrices, built_indices)
+        for copy_index, copy_bodies in zip(built_indices, created_bodies):
+            bodiesCollection[copy_index] = adsk.core.ObjectCollection.create()
+            for new_body in copy_bodies:
+                bodiesCollection[copy_index].add(new_body)
+    elif (outputRadioButtonGroupSelection == "component occurrences for each copy"):
+        # PLACE ONE OCCURRENCE OF A SHARED COMPONENT PER COPY
+        built_indices = copy_indices[:copy_cost_model.affordable_copies(outputRadioButtonGroupSelection, budget, len(copy_indices))]
+        with profile.phase('occurrences', copies=len(built_indices)):
+            created_occurrences = geometry.create_occurrence_copies(rootComp, list(originalBodiesCollection), net_matrices, built_indices)
+        for copy_index, occurrence in zip(built_indices, created_occurrences):
+            bodiesCollection[copy_index] = adsk.core.ObjectCollection.create()
+            for new_body in occurrence.bRepBodies:
+                bodiesCollection[copy_index].add(new_body)
     else:
-        return adsk.core.Vector3D.create(x, y, z)
-
-# This function will call a transform on itself multiple times
-def compound_transform(transform: adsk.core.Matrix3D, number_of_times:int):
-    output_transform = adsk.core.Matrix3D.create()
-    for i in range(number_of_times):
-        output_transform.transformBy(transform)
-    return output_transform
-
-# This function will calculate the overall translation matrix based on compounding multiple scaled translations
-def compound_translation_scaling(transform_translation: adsk.core.Matrix3D, transform_scaling: adsk.core.Matrix3D, number_of_times:int):
-    #app.log ("   compound translation scaling " + str(number_of_times) + " with translation matrix " + str(transform_translation.asArray()) + " and scaling matrix " + str(transform_scaling.asArray()))
-    output_transform = adsk.core.Matrix3D.create()
-    x_translation = transform_translation.getCell(0,3)
-    y_translation = transform_translation.getCell(1,3)
-    z_translation = transform_translation.getCell(2,3)
-    x_scaling = transform_scaling.getCell(0,0)
-    y_scaling = transform_scaling.getCell(1,1)
-    z_scaling = transform_scaling.getCell(2,2)
-    if (x_scaling == 1):
-        output_x_translation = x_translation * number_of_times
+        # Each copy is scaled and moved once, by its net transform, rather than
+        # moving every earlier copy again in each recursive iteration.
+        if (do_expand_fractal):
+            net_scales_and_moves = plan.split_scales_and_moves(net_matrices)
+        else:
+            net_scales_and_moves = transform_plan.net_scales_and_moves()
+        transform_each_copy_once = (net_scales_and_moves is not None)
+        if (do_expand_fractal and not transform_each_copy_once):
+            # Without iterations to replay, sheared fractal copies are only drawn as graphics.
+            futil.log('  non-uniform scaling shears the fractal copies, which cannot be built as parametric features')
+            return bodiesCollection, built_indices
+
+        # Create centerpoint
+        sketches = rootComp.sketches
+        sketch = sketches.add(rootComp.xZConstructionPlane)
+        basePt = sketch.sketchPoints.item(0)
+
+        if (transform_each_copy_once):
+            net_scales, net_moves = net_scales_and_moves
+        else:
+            futil.log('  recursive non-uniform scaling shears the copies, applying every iteration to all earlier copies')
+            cumulativeBodiesCollection = adsk.core.ObjectCollection.create()
+
+        # The selection does not change while the copies are built, so it is counted once.
+        num_original_bodies = originalBodiesCollection.count
+
+        # COPY ORIGINAL BODIES
+        # copy over original bodies and keep as copies
+        if (0 in copy_indices):
+            bodiesCollection[0] = adsk.core.ObjectCollection.create()
+            for selected_body_index in range(num_original_bodies):
+                futil.debug('copying iteration %d', 0)
+                futil.debug('    copying body number %d', selected_body_index)
+                # Get the first selected object.
+                body = originalBodiesCollection.item(selected_body_index)
+
+                # Copy the body.
+                with profile.phase('copyToComponent', bodies=1):
+                    copy = body.copyToComponent(rootComp)
+                copy_name = body.name + "_" + str(0)
+                copy.name = copy_name
+                futil.debug('  CREATED BODY: %s', copy_name)
+
+                # Add body to collection
+                bodiesCollection[0].add(copy)
+                if (not transform_each_copy_once):
+                    cumulativeBodiesCollection.add(copy)
+            if (transform_each_copy_once):
+                scale_and_move_bodies(rootComp, bodiesCollection[0], basePt, net_scales[0], net_moves[0], 'copy 0', profile)
+            built_indices.append(0)
+
+        if (not transform_each_copy_once and budget.is_limited):
+            # Every iteration moves all earlier copies too, so a pattern cut
+            # short would not show earlier copies where they end up.
+            futil.debug('  preview time budget is not applied when transformations are applied recursively')
+
+        # A range answers membership without holding its indices, culled copies are an array.
+        kept_indices = copy_indices if isinstance(copy_indices, range) else set(copy_indices)
+        for k in range(num_copies):
+            if (transform_each_copy_once and not budget.allows_another(len(built_indices))):
+                futil.debug('  stopping after %d copies to stay within the preview time budget', len(built_indices))
+                break
+            is_culled = (k+1) not in kept_indices
+            if (is_culled and transform_each_copy_once):
+                continue
+            bodiesCollection[k+1] = adsk.core.ObjectCollection.create()
+            futil.debug('copying iteration %d', k+1)
+
+            if (not is_culled):
+                for selected_body_index in range(num_original_bodies):
+                    futil.debug('    copying body number %d', selected_body_index)
+                    # Get the first selected object.
+
+                    body = originalBodiesCollection.item(selected_body_index)
+
+                    # Copy the body.
+                    with profile.phase('copyToComponent', bodies=1):
+                        copy = body.copyToComponent(rootComp)
+                    copy_name = body.name + "_" + str(k+1)
+                    copy.name = copy_name
+                    futil.debug('  CREATED BODY: %s', copy_name)
+                    futil.debug('  selection count: %d', selected_body_index)
+
+                    bodiesCollection[k+1].add(copy)
+                    if (not transform_each_copy_once):
+                        cumulativeBodiesCollection.add(copy)
+
+            if (transform_each_copy_once):
+                scale_and_move_bodies(rootComp, bodiesCollection[k+1], basePt, net_scales[k+1], net_moves[k+1], 'copy ' + str(k+1), profile)
+            elif (cumulativeBodiesCollection.count > 0):
+                # A culled copy is not created, but its iteration still moves the earlier copies.
+                scale_and_move_bodies(rootComp, cumulativeBodiesCollection, basePt, transform_plan.scales[k+1], rigid_matrices[k+1], 'copies 0 to ' + str(k+1), profile)
+            if (not is_culled):
+                built_indices.append(k+1)
+    return bodiesCollection, built_indices
+
+# This function will return the bodies selected in the dialog
+def get_selected_bodies() -> adsk.core.ObjectCollection:
+    selection = ui.activeSelections
+    bodies = adsk.core.ObjectCollection.create()
+    for selected_body_index in range(selection.count):
+        # Get the first selected object.
+        selectedObject = selection.item(selected_body_index).entity
+
+        # Cast the selected object to a body.
+        body = adsk.fusion.BRepBody.cast(selectedObject)
+
+        # Check that the selected object is a body.
+        if not body:
+            futil.log('WARNING: selected object is not a body. skipping...  ', adsk.core.LogLevels.WarningLogLevel)
+            ui.messageBox('The selected object is not a body', 'Not a Body')
+        else:
+            bodies.add(body)
+            if (config.VERBOSE):
+                futil.debug('  USING %s', body.name)
+    return bodies
+
+# This function will return the shape of a proxy sized from the bounding box of the selected bodies, or of the default size without a selection
+def get_proxy_shape(proxy_kind: str) -> np.ndarray:
+    selected_bodies = list(get_selected_bodies())
+    if (len(selected_bodies) == 0):
+        return proxies.proxy_shape(proxy_kind)
+    minimums, maximums = geometry.bounding_boxes(selected_bodies)
+    return proxies.proxy_shape(proxy_kind, minimums.min(axis=0), maximums.max(axis=0))
+
+# This function will compute the net transform and the generation of every copy, expanding the fractal if it is enabled
+def get_copy_matrices(inputs: adsk.core.CommandInputs, num_bodies: int):
+    # Reusing whatever did not change since the last preview, which also keeps
+    # its seeded random draws, so the result is the pattern the preview showed.
+    transform_plan, first_changed_row = plan_cache.get(get_plan_parameters(inputs, num_bodies))
+    num_copies = transform_plan.num_copies
+    if (inputs.itemById('replay plan').value):
+        stored = read_saved_plan(inputs)
+        if (stored is not None):
+            # A replayed plan, like a fractal, only has the net transform of every copy.
+            return transform_plan, stored.matrices, stored.num_instances - 1, 0, True, stored.generations()
+    do_expand_fractal = inputs.itemById('fractal').isEnabledCheckBoxChecked
+    if (do_expand_fractal):
+        # The copies of the plan are the maps of the fractal, and the leaves of
+        # its expansion take the place of the copies.
+        net_matrices, copy_generations = expand_fractal(transform_plan, **get_fractal_settings(inputs))
+        num_copies = len(net_matrices) - 1
+        first_changed_row = 0
+    else:
+        # Every copy of a pattern is an iteration, and so a generation, of its own.
+        net_matrices = transform_plan.net_matrices()
+        copy_generations = np.arange(num_copies+1)
+    return transform_plan, net_matrices, num_copies, first_changed_row, do_expand_fractal, copy_generations
+
+# This function will return the fractal settings of the dialog, as the keyword arguments of expand_fractal
+def get_fractal_settings(inputs: adsk.core.CommandInputs) -> dict:
+    return {
+        'depth': inputs.itemById('fractal_depth').valueOne,
+        'minimum_scale': get_constant_value(inputs, 'fractal_minimum_scale', default=0.0),
+        'maximum_instances': inputs.itemById('fractal_maximum_instances').value,
+    }
+
+# This function will return the key a plan is stored under: its parameters and, for a fractal, the fractal settings
+def get_plan_key(inputs: adsk.core.CommandInputs, transform_plan: plan.TransformPlan) -> dict:
+    if (not inputs.itemById('fractal').isEnabledCheckBoxChecked):
+        return plan_store.plan_key(transform_plan.parameters)
+    return plan_store.plan_key(transform_plan.parameters, **{'fractal_' + name: value for name, value in get_fractal_settings(inputs).items()})
+
+# This function will return the net matrices and generations of a fractal's copies, row 0 included, replaying a stored expansion when there is one
+def expand_fractal(transform_plan: plan.TransformPlan, depth: int, minimum_scale: float, maximum_instances: int):
+    maps = transform_plan.stage_matrices()[1:]
+    distinct_maps = fractal.distinct_maps(maps)
+    if (len(distinct_maps) < len(maps)):
+        futil.log(f'  {len(maps) - len(distinct_maps)} of the {len(maps)} fractal maps repeat another map and would only stack copies on top of each other, so they are left out.  A compound mode or an expression of k gives each map its own transform.', adsk.core.LogLevels.WarningLogLevel)
+        maps = distinct_maps
+    key = plan_store.plan_key(transform_plan.parameters, fractal_depth=depth, fractal_minimum_scale=minimum_scale, fractal_maximum_instances=maximum_instances)
+    if (config.PLAN_FOLDER):
+        stored = plan_store.load(config.PLAN_FOLDER, key)
+        if (stored is not None):
+            futil.debug('  REPLAYING STORED FRACTAL: %d copies', stored.num_instances - 1)
+            return stored.matrices, stored.generations()
+
+    # Without a minimum scale every leaf is known up front, so the leaves are
+    # streamed to disk and mapped back instead of held in memory, which also
+    # lifts the limit of an expansion in memory.
+    do_stream = bool(config.PLAN_FOLDER) and minimum_scale <= 0
+    generations = fractal.full_depth(len(maps), depth, maximum_instances, config.MAXIMUM_STORED_INSTANCES if do_stream else fractal.MAXIMUM_INSTANCES)
+    num_leaves = len(maps) ** generations
+    try:
+        if (do_stream and num_leaves + 1 >= config.PLAN_STORE_MINIMUM_INSTANCES):
+            generation_counts = [1] + [0] * generations
+            generation_counts[generations] += num_leaves
+            chunks = [np.identity(4)[None]]
+            stored = plan_store.save_chunks(config.PLAN_FOLDER, key, num_leaves + 1, itertools.chain(chunks, fractal.leaf_chunks(maps, generations)), generation_counts)
+            plan_store.prune(config.PLAN_FOLDER, config.MAXIMUM_STORED_PLANS)
+            futil.debug('  EXPANDED FRACTAL TO DISK: %d copies over %d generations', num_leaves, generations)
+            return stored.matrices, stored.generations()
+    except (OSError, plan_store.PlanStoreError) as error:
+        futil.log(f'  could not store the fractal, expanding it in memory: {error}', adsk.core.LogLevels.WarningLogLevel)
+
+    expansion = fractal.expand(maps, depth, minimum_scale, maximum_instances)
+    futil.debug('  EXPANDED FRACTAL: %d copies over %d generations, %d pruned below the minimum scale', expansion.num_leaves, expansion.depth, expansion.pruned)
+    net_matrices = np.concatenate([np.identity(4)[None], expansion.matrices])
+    copy_generations = np.concatenate([[0], expansion.generations])
+    if (config.PLAN_FOLDER and len(net_matrices) >= config.PLAN_STORE_MINIMUM_INSTANCES):
+        try:
+            plan_store.save(config.PLAN_FOLDER, key, net_matrices, np.bincount(copy_generations))
+            plan_store.prune(config.PLAN_FOLDER, config.MAXIMUM_STORED_PLANS)
+        except (OSError, plan_store.PlanStoreError) as error:
+            futil.log(f'  could not store the fractal: {error}', adsk.core.LogLevels.WarningLogLevel)
+    return net_matrices, copy_generations
+
+# This function will read the plan of the plan_file input, or return None with a warning if it cannot be read
+def read_saved_plan(inputs: adsk.core.CommandInputs):
+    path = os.path.expanduser(inputs.itemById('plan_file').text.strip())
+    try:
+        stored = plan_store.read(path)
+    except (OSError, plan_store.PlanStoreError) as error:
+        futil.log(f'  cannot replay the plan {path}, computing the copies instead: {error}', adsk.core.LogLevels.WarningLogLevel)
+        return None
+    if (stored.num_instances == 0):
+        futil.log(f'  the plan {path} has no copies, computing the copies instead', adsk.core.LogLevels.WarningLogLevel)
+        return None
+    futil.debug('  REPLAYING SAVED PLAN: %d copies from %s', stored.num_instances - 1, path)
+    return stored
+
+# This function will write the transform of every copy of the current inputs to the plan_file input, a chunk at a time
+def save_plan(inputs: adsk.core.CommandInputs):
+    path = os.path.expanduser(inputs.itemById('plan_file').text.strip())
+    if (inputs.itemById('replay plan').value):
+        # The replayed plan is mapped from the file it would be saved to.
+        ui.messageBox('The plan is replayed from ' + path + ' already.  Turn off replaying it to save a new plan.')
+        return
+    transform_plan, net_matrices, num_copies, first_changed_row, do_expand_fractal, copy_generations = get_copy_matrices(inputs, max(get_selected_bodies().count, 1))
+    try:
+        plan_store.write(path, get_plan_key(inputs, transform_plan), len(net_matrices), plan_store.row_chunks(net_matrices), np.bincount(copy_generations))
+    except (OSError, plan_store.PlanStoreError) as error:
+        futil.log(f'  could not save the plan to {path}: {error}', adsk.core.LogLevels.ErrorLogLevel)
+        ui.messageBox('Could not save the plan to ' + path + '\n' + str(error))
+        return
+    futil.log(f'  SAVED PLAN: {num_copies} copies to {path}')
+
+# This function will split the copies into those at least the minimum copy size and those culled below it
+def cull_copies(inputs: adsk.core.CommandInputs, originalBodiesCollection: adsk.core.ObjectCollection, net_matrices: np.ndarray, copy_indices: range):
+    minimum_copy_size = inputs.itemById('minimum_copy_size').value
+    if (minimum_copy_size <= 0):
+        return copy_indices, []
+    source_minimums, source_maximums = geometry.bounding_boxes(list(originalBodiesCollection))
+    source_size = float(np.linalg.norm(source_maximums.max(axis=0) - source_minimums.min(axis=0)))
+    # A chunk at a time, so a memory mapped plan is never read into memory as a whole.
+    kept_chunks = []
+    culled_chunks = []
+    for start, matrices in zip(itertools.count(0, plan_store.CHUNK_ROWS), plan_store.row_chunks(net_matrices, copy_indices)):
+        chunk_indices = np.asarray(copy_indices[start:start + len(matrices)], dtype=np.int64)
+        is_kept = plan.copy_sizes(matrices, source_size) >= minimum_copy_size
+        kept_chunks.append(chunk_indices[is_kept])
+        culled_chunks.append(chunk_indices[~is_kept])
+    culled_indices = np.concatenate([np.empty(0, dtype=np.int64)] + culled_chunks)
+    if (len(culled_indices) == 0):
+        return copy_indices, culled_indices
+    futil.debug('  CULLED %d copies smaller than %s cm', len(culled_indices), minimum_copy_size)
+    return np.concatenate(kept_chunks), culled_indices
+
+# This function will return the chosen output option, or parametric features when the transforms cannot be built with it
+def get_output_option(inputs: adsk.core.CommandInputs, net_matrices: np.ndarray) -> str:
+    outputRadioButtonGroupSelection = inputs.itemById('outputRadioButtonGroup').selectedItem.name
+    if (outputRadioButtonGroupSelection == "single base feature for all copies" and not geometry.supports_base_feature(net_matrices)):
+        futil.log('  non-uniform scaling cannot be applied to transient bodies, using parametric features instead')
+        outputRadioButtonGroupSelection = "parametric features for each copy"
+    if (outputRadioButtonGroupSelection == "component occurrences for each copy" and not geometry.supports_occurrences(net_matrices)):
+        futil.log('  scaled copies cannot share one component, using parametric features instead')
+        outputRadioButtonGroupSelection = "parametric features for each copy"
+    return outputRadioButtonGroupSelection
+
+# This function will write the copies to the mesh file of the export_file input, tessellating each selected body once
+def export_mesh(inputs: adsk.core.CommandInputs, originalBodiesCollection: adsk.core.ObjectCollection, net_matrices: np.ndarray, copy_indices: list, profile: profiler.Profile):
+    path = os.path.expanduser(inputs.itemById('export_file').text.strip())
+    originalBodies = list(originalBodiesCollection)
+    with profile.phase('tessellate', bodies=len(originalBodies)):
+        body_meshes = [graphics.get_mesh(body, adsk.fusion.TriangleMeshQualityOptions.NormalQualityTriangleMesh) for body in originalBodies]
+    try:
+        with profile.phase('export', copies=len(copy_indices)):
+            num_triangles = mesh_export.export(path, body_meshes, [body.name for body in originalBodies], net_matrices, copy_indices)
+    except (OSError, ValueError) as error:
+        futil.log(f'  EXPORT: could not write {path}: {error}', adsk.core.LogLevels.ErrorLogLevel)
+        ui.messageBox('Could not export the copies to ' + path + '\n' + str(error))
+        return
+    futil.log(f'  EXPORT: wrote {len(copy_indices)} copies, {num_triangles} triangles, to {path} in {profile.total_seconds:.3f} s')
+
+# This function will remove the original bodies with remove features
+def remove_original_bodies(rootComp: adsk.fusion.Component, originalBodiesCollection: adsk.core.ObjectCollection, profile: profiler.Profile):
+    removeFeats = rootComp.features.removeFeatures
+    futil.debug('  REMOVING %d ORIGINAL BODIES', originalBodiesCollection.count)
+    for body in originalBodiesCollection:
+        with profile.phase('removeFeats.add', features=1):
+            removeFeats.add(body)
+
+# This function will move the copied bodies into new components, grouped by copy, source body or generation, or one per body
+def create_components(rootComp: adsk.fusion.Component, inputs: adsk.core.CommandInputs, originalBodiesCollection: adsk.core.ObjectCollection, bodiesCollection: dict, copy_generations: np.ndarray, profile: profiler.Profile):
+    grouping = inputs.itemById('componentRadioButtonGroup').selectedItem.name
+    if (grouping == "one component for each body"):
+        for copy_bodies in bodiesCollection.values():
+            for new_body in copy_bodies:
+                with profile.phase('createComponent', components=1):
+                    new_component_body = new_body.createComponent()
+                new_component_body.parentComponent.name = new_body.name
+        return
+
+    # Every backend creates the bodies of a copy in the order of the original bodies.
+    # Groups are keyed by index, since selected bodies can share a name.
+    source_names = [body.name for body in originalBodiesCollection]
+    groups = {}
+    labels = {}
+    for copy_index, copy_bodies in bodiesCollection.items():
+        for body_index, new_body in enumerate(copy_bodies):
+            if (grouping == "one component for each source body"):
+                key = body_index
+                labels[key] = source_names[body_index] + ' copies'
+            elif (grouping == "one component for each generation"):
+                key = int(copy_generations[copy_index])
+                labels[key] = source_names[0] + ' generation ' + str(key)
+            else:
+                key = copy_index
+                labels[key] = source_names[0] + ' copy ' + str(copy_index)
+            groups.setdefault(key, []).append(new_body)
+    names = unique_names([labels[key] for key in groups])
+    with profile.phase('createComponent', components=len(groups), bodies=sum(len(bodies) for bodies in groups.values())):
+        geometry.move_bodies_to_new_components(rootComp, list(zip(names, groups.values())))
+
+# This function will number the repeats of a name, so "Body1 copies" twice becomes "Body1 copies" and "Body1 copies (2)"
+def unique_names(names: list) -> list:
+    counts = {}
+    unique = []
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+        unique.append(name if counts[name] == 1 else name + ' (' + str(counts[name]) + ')')
+    return unique
+
+# This function will scale bodies about the base point and then move them, skipping whichever of the two does nothing
+def scale_and_move_bodies(rootComp: adsk.fusion.Component, bodies: adsk.core.ObjectCollection, basePt: adsk.fusion.SketchPoint, scales, move_matrix, label: str, profile: profiler.Profile):
+    xScale, yScale, zScale = (float(value) for value in scales)
+    num_bodies = bodies.count
+    futil.debug('  SCALING: %s by (%s, %s, %s)', label, xScale, yScale, zScale)
+    if (plan.is_identity(scales)):
+        futil.debug('    which is identity matrix, so not performing matrix transformation')
     else:
-        output_x_translation = x_translation * (x_scaling**(number_of_times) - 1)/ (x_scaling -1)
-    if (y_scaling == 1):
-        output_y_translation = y_translation * number_of_times
+        with profile.phase('scaleFeats.add', features=1, bodies=num_bodies):
+            scaleFeats = rootComp.features.scaleFeatures
+            scaleInput = scaleFeats.createInput(bodies, basePt, adsk.core.ValueInput.createByReal(1.0))
+            scaleInput.setToNonUniform(adsk.core.ValueInput.createByReal(xScale), adsk.core.ValueInput.createByReal(yScale), adsk.core.ValueInput.createByReal(zScale))
+            scaleFeats.add(scaleInput)
+
+    # Internal rotation, translation and external rotation are all rigid,
+    # so they are applied together with a single move feature.
+    futil.debug('  MOVING: %s', label)
+    if (plan.is_identity(move_matrix)):
+        futil.debug('    which is identity matrix, so not performing matrix transformation')
     else:
-        output_y_translation = y_translation * (y_scaling**(number_of_times) - 1)/ (y_scaling -1)
-    if (z_scaling == 1):
-        output_z_translation = z_translation * number_of_times
+        with profile.phase('moveFeats.add', features=1, bodies=num_bodies):
+            moveFeats = rootComp.features.moveFeatures
+            moveFeatureInput = moveFeats.createInput(bodies, geometry.to_matrix3d(move_matrix))
+            moveFeats.add(moveFeatureInput)
+
+# This function will count the Fusion API calls of a command invocation by phase, if config.TRACE_API_CALLS is set
+def start_api_trace(profile: profiler.Profile):
+    if (config.TRACE_API_CALLS):
+        api_trace.start(api_trace.ApiTrace(profile.name, profile), [adsk.core, adsk.fusion])
+
+# This function will write the time spent in each phase of a command invocation (and its API calls, if traced) to the Text Command window and to JSON files
+def report_profile(profile: profiler.Profile, num_copies: int = 0):
+    profile.finish()
+    trace = api_trace.stop()
+    for line in profile.report_lines():
+        futil.log('  ' + line)
+    write_report(profile.name + '_profile.json', profile.to_dict())
+    if (trace is not None):
+        for line in trace.report_lines(num_copies):
+            futil.log('  ' + line)
+        write_report(profile.name + '_api_calls.json', trace.to_dict(num_copies))
+        if (trace.is_over_budget(num_copies, config.API_CALLS_PER_COPY_BUDGET)):
+            futil.log(f'  {profile.name} made {trace.calls_per_copy(num_copies):.1f} API calls per copy, more than the budget of {config.API_CALLS_PER_COPY_BUDGET}', adsk.core.LogLevels.WarningLogLevel)
+
+def write_report(file_name: str, report: dict):
+    if (config.PROFILE_FOLDER):
+        path = os.path.join(config.PROFILE_FOLDER, file_name)
+        try:
+            os.makedirs(config.PROFILE_FOLDER, exist_ok=True)
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2)
+        except OSError:
+            futil.log('  could not write the report to ' + path, adsk.core.LogLevels.WarningLogLevel)
+
+# This function will read the transformation inputs of the dialog into the parameters of a transform plan
+def get_plan_parameters(inputs: adsk.core.CommandInputs, num_bodies: int) -> plan.PlanParameters:
+    # In fractal mode the copies of the plan are the maps of the fractal, which are never compounded.
+    if (inputs.itemById('fractal').isEnabledCheckBoxChecked):
+        num_copies = inputs.itemById('fractal_num_maps').valueOne
+        apply_recursively = False
     else:
-        output_z_translation = z_translation * (z_scaling**(number_of_times) - 1)/ (z_scaling -1)
-    output_transform.setCell(0, 3, output_x_translation)
-    output_transform.setCell(1, 3, output_y_translation)
-    output_transform.setCell(2, 3, output_z_translation)
-    return output_transform
+        num_copies = inputs.itemById('num_copies').valueOne
+        apply_recursively = inputs.itemById('apply transformations recursively').value
+
+    scale_uniformly = (inputs.itemById('scaleEquationRadioButtonGroup').selectedItem.name == 'scale uniformly')
+    if (scale_uniformly):
+        scale_value = get_expression_value(inputs, 'scale_value', num_copies)
+        scale_values = (scale_value, scale_value, scale_value)
+        scale_randomization = inputs.itemById('scale_randomization').valueOne
+        scale_randomizations = (scale_randomization, scale_randomization, scale_randomization)
+    else:
+        scale_values = (get_expression_value(inputs, 'scale_value_x', num_copies),
+                        get_expression_value(inputs, 'scale_value_y', num_copies),
+                        get_expression_value(inputs, 'scale_value_z', num_copies))
+        scale_randomizations = (inputs.itemById('scale_randomization_x').valueOne,
+                                inputs.itemById('scale_randomization_y').valueOne,
+                                inputs.itemById('scale_randomization_z').valueOne)
+    if (0 in scale_values):
+        futil.log('     cannot scale by ' + str(scale_values), adsk.core.LogLevels.WarningLogLevel)
+
+    translation_modes = {
+        'constant distance for all bodies': plan.CONSTANT,
+        'compound distance for each copy': plan.COMPOUND,
+        'compound distance and scale for each copy': plan.COMPOUND_SCALE,
+    }
+
+    return plan.PlanParameters(
+        num_copies=num_copies,
+        num_bodies=num_bodies,
+        apply_recursively=apply_recursively,
+        seed=inputs.itemById('random_seed').value,
+        do_scaling=inputs.itemById('scale').isEnabledCheckBoxChecked,
+        scale_mode=plan.CONSTANT if inputs.itemById('scaleCompoundRadioButtonGroup').selectedItem.name == 'constant scale for all bodies' else plan.COMPOUND,
+        scale_uniformly=scale_uniformly,
+        scale_values=scale_values,
+        scale_randomization=scale_randomizations,
+        do_internal_rotation=inputs.itemById('internal rotation').isEnabledCheckBoxChecked,
+        internal_rotation_mode=get_rotation_mode(inputs.itemById('internalRotationRadioButtonGroup')),
+        internal_rotation=tuple(internal_rotation_transform.asArray()),
+        internal_rotation_randomization=inputs.itemById('internal_rotation_randomization').valueOne,
+        internal_rotation_angle=get_optional_expression_value(inputs, 'internal_rotation_angle', num_copies),
+        do_translation=inputs.itemById('translation').isEnabledCheckBoxChecked,
+        translation_mode=translation_modes[inputs.itemById('translationRadioButtonGroup').selectedItem.name],
+        translation=tuple(translation_transform.asArray()),
+        translation_randomization=(inputs.itemById('translation_randomization_x').valueOne,
+                                   inputs.itemById('translation_randomization_y').valueOne,
+                                   inputs.itemById('translation_randomization_z').valueOne),
+        translation_offsets=(get_optional_expression_value(inputs, 'translation_x', num_copies),
+                             get_optional_expression_value(inputs, 'translation_y', num_copies),
+                             get_optional_expression_value(inputs, 'translation_z', num_copies)),
+        do_external_rotation=inputs.itemById('external rotation').isEnabledCheckBoxChecked,
+        external_rotation_mode=get_rotation_mode(inputs.itemById('externalRotationRadioButtonGroup')),
+        external_rotation=tuple(external_rotation_transform.asArray()),
+        external_rotation_randomization=inputs.itemById('external_rotation_randomization').valueOne,
+        external_rotation_angle=get_optional_expression_value(inputs, 'external_rotation_angle', num_copies),
+    )
+
+# This function will read an expression text box as a number, or as the expression text if it changes with the copy index k or the copy count n
+def get_expression_value(inputs: adsk.core.CommandInputs, input_id: str, num_copies: int, default: float = 1.0):
+    text_input = inputs.itemById(input_id)
+    try:
+        expression = expressions.compile_expression(text_input.text)
+        if (expression.is_constant):
+            return expression.value()
+        # Evaluated here once too, so an expression without a value for some copy is reported rather than raised in the plan.
+        expression.evaluate(num_copies)
+        return expression.text
+    except expressions.ExpressionError as error:
+        futil.log(f'     cannot read {text_input.name}, using {default}: {error}', adsk.core.LogLevels.WarningLogLevel)
+        return default
+
+# This function will read a text box that holds a single number or an expression without k and n, returning the default if it cannot be read
+def get_constant_value(inputs: adsk.core.CommandInputs, input_id: str, default: float):
+    text_input = inputs.itemById(input_id)
+    try:
+        return expressions.compile_expression(text_input.text).value()
+    except expressions.ExpressionError as error:
+        futil.log(f'     cannot read {text_input.name}, using {default}: {error}', adsk.core.LogLevels.WarningLogLevel)
+        return default
+
+# This function will read an expression text box that may be left blank, returning None for a blank box or one that cannot be read
+def get_optional_expression_value(inputs: adsk.core.CommandInputs, input_id: str, num_copies: int):
+    if (not inputs.itemById(input_id).text.strip()):
+        return None
+    return get_expression_value(inputs, input_id, num_copies, default=None)
+
+def get_rotation_mode(rotation_radio_button: adsk.core.RadioButtonGroupCommandInput):
+    if (rotation_radio_button.selectedItem.name == 'compound angle for each copy'):
+        return plan.COMPOUND
+    return plan.CONSTANT
 
 # This function will be called when the user changes anything in the command dialog
 def command_input_changed(args: adsk.core.InputChangedEventArgs):
@@ -803,7 +1203,8 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
 #    futil.log(f'{CMD_NAME} Input Changed Event fired from a change to {changed_input.id} and {changed_input.name} to value {changed_input}')
     futil.log(f'{CMD_NAME} Input Changed Event fired from a change to id {changed_input.id} and name {changed_input.name}')
     if (changed_input.id == 'reset scale'):
-        futil.log(f'   transform value as array: {scale_transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', scale_transform.asArray())
         inputs.itemById('scale_value').text = str('1.0')
         inputs.itemById('scale_value_x').text = str('1.0')
         inputs.itemById('scale_value_y').text = str('1.0')
@@ -816,26 +1217,43 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
     if (changed_input.id == 'reset internal rotation'):
         inputs.itemById('internal_rotation_triad').transform = adsk.core.Matrix3D.create()
         inputs.itemById('internal_rotation_randomization').valueOne = 0
+        inputs.itemById('internal_rotation_angle').text = ''
         internal_rotation_transform = inputs.itemById('internal_rotation_triad').transform
-        futil.log(f'   transform value as array: {internal_rotation_transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', internal_rotation_transform.asArray())
 
     if (changed_input.id == 'reset translation'):
         inputs.itemById('translation_triad').transform = adsk.core.Matrix3D.create()
         inputs.itemById('translation_randomization_x').valueOne = 0
         inputs.itemById('translation_randomization_y').valueOne = 0
         inputs.itemById('translation_randomization_z').valueOne = 0
+        inputs.itemById('translation_x').text = ''
+        inputs.itemById('translation_y').text = ''
+        inputs.itemById('translation_z').text = ''
         translation_transform = inputs.itemById('translation_triad').transform
-        futil.log(f'   transform value as array: {translation_transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', translation_transform.asArray())
 
     if (changed_input.id == 'reset external rotation'):
         inputs.itemById('external_rotation_triad').transform = adsk.core.Matrix3D.create()
         inputs.itemById('external_rotation_randomization').valueOne = 0
+        inputs.itemById('external_rotation_angle').text = ''
         external_rotation_transform = inputs.itemById('external_rotation_triad').transform
-        futil.log(f'   transform value as array: {external_rotation_transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', external_rotation_transform.asArray())
+
+    if (changed_input.id == 'create new components'):
+        inputs.itemById('componentRadioButtonGroup').isEnabled = changed_input.value
+
+    if (changed_input.id == 'outputRadioButtonGroup'):
+        inputs.itemById('export_file').isVisible = (changed_input.selectedItem.name == "export mesh file (STL, OBJ, 3MF)")
 
     if (changed_input.id == 'preview interference'):
         preview_interference_flag = True
 
+    if (changed_input.id == 'save plan'):
+        save_plan(inputs)
+
     if (changed_input.id == 'scaleEquationRadioButtonGroup'):
         scale_equation_radio_button: adsk.core.RadioButtonGroupCommandInput = inputs.itemById('scaleEquationRadioButtonGroup')
         if (scale_equation_radio_button.selectedItem.name == 'scale uniformly'):
@@ -892,52 +1310,52 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
 #        update_preview_flag = False
         oldTab = 'none'
         if (tabCmdInputCopy.isActive):
-            futil.log(f'  Copy Tab is active')
+            futil.debug('  Copy Tab is active')
             oldTab = activeTab
             activeTab = 'tab_copy'            
         else:
-            futil.log(f'  Copy Tab is inactive')
+            futil.debug('  Copy Tab is inactive')
 
         if (tabCmdInputScale.isActive):
-            futil.log(f'  Scale Tab is active')
+            futil.debug('  Scale Tab is active')
             oldTab = activeTab
             activeTab = 'tab_scale'            
         else:
-            futil.log(f'  Scale Tab is inactive')
+            futil.debug('  Scale Tab is inactive')
 
         if (tabCmdInputInternalRotation.isActive):
-            futil.log(f'  Internal Rotation Tab is active')
+            futil.debug('  Internal Rotation Tab is active')
             oldTab = activeTab
             activeTab = 'tab_internal_rotation'            
             inputs.itemById('internal_rotation_triad').setRotateVisibility(True)
             inputs.itemById('internal_rotation_triad').transform = internal_rotation_transform
         else:
-            futil.log(f'  Internal Rotation Tab is inactive')
+            futil.debug('  Internal Rotation Tab is inactive')
 
         if (tabCmdInputTranslation.isActive):
-            futil.log(f'  Translation Tab is active')
+            futil.debug('  Translation Tab is active')
             oldTab = activeTab
             activeTab = 'tab_translation'            
             inputs.itemById('translation_triad').setTranslateVisibility(True)
             inputs.itemById('translation_triad').transform = translation_transform
         else:
-            futil.log(f'  Translation Tab is inactive')
+            futil.debug('  Translation Tab is inactive')
             
         if (tabCmdInputExternalRotation.isActive):
-            futil.log(f'  External Rotation Tab is active')
+            futil.debug('  External Rotation Tab is active')
             oldTab = activeTab
             activeTab = 'tab_external_rotation'            
             inputs.itemById('external_rotation_triad').setRotateVisibility(True)
             inputs.itemById('external_rotation_triad').transform = external_rotation_transform
         else:
-            futil.log(f'  External Rotation Tab is inactive')
+            futil.debug('  External Rotation Tab is inactive')
 
         if (tabCmdInputPreview.isActive):
-            futil.log(f'  Preview Tab is active')
+            futil.debug('  Preview Tab is active')
             oldTab = activeTab
             activeTab = 'tab_preview'            
         else:
-            futil.log(f'  Preview Tab is inactive')
+            futil.debug('  Preview Tab is inactive')
 
         if (oldTab == 'tab_internal_rotation'):
             internal_rotation_transform = inputs.itemById('internal_rotation_triad').transform
@@ -952,13 +1370,16 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
 
 
     if (changed_input.id == 'internal_rotation_triad'):
-        futil.log(f'   transform value as array: {changed_input.transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', changed_input.transform.asArray())
         internal_rotation_transform = inputs.itemById('internal_rotation_triad').transform
     if (changed_input.id == 'translation_triad'):
-        futil.log(f'   transform value as array: {changed_input.transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', changed_input.transform.asArray())
         translation_transform = inputs.itemById('translation_triad').transform
     if (changed_input.id == 'external_rotation_triad'):
-        futil.log(f'   transform value as array: {changed_input.transform.asArray()}')
+        if (config.VERBOSE):
+            futil.debug('   transform value as array: %s', changed_input.transform.asArray())
         external_rotation_transform = inputs.itemById('external_rotation_triad').transform
   
 
@@ -968,4 +1389,9 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
 def command_destroy(args: adsk.core.CommandEventArgs):
     global local_handlers
     local_handlers = []
+    api_trace.stop()
+    plan_cache.clear()
+    copy_cost_model.clear()
+    graphics.clear()
+    proxies.clear()
     futil.log(f'{CMD_NAME} Command Destroy Event')
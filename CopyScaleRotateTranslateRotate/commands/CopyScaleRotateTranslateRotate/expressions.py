@@ -0,0 +1,157 @@
+# Per-copy expressions for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. The text fields of the dialog
+# accept arithmetic expressions such as 0.9, 1/3, 0.9**k or 1 + 0.1*sin(k),
+# where k is the index of a copy (1..n) and n is the number of copies. An
+# expression is parsed once, checked against a small whitelist of operators,
+# names and functions (so no attribute access, indexing or builtins can get
+# through) and compiled. Evaluating it for a pattern is then a single NumPy
+# pass over all copies at once.
+
+import ast
+import functools
+from typing import Dict
+
+import numpy as np
+
+# The variables an expression may use: the copy index k and the copy count n.
+VARIABLES = ('k', 'n')
+
+CONSTANTS = {
+    'pi': np.pi,
+    'e': np.e,
+    'tau': 2 * np.pi,
+}
+
+FUNCTIONS = {
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan, 'atan2': np.arctan2,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+    'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log2': np.log2, 'log10': np.log10,
+    'abs': np.abs, 'floor': np.floor, 'ceil': np.ceil, 'round': np.round,
+    'min': np.minimum, 'max': np.maximum, 'hypot': np.hypot,
+    'radians': np.radians, 'degrees': np.degrees,
+}
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+
+# Longer texts are refused before they are parsed, which also bounds the
+# nesting depth the parser has to handle.
+MAXIMUM_LENGTH = 500
+
+
+class ExpressionError(ValueError):
+    """Raised for text that is not a valid expression or has no finite value."""
+
+
+class Expression:
+    """A compiled expression of the copy index k and the copy count n."""
+
+    def __init__(self, text: str):
+        self.text = text.strip()
+        if not self.text:
+            raise ExpressionError('the expression is empty')
+        if len(self.text) > MAXIMUM_LENGTH:
+            raise ExpressionError(f'the expression is longer than {MAXIMUM_LENGTH} characters')
+        try:
+            tree = ast.parse(self.text, mode='eval')
+        except SyntaxError as error:
+            raise ExpressionError(f'{self.text!r} is not an expression: {error.msg}') from None
+        names = _check(tree)
+        self.variables = frozenset(names & set(VARIABLES))
+        # Literals become float64 scalars, so constant and per-copy expressions
+        # follow the same NumPy rules (no unbounded integer powers, inf instead
+        # of ZeroDivisionError).
+        self._literals: Dict[str, np.float64] = {}
+        tree = ast.fix_missing_locations(_LiteralNamer(self._literals).visit(tree))
+        self._code = compile(tree, '<expression>', 'eval')
+
+    @property
+    def is_constant(self) -> bool:
+        """Returns True if the expression has the same value for every copy."""
+        return not self.variables
+
+    def evaluate(self, n: int) -> np.ndarray:
+        """Returns the (n,) values of the expression for copies k = 1..n."""
+        n = max(int(n), 0)
+        namespace = dict(CONSTANTS)
+        namespace.update(FUNCTIONS)
+        namespace.update(self._literals)
+        namespace['k'] = np.arange(1, n + 1, dtype=float)
+        namespace['n'] = np.float64(n)
+        try:
+            with np.errstate(all='ignore'):
+                values = eval(self._code, {'__builtins__': {}}, namespace)
+            values = np.broadcast_to(np.asarray(values, dtype=float), (n,))
+        except (TypeError, ValueError) as error:
+            # A function used without a call or with the wrong number of arguments.
+            raise ExpressionError(f'{self.text!r} cannot be evaluated: {error}') from None
+        if not np.all(np.isfinite(values)):
+            if self.is_constant:
+                raise ExpressionError(f'{self.text!r} has no finite value')
+            bad = int(np.argmin(np.isfinite(values))) + 1
+            raise ExpressionError(f'{self.text!r} has no finite value for k = {bad}')
+        return values
+
+    def value(self) -> float:
+        """Returns the value of a constant expression."""
+        if not self.is_constant:
+            raise ExpressionError(f'{self.text!r} depends on {", ".join(sorted(self.variables))}')
+        return float(self.evaluate(1)[0])
+
+    def __repr__(self):
+        return f'Expression({self.text!r})'
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(text: str) -> Expression:
+    """Returns the compiled expression of text, parsing each distinct text only once."""
+    return Expression(text)
+
+
+def evaluate(value, n: int) -> np.ndarray:
+    """Returns the (n,) per-copy values of a number or an expression text."""
+    if isinstance(value, str):
+        return compile_expression(value).evaluate(n)
+    return np.full(max(int(n), 0), float(value))
+
+
+def _check(tree: ast.AST) -> set:
+    # Raises ExpressionError for any node outside the whitelist and returns the
+    # names the expression uses.
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Load) + _OPERATORS):
+            continue
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+            continue
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ExpressionError(f'{node.value!r} is not a number')
+            continue
+        if isinstance(node, ast.Name):
+            if node.id not in VARIABLES and node.id not in CONSTANTS and node.id not in FUNCTIONS:
+                raise ExpressionError(f'unknown name {node.id!r}, expressions can use k, n, '
+                                      + ', '.join(sorted(CONSTANTS)) + ' and ' + ', '.join(sorted(FUNCTIONS)))
+            names.add(node.id)
+            continue
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ExpressionError('only the functions ' + ', '.join(sorted(FUNCTIONS)) + ' can be called')
+            if node.keywords:
+                raise ExpressionError(f'{node.func.id}() takes no keyword arguments')
+            continue
+        raise ExpressionError(f'{type(node).__name__} is not allowed in an expression')
+    return names
+
+
+class _LiteralNamer(ast.NodeTransformer):
+    # Replaces every number literal by a name bound to its float64 value.
+
+    def __init__(self, literals: Dict[str, np.float64]):
+        self.literals = literals
+
+    def visit_Constant(self, node: ast.Constant):
+        name = f'_literal{len(self.literals)}'
+        self.literals[name] = np.float64(node.value)
+        return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
@@ -0,0 +1,164 @@
+# Iterated function system expansion for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. In fractal mode the first
+# copies of a TransformPlan are not built themselves but used as the maps of
+# an iterated function system: every generation applies each map to every
+# instance of the generation before it. The instance count grows as
+# maps ** depth, so the expansion runs breadth first in chunks, drops
+# instances that are too small to matter and stops at a generation that would
+# exceed the instance limit. Only the surviving leaves reach geometry creation.
+
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+
+# The instances of one generation are never allowed to exceed this, whatever
+# the dialog asks for, since every one of them becomes geometry or graphics.
+MAXIMUM_INSTANCES = 100000
+
+# Parents expanded per NumPy batch. Besides the leaves kept so far, at most
+# this many parents times the number of maps matrices are held at once.
+_CHUNK_SIZE = 4096
+
+
+@dataclass
+class Expansion:
+    """The surviving leaves of an iterated function system."""
+    matrices: np.ndarray  # (num_leaves, 4, 4) net transforms of the leaves
+    depth: int            # the deepest generation that was expanded
+    pruned: int           # instances dropped for being smaller than the minimum scale
+    generations: np.ndarray  # (num_leaves,) the generation of each leaf, 0 for the untransformed instance
+
+    @property
+    def num_leaves(self) -> int:
+        return len(self.matrices)
+
+
+def expand(maps: np.ndarray, depth: int, minimum_scale: float = 0.0,
+           maximum_instances: int = MAXIMUM_INSTANCES) -> Expansion:
+    """Expands an iterated function system breadth first and returns its leaves.
+
+    A leaf of generation d is m_1 @ m_2 @ ... @ m_d for one choice of map per
+    generation, so its first map places the whole sub-pattern of the others.
+
+    Arguments:
+    maps -- The (num_maps, 4, 4) maps applied in every generation.
+    depth -- The number of generations to expand.
+    minimum_scale -- Children whose largest stretch falls below this are
+                     dropped. An instance whose children would all be dropped
+                     is not expanded any further and stays a leaf, so the
+                     pattern stops refining where its pieces get too small.
+                     Zero or less expands every instance to full depth.
+    maximum_instances -- The expansion stops at the last generation that
+                         has at most this many leaves.
+    """
+    maps = np.asarray(maps, dtype=float).reshape(-1, 4, 4)
+    maximum_instances = min(max(int(maximum_instances), 1), MAXIMUM_INSTANCES)
+    finished = np.empty((0, 4, 4))
+    finished_generations = np.empty(0, dtype=int)
+    active = np.identity(4)[None]
+    active_generation = 0
+    pruned = 0
+    expanded = 0
+    for generation in range(max(int(depth), 0)):
+        if len(active) == 0 or len(maps) == 0:
+            break
+        next_generation = _expand_generation(active, maps, minimum_scale, maximum_instances - len(finished))
+        if next_generation is None:
+            break
+        done, active, generation_pruned = next_generation
+        finished = np.concatenate([finished, done])
+        finished_generations = np.concatenate([finished_generations, np.full(len(done), generation, dtype=int)])
+        active_generation = generation + 1
+        pruned += generation_pruned
+        if len(active) > 0:
+            expanded = generation + 1
+    generations = np.concatenate([finished_generations, np.full(len(active), active_generation, dtype=int)])
+    return Expansion(np.concatenate([finished, active]), expanded, pruned, generations)
+
+
+def full_depth(num_maps: int, depth: int, maximum_instances: int = MAXIMUM_INSTANCES,
+               limit: int = MAXIMUM_INSTANCES) -> int:
+    """Returns the generation expand() stops at without a minimum scale, when every instance is expanded.
+
+    Leaves streamed to disk with leaf_chunks() are not held in memory, so
+    their caller may pass a limit above MAXIMUM_INSTANCES.
+    """
+    maximum_instances = min(max(int(maximum_instances), 1), limit)
+    generations = 0
+    if num_maps == 0:
+        return generations
+    while generations < depth and num_maps ** (generations + 1) <= maximum_instances:
+        generations += 1
+    return generations
+
+
+def leaf_chunks(maps: np.ndarray, depth: int, chunk_size: int = _CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Yields the num_maps ** depth leaves of a full expansion to depth, chunk_size at a time.
+
+    The leaves come in the order expand() returns them without a minimum
+    scale, but each chunk is computed from the digits of its leaf indices
+    alone, so the whole expansion never has to be held in memory.
+    """
+    maps = np.asarray(maps, dtype=float).reshape(-1, 4, 4)
+    num_leaves = len(maps) ** depth
+    for start in range(0, num_leaves, chunk_size):
+        indices = np.arange(start, min(start + chunk_size, num_leaves))
+        leaves = np.broadcast_to(np.identity(4), (len(indices), 4, 4))
+        for generation in range(depth):
+            # The first generation's map is the most significant digit.
+            digits = (indices // len(maps) ** (depth - 1 - generation)) % len(maps)
+            leaves = leaves @ maps[digits]
+        yield leaves
+
+
+def distinct_maps(maps: np.ndarray, tolerance: float = 1e-9) -> np.ndarray:
+    """Returns the maps without the ones that repeat an earlier map, in their order.
+
+    A repeated map places every instance it creates on top of an instance of
+    the map it repeats, so it multiplies the leaves without adding anything to
+    the pattern. Maps made from copies that all apply the same transform, as
+    with constant modes only, are all the same map.
+    """
+    maps = np.asarray(maps, dtype=float).reshape(-1, 4, 4)
+    close = np.all(np.abs(maps[:, None] - maps[None]) <= tolerance, axis=(2, 3))
+    repeats = np.any(np.tril(close, k=-1), axis=1)
+    return maps[~repeats]
+
+
+def _expand_generation(parents: np.ndarray, maps: np.ndarray, minimum_scale: float, maximum_instances: int):
+    # Returns the parents that stay leaves, the surviving children and how
+    # many children were pruned, or None when together they would exceed
+    # maximum_instances.
+    done_parts = []
+    child_parts = []
+    count = 0
+    pruned = 0
+    for start in range(0, len(parents), _CHUNK_SIZE):
+        chunk = parents[start:start + _CHUNK_SIZE]
+        children = chunk[:, None] @ maps[None]    # (chunk, num_maps, 4, 4)
+        if minimum_scale > 0:
+            large_enough = (largest_scales(children) >= minimum_scale).reshape(len(chunk), len(maps))
+            is_done = ~np.any(large_enough, axis=1)
+            pruned += int(np.count_nonzero(~large_enough[~is_done]))
+            done_parts.append(chunk[is_done])
+            children = children[large_enough]
+            count += len(done_parts[-1])
+        else:
+            children = children.reshape(-1, 4, 4)
+        count += len(children)
+        if count > maximum_instances:
+            return None
+        child_parts.append(children)
+    done = np.concatenate(done_parts) if done_parts else np.empty((0, 4, 4))
+    return done, np.concatenate(child_parts), pruned
+
+
+def largest_scales(matrices: np.ndarray) -> np.ndarray:
+    """Returns the largest factor by which each (..., 4, 4) matrix stretches a body."""
+    matrices = np.asarray(matrices, dtype=float)
+    linear = matrices[..., :3, :3].reshape(-1, 3, 3)
+    if len(linear) == 0:
+        return np.empty(matrices.shape[:-2])
+    return np.linalg.svd(linear, compute_uv=False)[:, 0].reshape(matrices.shape[:-2])
@@ -0,0 +1,215 @@
+# Geometry backends for the Copy Scale Rotate Translate Rotate command.
+#
+# Each backend turns a finished TransformPlan into bodies in the design. The
+# parametric backend (copyToComponent followed by scale and move features) still
+# lives in entry.py; the functions here are the alternatives that avoid one
+# timeline feature per copy.
+
+from typing import List, Sequence, Tuple
+
+import adsk.core, adsk.fusion
+import numpy as np
+
+from ...lib import fusion360utils as futil
+from . import plan, plan_store
+
+
+# This function will convert a 4x4 plan matrix into a Fusion matrix with a single API call
+def to_matrix3d(matrix) -> adsk.core.Matrix3D:
+    output_transform = adsk.core.Matrix3D.create()
+    output_transform.setWithArray([float(value) for value in np.asarray(matrix).ravel()])
+    return output_transform
+
+
+def supports_base_feature(matrices: np.ndarray) -> bool:
+    """Returns True if every matrix of a plan can be applied to a transient BRep.
+
+    TemporaryBRepManager.transform only moves, rotates and uniformly scales a
+    body, so plans with non-uniform scales have to use the parametric backend.
+    The plan is checked a chunk at a time and only up to the first chunk that
+    fails, so a memory mapped plan is never read into memory as a whole.
+    """
+    return all(np.all(plan.similarity_rows(chunk)) for chunk in plan_store.row_chunks(matrices))
+
+
+def supports_occurrences(matrices: np.ndarray) -> bool:
+    """Returns True if every matrix of a plan can be an occurrence transform.
+
+    Occurrences share the geometry of their component, so only rigid patterns
+    (no scaling) can be expressed as occurrences of one component. Like
+    supports_base_feature() it stops at the first chunk that fails.
+    """
+    return all(np.all(plan.rigid_rows(chunk)) for chunk in plan_store.row_chunks(matrices))
+
+
+def create_base_feature_copies(
+        component: adsk.fusion.Component,
+        original_bodies: Sequence[adsk.fusion.BRepBody],
+        net_matrices: np.ndarray,
+        copy_indices: Sequence[int]
+) -> List[List[adsk.fusion.BRepBody]]:
+    """Creates every transformed copy as a transient BRep and commits them all at once.
+
+    In a parametric design the bodies are added inside one base feature edit, so
+    the whole pattern is a single timeline entry. In a direct design they are
+    added to the component as they are.
+
+    Arguments:
+    component -- The component the copies are added to.
+    original_bodies -- The bodies to copy.
+    net_matrices -- The (num_copies + 1, 4, 4) net transform of each copy, see TransformPlan.net_matrices().
+    copy_indices -- The rows of net_matrices to create copies for.
+
+    :returns:
+        One list of new bodies per entry of copy_indices, in the order of original_bodies.
+    """
+    temp_brep_manager = adsk.fusion.TemporaryBRepManager.get()
+
+    # Build every transient body before touching the design, so a body that
+    # cannot be transformed leaves nothing half-created behind.
+    temp_bodies = []
+    for copy_index in copy_indices:
+        matrix = net_matrices[copy_index]
+        fusion_matrix = None if plan.is_identity(matrix) else to_matrix3d(matrix)
+        copy_temp_bodies = []
+        for body in original_bodies:
+            temp_body = temp_brep_manager.copy(body)
+            if fusion_matrix is not None and not temp_brep_manager.transform(temp_body, fusion_matrix):
+                raise ValueError(f'Could not transform copy {copy_index} of {body.name}')
+            copy_temp_bodies.append(temp_body)
+        temp_bodies.append(copy_temp_bodies)
+
+    design = adsk.fusion.Design.cast(component.parentDesign)
+    base_feature = None
+    if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+        base_feature = component.features.baseFeatures.add()
+        base_feature.startEdit()
+
+    created_bodies = []
+    try:
+        for copy_index, copy_temp_bodies in zip(copy_indices, temp_bodies):
+            copy_bodies = []
+            for body, temp_body in zip(original_bodies, copy_temp_bodies):
+                if base_feature:
+                    new_body = component.bRepBodies.add(temp_body, base_feature)
+                else:
+                    new_body = component.bRepBodies.add(temp_body)
+                new_body.name = body.name + "_" + str(copy_index)
+                copy_bodies.append(new_body)
+            created_bodies.append(copy_bodies)
+    finally:
+        if base_feature:
+            base_feature.finishEdit()
+
+    if base_feature:
+        base_feature.name = f'{original_bodies[0].name} pattern ({len(copy_indices)} copies)'
+    futil.debug('  CREATED %d BODIES from transient BReps', len(copy_indices) * len(original_bodies))
+    return created_bodies
+
+
+def create_occurrence_copies(
+        component: adsk.fusion.Component,
+        original_bodies: Sequence[adsk.fusion.BRepBody],
+        net_matrices: np.ndarray,
+        copy_indices: Sequence[int]
+) -> List[adsk.fusion.Occurrence]:
+    """Copies the bodies into one new component once and places an occurrence of it per copy.
+
+    The BRep geometry exists a single time no matter how many copies are made,
+    so file size, memory and display cost follow the unique geometry.
+
+    Arguments:
+    component -- The component the occurrences are added to.
+    original_bodies -- The bodies to copy.
+    net_matrices -- The (num_copies + 1, 4, 4) net transform of each copy, all rigid.
+    copy_indices -- The rows of net_matrices to create occurrences for.
+
+    :returns:
+        One occurrence per entry of copy_indices.
+    """
+    occurrences = []
+    if len(copy_indices) == 0:
+        return occurrences
+
+    # The first occurrence owns the new component. Its bodies are copied in the
+    # original (world) coordinates and the occurrence transform places them.
+    source_occurrence = component.occurrences.addNewComponent(to_matrix3d(net_matrices[copy_indices[0]]))
+    source_component = source_occurrence.component
+    source_component.name = original_bodies[0].name + " pattern"
+    for body in original_bodies:
+        new_body = body.copyToComponent(source_component)
+        new_body.name = body.name
+    occurrences.append(source_occurrence)
+
+    for copy_index in copy_indices[1:]:
+        occurrence = component.occurrences.addExistingComponent(source_component, to_matrix3d(net_matrices[copy_index]))
+        occurrences.append(occurrence)
+
+    futil.debug('  CREATED %d OCCURRENCES of one component', len(occurrences))
+    return occurrences
+
+
+def move_bodies_to_new_components(
+        component: adsk.fusion.Component,
+        groups: Sequence[Tuple[str, List[adsk.fusion.BRepBody]]]
+) -> List[adsk.fusion.Occurrence]:
+    """Creates one new component per group and moves the bodies of the group into it.
+
+    Giving every body a component of its own adds a component, an occurrence
+    and a browser node per body. Here they grow with the number of groups,
+    and each body only costs the call that moves it.
+
+    Arguments:
+    component -- The component the new occurrences are added to.
+    groups -- The name and the bodies of each new component.
+
+    :returns:
+        One occurrence per group.
+    """
+    occurrences = []
+    for name, bodies in groups:
+        occurrence = component.occurrences.addNewComponent(adsk.core.Matrix3D.create())
+        occurrence.component.name = name
+        for body in bodies:
+            body.moveToComponent(occurrence)
+        occurrences.append(occurrence)
+    futil.debug('  CREATED %d COMPONENTS for %d bodies', len(occurrences), sum(len(bodies) for name, bodies in groups))
+    return occurrences
+
+
+def bounding_boxes(bodies: Sequence[adsk.fusion.BRepBody]):
+    """Returns the (num_bodies, 3) lower and upper corners of the bodies' bounding boxes."""
+    minimums = np.empty((len(bodies), 3))
+    maximums = np.empty((len(bodies), 3))
+    for index, body in enumerate(bodies):
+        box = body.boundingBox
+        minimums[index] = box.minPoint.asArray()
+        maximums[index] = box.maxPoint.asArray()
+    return minimums, maximums
+
+
+def analyze_interference_pairs(
+        design: adsk.fusion.Design,
+        bodies: Sequence[adsk.fusion.BRepBody],
+        pairs: np.ndarray
+) -> List[adsk.fusion.InterferenceResult]:
+    """Runs the exact interference check on the given pairs of bodies only.
+
+    Arguments:
+    design -- The design the bodies belong to.
+    bodies -- The bodies the pairs index into.
+    pairs -- The (num_pairs, 2) indices of the bodies to check against each other, see interference.candidate_pairs().
+
+    :returns:
+        The interference results of all pairs that do interfere.
+    """
+    results = []
+    for first, second in pairs:
+        pair_collection = adsk.core.ObjectCollection.create()
+        pair_collection.add(bodies[first])
+        pair_collection.add(bodies[second])
+        interference_input = design.createInterferenceInput(pair_collection)
+        interference_input.areCoincidentFacesIncluded = False
+        for result in design.analyzeInterference(interference_input):
+            results.append(result)
+    return results
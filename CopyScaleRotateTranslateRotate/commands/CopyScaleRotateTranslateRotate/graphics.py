@@ -0,0 +1,124 @@
+# Custom graphics preview for the Copy Scale Rotate Translate Rotate command.
+#
+# Instead of creating bodies and features on every input change, this preview
+# tessellates each selected body once per command session and draws all of its
+# transformed copies as a single CustomGraphicsMesh. Real geometry is only
+# built when the command is executed.
+
+from typing import Dict, Sequence
+
+import adsk.core, adsk.fusion
+import numpy as np
+
+from ...lib import fusion360utils as futil
+from . import meshes
+
+# Tessellations of the selected bodies, keyed by entity token and quality.
+# Bodies do not change while the command dialog is open, so they are computed
+# only once.
+_mesh_cache: Dict[tuple, meshes.TriangleMesh] = {}
+
+# The custom graphics group of the current preview, the entity tokens of the
+# bodies it shows and the batches of copy rows drawn into it. Each batch is a
+# (rows, meshes) pair so later previews can keep the batches that did not change.
+_graphics_group = None
+_drawn_body_tokens = []
+_drawn_batches = []
+
+
+def get_mesh(body: adsk.fusion.BRepBody,
+             quality=adsk.fusion.TriangleMeshQualityOptions.LowQualityTriangleMesh) -> meshes.TriangleMesh:
+    """Returns the (cached) tessellation of a body, by default of low quality for the preview."""
+    key = (body.entityToken, quality)
+    mesh = _mesh_cache.get(key)
+    if mesh is None:
+        calculator = body.meshManager.createMeshCalculator()
+        calculator.setQuality(quality)
+        triangle_mesh = calculator.calculate()
+        mesh = meshes.from_flat_arrays(triangle_mesh.nodeCoordinatesAsDouble,
+                                       triangle_mesh.nodeIndices,
+                                       triangle_mesh.normalVectorsAsDouble)
+        _mesh_cache[key] = mesh
+    return mesh
+
+
+def sample_rows(bodies: Sequence[adsk.fusion.BRepBody], copy_indices: Sequence[int],
+                maximum_triangles: int) -> Sequence[int]:
+    """Returns copy_indices, or every so many of them when drawing them all would take more than maximum_triangles.
+
+    The sample is a slice of copy_indices, so it is spread evenly over the
+    pattern, keeps its order and costs no memory for a range.
+    """
+    triangles_per_copy = max(sum(get_mesh(body).num_triangles for body in bodies), 1)
+    maximum_copies = max(maximum_triangles // triangles_per_copy, 1)
+    if len(copy_indices) <= maximum_copies:
+        return copy_indices
+    stride = -(-len(copy_indices) // maximum_copies)
+    return copy_indices[::stride]
+
+
+def draw_instances(
+        component: adsk.fusion.Component,
+        bodies: Sequence[adsk.fusion.BRepBody],
+        net_matrices: np.ndarray,
+        copy_indices: Sequence[int],
+        first_changed_row: int = 0
+):
+    """Draws one transformed copy of the bodies per copy row, reusing what is already drawn.
+
+    Batches drawn by an earlier preview are kept when the bodies are the same,
+    all of their rows are still wanted and come before first_changed_row, so
+    going from 40 to 41 copies only draws the new copy.
+
+    Arguments:
+    component -- The component the graphics group is added to.
+    bodies -- The bodies to draw.
+    net_matrices -- The (num_copies + 1, 4, 4) net transform of each copy row.
+    copy_indices -- The rows to draw.
+    first_changed_row -- The first row whose transform differs from the last preview, see PlanCache.get().
+    """
+    global _graphics_group, _drawn_body_tokens, _drawn_batches
+    body_tokens = [body.entityToken for body in bodies]
+    if (_graphics_group is None or not _graphics_group.isValid or body_tokens != _drawn_body_tokens):
+        remove_graphics()
+        _graphics_group = component.customGraphicsGroups.add()
+        _drawn_body_tokens = body_tokens
+
+    wanted_rows = set(copy_indices)
+    kept_batches = []
+    for rows, batch_meshes in _drawn_batches:
+        if all(row < first_changed_row and row in wanted_rows for row in rows):
+            kept_batches.append((rows, batch_meshes))
+        else:
+            for mesh in batch_meshes:
+                if mesh.isValid:
+                    mesh.deleteMe()
+    _drawn_batches = kept_batches
+
+    drawn_rows = set(row for rows, batch_meshes in _drawn_batches for row in rows)
+    new_rows = [row for row in copy_indices if row not in drawn_rows]
+    if new_rows:
+        batch_meshes = []
+        for body in bodies:
+            instances = meshes.instance_mesh(get_mesh(body), net_matrices[new_rows])
+            coordinates = adsk.fusion.CustomGraphicsCoordinates.create(instances.coordinates.ravel().tolist())
+            indices = instances.indices.tolist()
+            batch_meshes.append(_graphics_group.addMesh(coordinates, indices, instances.normals.ravel().tolist(), indices))
+        _drawn_batches.append((tuple(new_rows), batch_meshes))
+    futil.debug('  DREW %d of %d copies of %d bodies as custom graphics', len(new_rows), len(copy_indices), len(bodies))
+
+
+def remove_graphics():
+    """Removes the graphics drawn by the last preview, if any."""
+    global _graphics_group, _drawn_body_tokens, _drawn_batches
+    if _graphics_group is not None and _graphics_group.isValid:
+        _graphics_group.deleteMe()
+    _graphics_group = None
+    _drawn_body_tokens = []
+    _drawn_batches = []
+
+
+def clear():
+    """Removes the preview graphics and forgets the cached tessellations."""
+    remove_graphics()
+    _mesh_cache.clear()
@@ -0,0 +1,161 @@
+# Interference screening for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. The exact BRep interference
+# check in Fusion tests every pair of bodies it is given, so the functions here
+# narrow a pattern down to the pairs that can actually touch first.
+
+import numpy as np
+
+
+def candidate_pairs(minimums: np.ndarray, maximums: np.ndarray) -> np.ndarray:
+    """Returns the (num_pairs, 2) index pairs i < j whose axis aligned boxes overlap.
+
+    This is a sweep and prune along the axis the boxes are most spread out on:
+    after sorting by the lower bound, box i can only overlap the boxes that
+    start before it ends, and only those are tested on the other two axes. For
+    spread out patterns this is close to linear instead of testing all pairs.
+
+    Arguments:
+    minimums -- The (num_boxes, 3) lower corners of the boxes.
+    maximums -- The (num_boxes, 3) upper corners of the boxes.
+    """
+    minimums = np.asarray(minimums, dtype=float).reshape(-1, 3)
+    maximums = np.asarray(maximums, dtype=float).reshape(-1, 3)
+    count = len(minimums)
+    if count < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    centres = (minimums + maximums) / 2
+    axis = int(np.argmax(np.ptp(centres, axis=0)))
+    order = np.argsort(minimums[:, axis], kind='stable')
+    lower = minimums[order]
+    upper = maximums[order]
+
+    # Sorted box i overlaps sorted boxes i+1 .. ends[i]-1 along the sweep axis.
+    ends = np.searchsorted(lower[:, axis], upper[:, axis], side='right')
+    counts = np.maximum(ends - np.arange(count) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    first = np.repeat(np.arange(count), counts)
+    run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + (np.arange(total) - run_starts)
+
+    overlapping = np.all((lower[second] <= upper[first]) & (upper[second] >= lower[first]), axis=1)
+    pairs = np.stack([order[first[overlapping]], order[second[overlapping]]], axis=1)
+    return np.sort(pairs, axis=1)
+
+
+# The proxy bodies of the preview: a cube spanning [0, size] on every axis and
+# a sphere of radius size around the origin.
+CUBE = 'cube'
+SPHERE = 'sphere'
+
+# Bodies that only touch do not interfere, like areCoincidentFacesIncluded = False.
+_TOLERANCE = 1e-9
+
+
+def proxy_bounding_boxes(kind: str, size: float, matrices: np.ndarray):
+    """Returns the (num_matrices, 3) lower and upper corners of the transformed proxies' bounding boxes."""
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    linear = matrices[:, :3, :3]
+    offsets = matrices[:, :3, 3]
+    if kind == SPHERE:
+        half_extents = size * np.linalg.norm(linear, axis=2)
+        return offsets - half_extents, offsets + half_extents
+    corners = size * np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=float)
+    points = corners @ linear.transpose(0, 2, 1) + offsets[:, None, :]
+    return points.min(axis=1), points.max(axis=1)
+
+
+def interfering_proxy_pairs(kind: str, size: float, matrices: np.ndarray) -> np.ndarray:
+    """Returns the (num_pairs, 2) index pairs of transformed proxies that interfere.
+
+    The proxies are known shapes, so interference is decided in closed form
+    for the whole pattern at once without creating or analyzing any BRep.
+
+    Arguments:
+    kind -- CUBE or SPHERE.
+    size -- The edge length of the cube or the radius of the sphere.
+    matrices -- The (num_proxies, 4, 4) transforms of the proxies.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    pairs = candidate_pairs(*proxy_bounding_boxes(kind, size, matrices))
+    if len(pairs) == 0:
+        return pairs
+    first = matrices[pairs[:, 0]]
+    second = matrices[pairs[:, 1]]
+    if kind == SPHERE:
+        overlapping = ellipsoids_overlap(size, first, second)
+    else:
+        overlapping = parallelepipeds_overlap(size, first, second)
+    return pairs[overlapping]
+
+
+def ellipsoids_overlap(radius: float, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Returns for each pair of matrices whether the images of a sphere of radius around the origin overlap.
+
+    Mapping both by the inverse of the first matrix turns the first shape back
+    into the sphere and the second into an ellipsoid, so the pair overlaps when
+    the sphere's centre lies within radius of that ellipsoid.
+    """
+    relative = np.linalg.inv(first) @ second
+    linear = relative[:, :3, :3]
+    centres = relative[:, :3, 3]
+    # In the frame of the ellipsoid's principal axes it is axis aligned.
+    u, sigma, _ = np.linalg.svd(linear)
+    semi_axes = radius * sigma
+    point = -np.einsum('nji,nj->ni', u, centres)
+    return _point_to_ellipsoid_distance(point, semi_axes) < radius * (1 - _TOLERANCE)
+
+
+def _point_to_ellipsoid_distance(point: np.ndarray, semi_axes: np.ndarray, iterations: int = 100) -> np.ndarray:
+    # The closest point is x_k = a_k^2 q_k / (t + a_k^2) for the root t >= 0 of
+    # sum((a_k q_k / (t + a_k^2))^2) = 1, found here by bisection for all pairs at once.
+    squared = semi_axes ** 2
+    inside = np.sum((point / semi_axes) ** 2, axis=1) <= 1
+    low = np.zeros(len(point))
+    high = semi_axes.max(axis=1) * np.linalg.norm(point, axis=1)
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        value = np.sum((semi_axes * point / (middle[:, None] + squared)) ** 2, axis=1) - 1
+        outside_root = value > 0
+        low = np.where(outside_root, middle, low)
+        high = np.where(outside_root, high, middle)
+    closest = squared * point / (high[:, None] + squared)
+    distances = np.linalg.norm(closest - point, axis=1)
+    return np.where(inside, 0.0, distances)
+
+
+def parallelepipeds_overlap(size: float, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Returns for each pair of matrices whether the images of the cube [0, size]^3 overlap.
+
+    A scaled and rotated cube is a parallelepiped, so this is the separating
+    axis test with the three face normals of each and the nine cross products
+    of their edge directions.
+    """
+    edges_first = size * first[:, :3, :3].transpose(0, 2, 1)    # (n, 3 edges, 3)
+    edges_second = size * second[:, :3, :3].transpose(0, 2, 1)
+    faces_first = np.cross(edges_first[:, [1, 2, 0]], edges_first[:, [2, 0, 1]])
+    faces_second = np.cross(edges_second[:, [1, 2, 0]], edges_second[:, [2, 0, 1]])
+    crossed = np.cross(edges_first[:, :, None, :], edges_second[:, None, :, :]).reshape(-1, 9, 3)
+    axes = np.concatenate([faces_first, faces_second, crossed], axis=1)   # (n, 15, 3)
+    lengths = np.linalg.norm(axes, axis=2, keepdims=True)
+    usable = lengths[..., 0] > 1e-12 * (size ** 2)
+    axes = np.where(usable[..., None], axes / np.where(lengths == 0, 1.0, lengths), 0.0)
+
+    low_first, high_first = _project(axes, first[:, :3, 3], edges_first)
+    low_second, high_second = _project(axes, second[:, :3, 3], edges_second)
+    gap = np.maximum(low_second - high_first, low_first - high_second)
+    extent = (np.linalg.norm(edges_first, axis=(1, 2)) + np.linalg.norm(edges_second, axis=(1, 2)))[:, None]
+    separated = usable & (gap >= -_TOLERANCE * extent)
+    return ~np.any(separated, axis=1)
+
+
+def _project(axes: np.ndarray, origins: np.ndarray, edges: np.ndarray):
+    # The projection of origin + sum(u_k edge_k) for u in [0, 1]^3 onto each axis.
+    centre = np.einsum('nai,ni->na', axes, origins)
+    along_edges = np.einsum('nai,nei->nae', axes, edges)
+    low = centre + np.minimum(along_edges, 0).sum(axis=2)
+    high = centre + np.maximum(along_edges, 0).sum(axis=2)
+    return low, high
@@ -0,0 +1,177 @@
+# Instanced mesh export for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. Print and render pipelines
+# need triangle meshes rather than BRep bodies, so a pattern can be written
+# straight from its plan: each body is tessellated once and every copy is the
+# tessellation under the copy's matrix. Binary STL and OBJ hold every triangle
+# of every copy, so the copies are transformed and written a chunk at a time
+# and memory stays flat however many copies there are. 3MF supports instancing,
+# so there each body's mesh is written once and each copy is a build item that
+# only carries its transform.
+
+import os
+import zipfile
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+
+from . import meshes
+
+FORMATS = ('.stl', '.obj', '.3mf')
+
+# Fusion lengths are in centimetres, meshes are exported in millimetres, the
+# unit slicers assume for STL.
+UNIT_SCALE = 10.0
+
+# Transformed vertices held in memory at once while writing STL and OBJ. A
+# binary STL repeats the nodes of every triangle, so it holds three per triangle.
+CHUNK_VERTICES = 1 << 18
+
+# The little-endian record of one triangle of a binary STL.
+_STL_TRIANGLE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def export(path: str, body_meshes: Sequence[meshes.TriangleMesh], names: Sequence[str], matrices: np.ndarray,
+           rows: Optional[Sequence[int]] = None, chunk_copies: Optional[int] = None) -> int:
+    """Writes a transformed copy of the body meshes for every copy and returns the number of triangles.
+
+    The format follows the extension of path, one of FORMATS.
+
+    Arguments:
+    path -- The file to write.
+    body_meshes -- The tessellation of each body.
+    names -- The name of each body.
+    matrices -- The (num_instances, 4, 4) net transforms, which may be a memory map.
+    rows -- The rows of matrices to write a copy for, by default all of them.
+    chunk_copies -- The copies transformed at once, by default as many as fit in CHUNK_VERTICES.
+    """
+    rows = np.arange(len(matrices)) if rows is None else np.asarray(rows, dtype=np.int64)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f'cannot export {extension or "files without an extension"}, only ' + ', '.join(FORMATS))
+    if chunk_copies is None:
+        vertices_per_copy = sum(3 * mesh.num_triangles if extension == '.stl' else mesh.num_nodes for mesh in body_meshes)
+        chunk_copies = max(CHUNK_VERTICES // max(vertices_per_copy, 1), 1)
+    if extension == '.stl':
+        with open(path, 'wb') as file:
+            return write_stl(file, body_meshes, matrices, rows, chunk_copies)
+    if extension == '.obj':
+        with open(path, 'w') as file:
+            return write_obj(file, body_meshes, names, matrices, rows, chunk_copies)
+    return write_3mf(path, body_meshes, names, matrices, rows)
+
+
+def write_stl(file, body_meshes: Sequence[meshes.TriangleMesh], matrices: np.ndarray, rows: np.ndarray,
+              chunk_copies: int) -> int:
+    """Writes a binary STL of every copy of the body meshes to a binary file."""
+    num_triangles = len(rows) * sum(mesh.num_triangles for mesh in body_meshes)
+    if num_triangles > np.iinfo('<u4').max:
+        raise ValueError(f'a binary STL holds at most {np.iinfo("<u4").max} triangles, not {num_triangles}, use 3MF')
+    file.write(b'Copy Scale Rotate Translate Rotate pattern'.ljust(80, b' '))
+    # Binary STL is little-endian whatever the byte order of the machine.
+    file.write(np.asarray(num_triangles, dtype='<u4').tobytes())
+    for chunk in _chunks(matrices, rows, chunk_copies):
+        for mesh in body_meshes:
+            vertices = _chunk_vertices(mesh, chunk)[:, mesh.indices.reshape(-1, 3)].reshape(-1, 3, 3)
+            # Assigning to the little-endian records converts from the native byte order.
+            triangles = np.zeros(len(vertices), dtype=_STL_TRIANGLE)
+            triangles['vertices'] = vertices
+            triangles['normal'] = _facet_normals(vertices)
+            file.write(triangles.tobytes())
+    return num_triangles
+
+
+def write_obj(file, body_meshes: Sequence[meshes.TriangleMesh], names: Sequence[str], matrices: np.ndarray,
+              rows: np.ndarray, chunk_copies: int) -> int:
+    """Writes an OBJ of every copy of the body meshes to a text file, one object per body."""
+    file.write('# Copy Scale Rotate Translate Rotate pattern, millimetres\n')
+    num_nodes_written = 0
+    num_triangles = 0
+    for mesh, name in zip(body_meshes, names):
+        file.write(f'o {name}\n')
+        for chunk in _chunks(matrices, rows, chunk_copies):
+            vertices = _chunk_vertices(mesh, chunk).reshape(-1, 3)
+            file.write(_format_rows('v %.6g %.6g %.6g', vertices))
+            # OBJ indices are 1-based and count every vertex written before.
+            offsets = num_nodes_written + 1 + np.arange(len(chunk), dtype=np.int64)[:, None] * mesh.num_nodes
+            faces = (mesh.indices[None, :] + offsets).reshape(-1, 3)
+            file.write(_format_rows('f %d %d %d', faces))
+            num_nodes_written += len(vertices)
+            num_triangles += len(faces)
+    return num_triangles
+
+
+def write_3mf(path: str, body_meshes: Sequence[meshes.TriangleMesh], names: Sequence[str], matrices: np.ndarray,
+              rows: np.ndarray, chunk_copies: int = 4096) -> int:
+    """Writes a 3MF package with each body mesh once and one build item per copy."""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+                         '</Types>')
+        package.writestr('_rels/.rels',
+                         '<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+                         'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+                         '</Relationships>')
+        with package.open('3D/3dmodel.model', 'w') as model:
+            model.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                        b'<model unit="millimeter" xml:lang="en-US" '
+                        b'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n<resources>\n')
+            for object_id, (mesh, name) in enumerate(zip(body_meshes, names), start=1):
+                model.write(f'<object id="{object_id}" name="{_escape(name)}" type="model"><mesh><vertices>\n'.encode('utf-8'))
+                model.write(_format_rows('<vertex x="%.6g" y="%.6g" z="%.6g"/>', mesh.coordinates * UNIT_SCALE).encode('utf-8'))
+                model.write(b'</vertices><triangles>\n')
+                model.write(_format_rows('<triangle v1="%d" v2="%d" v3="%d"/>', mesh.indices.reshape(-1, 3)).encode('utf-8'))
+                model.write(b'</triangles></mesh></object>\n')
+            # One component object places all the bodies, so a copy is a single build item.
+            pattern_id = len(body_meshes) + 1
+            model.write(f'<object id="{pattern_id}" type="model"><components>'.encode('utf-8'))
+            model.write(''.join(f'<component objectid="{object_id}"/>'
+                                for object_id in range(1, len(body_meshes) + 1)).encode('utf-8'))
+            model.write(b'</components></object>\n</resources>\n<build>\n')
+            for chunk in _chunks(matrices, rows, chunk_copies):
+                model.write(_format_rows(f'<item objectid="{pattern_id}" transform="' + ' '.join(['%.9g'] * 12) + '"/>',
+                                      _3mf_transforms(chunk)).encode('utf-8'))
+            model.write(b'</build>\n</model>\n')
+    return len(rows) * sum(mesh.num_triangles for mesh in body_meshes)
+
+
+def _chunks(matrices: np.ndarray, rows: np.ndarray, chunk_copies: int) -> Iterator[np.ndarray]:
+    # The matrices of rows, chunk_copies at a time, so a memory mapped plan is only read a chunk at a time.
+    for start in range(0, len(rows), chunk_copies):
+        yield np.asarray(matrices[rows[start:start + chunk_copies]], dtype=float).reshape(-1, 4, 4)
+
+
+def _chunk_vertices(mesh: meshes.TriangleMesh, matrices: np.ndarray) -> np.ndarray:
+    # The (num_matrices, num_nodes, 3) nodes of the mesh under each matrix, in millimetres.
+    return meshes.transform_points(mesh.coordinates, matrices) * UNIT_SCALE
+
+
+def _facet_normals(vertices: np.ndarray) -> np.ndarray:
+    # The unit normal of each (3, 3) triangle by the right hand rule, zero for degenerate ones.
+    normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths == 0, 1.0, lengths)
+
+
+def _3mf_transforms(matrices: np.ndarray) -> np.ndarray:
+    # 3MF transforms act on row vectors and list the 3x3 part row by row,
+    # then the translation, so they are the transposed linear part of a
+    # Matrix3D style matrix followed by its translation (in millimetres).
+    linear = matrices[:, :3, :3].transpose(0, 2, 1).reshape(-1, 9)
+    return np.concatenate([linear, matrices[:, :3, 3] * UNIT_SCALE], axis=1)
+
+
+def _format_rows(row_format: str, rows: np.ndarray) -> str:
+    # One line of row_format per row, formatted in a single operation rather than row by row.
+    if len(rows) == 0:
+        return ''
+    return '\n'.join([row_format] * len(rows)) % tuple(np.asarray(rows).ravel().tolist()) + '\n'
+
+
+def _escape(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
@@ -0,0 +1,69 @@
+# Triangle mesh instancing for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. It applies the matrices of a
+# TransformPlan to the tessellation of a body, so every copy of a body can be
+# drawn (or written out) from a single tessellation.
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class TriangleMesh:
+    """A triangle mesh with one normal per node, as returned by a Fusion mesh calculator."""
+    coordinates: np.ndarray  # (num_nodes, 3)
+    indices: np.ndarray      # (num_triangles * 3,) node indices
+    normals: np.ndarray      # (num_nodes, 3)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.coordinates)
+
+    @property
+    def num_triangles(self) -> int:
+        return len(self.indices) // 3
+
+
+def from_flat_arrays(coordinates, indices, normals) -> TriangleMesh:
+    """Builds a TriangleMesh from the flat lists of TriangleMesh.nodeCoordinatesAsDouble and friends."""
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+    normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+    if len(normals) != len(coordinates):
+        normals = np.zeros_like(coordinates)
+    return TriangleMesh(coordinates, np.asarray(indices, dtype=np.int64), normals)
+
+
+def transform_points(points: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Returns the (num_matrices, num_points, 3) images of points under each 4x4 matrix."""
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    return points @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+
+
+def transform_normals(normals: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Returns the (num_matrices, num_normals, 3) unit normals under each 4x4 matrix.
+
+    Normals follow the inverse transpose of the linear part, which only differs
+    from the matrix itself when a copy is scaled non-uniformly.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    normal_matrices = np.linalg.inv(matrices[:, :3, :3]).transpose(0, 2, 1)
+    transformed = normals @ normal_matrices.transpose(0, 2, 1)
+    lengths = np.linalg.norm(transformed, axis=2, keepdims=True)
+    return transformed / np.where(lengths == 0, 1.0, lengths)
+
+
+def instance_mesh(mesh: TriangleMesh, matrices: np.ndarray) -> TriangleMesh:
+    """Returns one mesh that holds a transformed copy of mesh for every matrix.
+
+    Arguments:
+    mesh -- The tessellation of a single body.
+    matrices -- The (num_copies, 4, 4) transforms of the copies.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    count = len(matrices)
+    coordinates = transform_points(mesh.coordinates, matrices).reshape(-1, 3)
+    normals = transform_normals(mesh.normals, matrices).reshape(-1, 3)
+    offsets = np.arange(count, dtype=np.int64)[:, None] * mesh.num_nodes
+    indices = (mesh.indices[None, :] + offsets).ravel()
+    return TriangleMesh(coordinates, indices, normals)
@@ -0,0 +1,652 @@
+# Transform plan for the Copy Scale Rotate Translate Rotate command.
+#
+# This module turns the dialog parameters into the per-copy 4x4 matrices of a
+# pattern in one batched NumPy pass. It deliberately does not import adsk, so
+# the math can be profiled and tested without Fusion 360 running. entry.py
+# reads the dialog into a PlanParameters object and only consumes the finished
+# TransformPlan.
+#
+# Matrices follow the adsk.core.Matrix3D conventions: they are stored row-major
+# (the layout of Matrix3D.asArray() and Matrix3D.setWithArray()), they act on
+# column vectors so the translation lives in column 3, and applying A and then
+# B is B @ A, which is what A.transformBy(B) computes.
+
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import expressions
+
+# Stage modes. entry.py maps the radio button items of each tab onto these.
+CONSTANT = 'constant'
+COMPOUND = 'compound'
+# Translation only: compound the distance and shrink/grow it with the scale.
+COMPOUND_SCALE = 'compound_scale'
+
+IDENTITY_ARRAY = (1.0, 0.0, 0.0, 0.0,
+                  0.0, 1.0, 0.0, 0.0,
+                  0.0, 0.0, 1.0, 0.0,
+                  0.0, 0.0, 0.0, 1.0)
+
+
+@dataclass
+class PlanParameters:
+    """Everything the dialog contributes to the transforms of a pattern.
+
+    Matrices are 16 element row-major sequences as returned by Matrix3D.asArray().
+    Randomization values use the units of the dialog sliders: percent for scale
+    and translation, degrees for the rotations. Scale values are numbers, or
+    expression texts of the copy index k and the copy count n (see
+    expressions.py) for ratios that change from copy to copy. The rotation
+    angles (degrees, about the axis of the rotation matrix through its
+    origin) and translation offsets (cm) do the same when they are given;
+    None uses the matrix.
+    The seed fixes the random draws, so equal parameters give equal plans.
+    """
+    num_copies: int = 1
+    num_bodies: int = 1
+    apply_recursively: bool = False
+    seed: int = 0
+
+    do_scaling: bool = False
+    scale_mode: str = COMPOUND
+    scale_uniformly: bool = True
+    scale_values: Tuple[Union[float, str], Union[float, str], Union[float, str]] = (1.0, 1.0, 1.0)
+    scale_randomization: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+    do_internal_rotation: bool = False
+    internal_rotation_mode: str = CONSTANT
+    internal_rotation: Sequence[float] = IDENTITY_ARRAY
+    internal_rotation_randomization: float = 0.0
+    internal_rotation_angle: Optional[Union[float, str]] = None
+
+    do_translation: bool = False
+    translation_mode: str = COMPOUND_SCALE
+    translation: Sequence[float] = IDENTITY_ARRAY
+    translation_randomization: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    translation_offsets: Tuple[Optional[Union[float, str]], ...] = (None, None, None)
+
+    do_external_rotation: bool = False
+    external_rotation_mode: str = CONSTANT
+    external_rotation: Sequence[float] = IDENTITY_ARRAY
+    external_rotation_randomization: float = 0.0
+    external_rotation_angle: Optional[Union[float, str]] = None
+
+
+@dataclass
+class TransformPlan:
+    """The per-copy transforms of a pattern.
+
+    Every array has one row per copy, indexed the same way as the copy names:
+    row 0 is the copy of the original bodies and rows 1..num_copies are the
+    generated copies. The stages are applied in the order scale, internal
+    rotation, translation, external rotation. The stage arrays hold what each
+    copy iteration applies; net_matrices() holds where each copy ends up.
+    """
+    parameters: PlanParameters
+    scales: np.ndarray              # (num_copies + 1, 3) axis scale factors about the origin
+    internal_rotations: np.ndarray  # (num_copies + 1, 4, 4)
+    translations: np.ndarray        # (num_copies + 1, 4, 4)
+    external_rotations: np.ndarray  # (num_copies + 1, 4, 4)
+
+    @property
+    def num_copies(self) -> int:
+        return len(self.scales) - 1
+
+    def rigid_matrices(self) -> np.ndarray:
+        """Returns the (num_copies + 1, 4, 4) composition of the three rigid stages of each copy.
+
+        Internal rotation, translation and external rotation never change the
+        shape of a body, so they can be applied together with one move feature.
+        """
+        return self.external_rotations @ self.translations @ self.internal_rotations
+
+    def stage_matrices(self) -> np.ndarray:
+        """Returns the (num_copies + 1, 4, 4) composition of all four stages of each copy."""
+        scale_matrices = np.zeros((len(self.scales), 4, 4))
+        scale_matrices[:, [0, 1, 2], [0, 1, 2]] = self.scales
+        scale_matrices[:, 3, 3] = 1.0
+        return self.rigid_matrices() @ scale_matrices
+
+    def net_matrices(self) -> np.ndarray:
+        """Returns the (num_copies + 1, 4, 4) overall transform of each copy.
+
+        When transformations are applied recursively, every iteration also
+        transforms all earlier copies (and the copy of the originals), so copy
+        j ends up with G_n @ ... @ G_j where G_k is the stage matrix of
+        iteration k. Otherwise each copy only gets its own stage matrix.
+        """
+        stages = self.stage_matrices()
+        if not self.parameters.apply_recursively:
+            return stages
+        nets = np.empty_like(stages)
+        current = np.identity(4)
+        for j in range(self.num_copies, 0, -1):
+            current = current @ stages[j]
+            nets[j] = current
+        nets[0] = current
+        return nets
+
+    def net_scales_and_moves(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the net transform of each copy split into one axis scale and one rigid move.
+
+        The (num_copies + 1, 3) scales about the origin are applied first and
+        the (num_copies + 1, 4, 4) moves after them, so every copy can be built
+        with at most one scale and one move feature however the pattern was
+        composed. Returns None when a net transform shears the bodies, which
+        happens when non-uniform scales are applied recursively on top of
+        rotations and no single scale feature can reproduce.
+        """
+        if not self.parameters.apply_recursively:
+            return self.scales, self.rigid_matrices()
+        return split_scales_and_moves(self.net_matrices())
+
+    @property
+    def matrices(self) -> np.ndarray:
+        """Returns the (num_copies + 1, num_bodies, 4, 4) net transform of every copied body.
+
+        All bodies of a copy share the same transform, so the body axis is a
+        read-only broadcast view rather than a materialized array.
+        """
+        stages = self.net_matrices()
+        shape = (stages.shape[0], self.parameters.num_bodies, 4, 4)
+        return np.broadcast_to(stages[:, None, :, :], shape)
+
+
+def build_plan(parameters: PlanParameters) -> TransformPlan:
+    """Computes the transforms of every copy of a pattern in one pass.
+
+    Every stage draws its random values from a generator of its own, seeded
+    with the seed of the parameters, and draws them for all copies in a single
+    call. So the same parameters always give the same plan, a stage's draws do
+    not depend on which other stages are randomized, and adding copies only
+    appends rows: the draws of the first copies stay the same.
+    """
+    n = max(int(parameters.num_copies), 0)
+    return TransformPlan(parameters, **{name: build_stage(name, parameters, n) for name in _STAGE_FIELDS})
+
+
+def build_stage(name: str, parameters: PlanParameters, n: int, start: int = 0) -> np.ndarray:
+    """Returns rows start..n of the stage array name of the plan of parameters with n copies.
+
+    A row only depends on the stage's parameters and the index of its copy
+    (and on n when an expression of the stage uses it), so the rows of a
+    longer plan extend those of a shorter one. Matrices are only computed for
+    the rows asked for.
+    """
+    p = parameters
+    first = max(start, 1)
+    rng = _stage_rng(p, name)
+    if name == 'scales':
+        values = _scale_stage(p, n, rng, first)
+    elif name == 'internal_rotations':
+        values = _rotation_stage(p.do_internal_rotation, p.internal_rotation_mode, p.internal_rotation,
+                                 p.internal_rotation_randomization, n, rng, p.internal_rotation_angle, first)
+    elif name == 'translations':
+        values = _translation_stage(p, n, rng, first)
+    else:
+        values = _rotation_stage(p.do_external_rotation, p.external_rotation_mode, p.external_rotation,
+                                 p.external_rotation_randomization, n, rng, p.external_rotation_angle, first)
+    if start > 0:
+        return values
+    # Row 0, the copy of the original bodies, is never transformed.
+    unit = np.ones((1, 3)) if name == 'scales' else np.identity(4)[None]
+    return np.concatenate([unit, values])
+
+
+# The PlanParameters fields each stage array of a TransformPlan depends on,
+# the seed first and the flag that turns the stage on second.
+_STAGE_FIELDS = {
+    'scales': ('seed', 'do_scaling', 'scale_mode', 'scale_uniformly', 'scale_values', 'scale_randomization'),
+    'internal_rotations': ('seed', 'do_internal_rotation', 'internal_rotation_mode', 'internal_rotation',
+                           'internal_rotation_randomization', 'internal_rotation_angle'),
+    'translations': ('seed', 'do_translation', 'translation_mode', 'translation', 'translation_randomization',
+                     'translation_offsets'),
+    'external_rotations': ('seed', 'do_external_rotation', 'external_rotation_mode', 'external_rotation',
+                           'external_rotation_randomization', 'external_rotation_angle'),
+}
+
+# The PlanParameters fields of each stage that may hold expressions of the copy
+# count n. Every row of such a stage changes with the number of copies.
+_EXPRESSION_FIELDS = {
+    'scales': ('scale_values',),
+    'internal_rotations': ('internal_rotation_angle',),
+    'translations': ('translation_offsets',),
+    'external_rotations': ('external_rotation_angle',),
+}
+
+
+class PlanCache:
+    """Remembers the last plan of a command session and only recomputes what changed.
+
+    Fusion fires a new preview for every input change, including tab switches
+    and resets of values that are already at their defaults. Parameters equal
+    to the last ones return the cached plan as it is. Otherwise only the stages
+    whose parameters changed are built again. The others keep their rows, and
+    adding copies only computes the rows of the new copies, unless an
+    expression of the stage uses the copy count n. Because the draws of a stage only depend
+    on its parameters and the seed, the result is the plan build_plan() would
+    compute, so the preview and the execute of a session agree.
+    """
+
+    def __init__(self):
+        self.parameters: Optional[PlanParameters] = None
+        self.plan: Optional[TransformPlan] = None
+
+    def get(self, parameters: PlanParameters) -> Tuple[TransformPlan, int]:
+        """Returns the plan for parameters and the first row whose net transform changed.
+
+        The row is num_copies + 1 when the plan is identical to the previous
+        one, and 0 when nothing could be reused.
+        """
+        previous = self.plan
+        if previous is not None and parameters == self.parameters:
+            return previous, previous.num_copies + 1
+
+        n = max(int(parameters.num_copies), 0)
+        stages = {}
+        reused = 0
+        for name in _STAGE_FIELDS:
+            if previous is not None and _stage_key(name, parameters) == _stage_key(name, self.parameters):
+                stage_rows = getattr(previous, name)[:n + 1]
+                if len(stage_rows) < n + 1:
+                    stage_rows = np.concatenate([stage_rows, build_stage(name, parameters, n, len(stage_rows))])
+                stages[name] = stage_rows
+                reused += 1
+            else:
+                stages[name] = build_stage(name, parameters, n)
+        plan = TransformPlan(parameters, **stages)
+
+        first_changed_row = 0
+        if previous is not None:
+            rows = min(previous.num_copies, plan.num_copies) + 1
+            if reused == len(_STAGE_FIELDS) and not (parameters.apply_recursively or self.parameters.apply_recursively):
+                # Every copy only has its own stage matrix, and none of them changed.
+                first_changed_row = rows
+            else:
+                changed = np.any(plan.net_matrices()[:rows] != previous.net_matrices()[:rows], axis=(1, 2))
+                first_changed_row = int(np.argmax(changed)) if np.any(changed) else rows
+
+        self.parameters = parameters
+        self.plan = plan
+        return plan, first_changed_row
+
+    def clear(self):
+        self.parameters = None
+        self.plan = None
+
+
+def _stage_key(name: str, p: PlanParameters) -> tuple:
+    switch = _STAGE_FIELDS[name][1]
+    if not getattr(p, switch):
+        # A stage that is turned off leaves every copy unchanged, whatever its other parameters.
+        return (switch, False)
+    key = tuple(getattr(p, field) for field in _STAGE_FIELDS[name])
+    expression_fields = _EXPRESSION_FIELDS[name]
+    if name == 'translations' and p.translation_mode == COMPOUND_SCALE:
+        # The scaled translation series also follows the scale ratios.
+        key += (p.do_scaling, p.scale_values)
+        expression_fields += ('scale_values',)
+    if _uses_copy_count(getattr(p, field) for field in expression_fields):
+        key += (p.num_copies,)
+    return key
+
+
+def _uses_copy_count(values) -> bool:
+    # True if any of the values, or of the values in the tuples among them, is an expression of n.
+    for value in values:
+        if isinstance(value, tuple):
+            if _uses_copy_count(value):
+                return True
+        elif isinstance(value, str) and 'n' in expressions.compile_expression(value).variables:
+            return True
+    return False
+
+
+def split_scales_and_moves(matrices: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Splits (num_matrices, 4, 4) matrices into axis scales about the origin followed by rigid moves.
+
+    Returns the (num_matrices, 3) scales and (num_matrices, 4, 4) moves with
+    matrices == moves @ diag(scales), or None when any matrix shears.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    linear = matrices[:, :3, :3]
+    gram = linear.transpose(0, 2, 1) @ linear
+    squared = np.diagonal(gram, axis1=1, axis2=2)
+    off_diagonal = gram - squared[:, :, None] * np.identity(3)
+    if len(matrices) > 0 and not np.allclose(off_diagonal, 0.0, rtol=0.0, atol=1e-9 * squared.max()):
+        return None
+    scales = np.sqrt(squared)
+    # A mirroring matrix keeps its mirror in the scale, so the move stays a rotation.
+    scales[:, 2] *= np.sign(np.linalg.det(linear))
+    moves = matrices.copy()
+    moves[:, :3, :3] = linear / scales[:, None, :]
+    return scales, moves
+
+
+def copy_sizes(matrices: np.ndarray, source_size: float) -> np.ndarray:
+    """Returns the approximate size of a source of source_size under each (num_matrices, 4, 4) matrix.
+
+    The size follows the cube root of the determinant, the average factor by
+    which a matrix scales lengths, so a copy flattened along one axis counts
+    as small too.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    return np.cbrt(np.abs(np.linalg.det(matrices[:, :3, :3]))) * source_size
+
+
+def is_identity(matrix: np.ndarray) -> bool:
+    """Returns True if a 4x4 matrix (or a 3 element scale) would leave a body unchanged."""
+    matrix = np.asarray(matrix)
+    if matrix.shape == (3,):
+        return bool(np.allclose(matrix, 1.0, rtol=0.0, atol=1e-12))
+    return bool(np.allclose(matrix, np.identity(4), rtol=0.0, atol=1e-12))
+
+
+def is_rigid(matrix: np.ndarray) -> bool:
+    """Returns True if a 4x4 matrix only rotates and translates."""
+    return bool(rigid_rows(matrix)[0])
+
+
+def is_similarity(matrix: np.ndarray) -> bool:
+    """Returns True if a 4x4 matrix only rotates, translates and scales uniformly.
+
+    Non-uniform scales composed with rotations shear a body, which only the
+    parametric scale feature (applied before the rotation) can reproduce.
+    """
+    return bool(similarity_rows(matrix)[0])
+
+
+def rigid_rows(matrices: np.ndarray) -> np.ndarray:
+    """Returns whether each of (num_matrices, 4, 4) matrices only rotates and translates, see is_rigid()."""
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    rotations = matrices[:, :3, :3]
+    gram = rotations.transpose(0, 2, 1) @ rotations
+    return (np.all(np.isclose(matrices[:, 3], (0.0, 0.0, 0.0, 1.0)), axis=1)
+            & np.all(np.isclose(gram, np.identity(3), atol=1e-9), axis=(1, 2))
+            & (np.linalg.det(rotations) > 0))
+
+
+def similarity_rows(matrices: np.ndarray) -> np.ndarray:
+    """Returns whether each of (num_matrices, 4, 4) matrices only rotates, translates and scales uniformly, see is_similarity()."""
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    linear = matrices[:, :3, :3]
+    gram = linear.transpose(0, 2, 1) @ linear
+    factors = np.trace(gram, axis1=1, axis2=2)[:, None, None] / 3
+    return (np.all(np.isclose(matrices[:, 3], (0.0, 0.0, 0.0, 1.0)), axis=1)
+            & (factors[:, 0, 0] > 0)
+            & np.all(np.abs(gram - factors * np.identity(3)) <= 1e-9 * factors, axis=(1, 2)))
+
+
+def _base_scale(p: PlanParameters) -> np.ndarray:
+    # A zero ratio cannot be scaled by, so it leaves the bodies at their original size.
+    values = np.asarray(p.scale_values, dtype=float)
+    if (not p.do_scaling) or np.any(values == 0):
+        return np.ones(3)
+    return values
+
+
+def _has_per_copy_scale(p: PlanParameters) -> bool:
+    return p.do_scaling and any(isinstance(value, str) for value in p.scale_values)
+
+
+def _scale_ratios(p: PlanParameters, n: int) -> np.ndarray:
+    """Returns the (n, 3) ratios of copies 1..n, evaluating the scale expressions for all copies at once."""
+    ratios = np.stack([expressions.evaluate(value, n) for value in p.scale_values], axis=1)
+    ratios[np.any(ratios == 0, axis=1)] = 1.0
+    return ratios
+
+
+def _scale_stage(p: PlanParameters, n: int, rng: np.random.Generator, first: int = 1) -> np.ndarray:
+    # The (n - first + 1, 3) scales of copies first..n.
+    count = max(n - first + 1, 0)
+    if not p.do_scaling or count == 0:
+        return np.ones((count, 3))
+
+    if _has_per_copy_scale(p):
+        # Compounding multiplies the ratios of all copies up to and including each copy.
+        ratios = _scale_ratios(p, n)
+        values = (np.cumprod(ratios, axis=0) if p.scale_mode == COMPOUND else ratios)[first - 1:]
+    elif p.scale_mode == COMPOUND:
+        values = _scale_powers(_base_scale(p), n, first)
+    else:
+        values = np.tile(_base_scale(p), (count, 1))
+
+    randomization = np.asarray(p.scale_randomization, dtype=float) / 100
+    if np.any(randomization > 0):
+        # The draws of the first copies do not depend on n, so only the last rows are used.
+        draws = rng.uniform(-1.0, 1.0, (n, 3))[first - 1:]
+        if p.scale_uniformly:
+            values *= (1 + draws[:, 0] * randomization[0])[:, None]
+        else:
+            values *= 1 + draws * randomization
+    return values
+
+
+def _rotation_stage(enabled: bool, mode: str, matrix: Sequence[float], randomization: float,
+                    n: int, rng: np.random.Generator, angle: Optional[Union[float, str]] = None,
+                    first: int = 1) -> np.ndarray:
+    # The (n - first + 1, 4, 4) rotations of copies first..n.
+    count = max(n - first + 1, 0)
+    if not enabled or count == 0:
+        return np.tile(np.identity(4), (count, 1, 1))
+
+    base = _as_matrix(matrix)
+    if angle is not None:
+        values = _angle_rotations(base, angle, mode, n, first)
+    elif mode == COMPOUND:
+        values = _matrix_powers(base, n, first)
+    else:
+        values = np.tile(base, (count, 1, 1))
+
+    if randomization > 0:
+        # One draw per copy: the angle fraction and two coordinates of the axis on the sphere.
+        draws = rng.random((n, 3))[first - 1:]
+        angles = np.radians(draws[:, 0] * randomization)
+        values = _axis_angle_matrices(_sphere_points(draws[:, 1:]), angles) @ values
+    return values
+
+
+def _translation_stage(p: PlanParameters, n: int, rng: np.random.Generator, first: int = 1) -> np.ndarray:
+    # The (n - first + 1, 4, 4) translations of copies first..n.
+    count = max(n - first + 1, 0)
+    if not p.do_translation or count == 0:
+        return np.tile(np.identity(4), (count, 1, 1))
+
+    base = _as_matrix(p.translation)
+    offset = base[:3, 3]
+    if any(value is not None for value in p.translation_offsets):
+        # Per-copy offsets are compounded by summing them, like the triad offset.
+        offsets = _translation_offsets(p, n)
+        values = np.tile(np.identity(4), (count, 1, 1))
+        if p.translation_mode == COMPOUND:
+            values[:, :3, 3] = np.cumsum(offsets, axis=0)[first - 1:]
+        elif p.translation_mode == COMPOUND_SCALE:
+            values[:, :3, 3] = np.cumsum(offsets * _previous_scale_products(p, n), axis=0)[first - 1:]
+        else:
+            values[:, :3, 3] = offsets[first - 1:]
+        offset = offsets[first - 1:]
+    elif p.translation_mode == COMPOUND:
+        values = _matrix_powers(base, n, first)
+    elif p.translation_mode == COMPOUND_SCALE:
+        # Each step is scaled like the body it moves, so the distances form a
+        # geometric series: offset * (1 + s + s^2 + ... + s^(k-1)).
+        values = np.tile(np.identity(4), (count, 1, 1))
+        values[:, :3, 3] = offset * _scale_series(p, n, first)
+    else:
+        values = np.tile(base, (count, 1, 1))
+
+    randomization = np.asarray(p.translation_randomization, dtype=float) / 100
+    if np.any(randomization > 0):
+        values[:, :3, 3] += offset * randomization * rng.uniform(-1.0, 1.0, (n, 3))[first - 1:]
+    return values
+
+
+def _angle_rotations(matrix: np.ndarray, angle: Union[float, str], mode: str, n: int, first: int = 1) -> np.ndarray:
+    """Returns the (n - first + 1, 4, 4) rotations of copies first..n by the per-copy angle (degrees) about the axis of matrix.
+
+    The axis passes through the origin of the triad, the translation of
+    matrix, so each rotation is T R T^-1 for the translation T to that origin.
+    A matrix without a rotation has no axis of its own, so the copies turn
+    about Z. Compounding a rotation about a fixed axis adds up its angles.
+    """
+    axis, matrix_angle = _rotation_axis_angle(matrix[:3, :3])
+    if matrix_angle == 0.0:
+        axis = np.array([0.0, 0.0, 1.0])
+    angles = np.radians(expressions.evaluate(angle, n))
+    if mode == COMPOUND:
+        angles = np.cumsum(angles)
+    angles = angles[first - 1:]
+    rotations = _axis_angle_matrices(np.tile(axis, (len(angles), 1)), angles)
+    origin = matrix[:3, 3]
+    rotations[:, :3, 3] = origin - rotations[:, :3, :3] @ origin
+    return rotations
+
+
+def _translation_offsets(p: PlanParameters, n: int) -> np.ndarray:
+    # The (n, 3) offsets of copies 1..n, taking the axes without an expression from the triad.
+    triad_offset = _as_matrix(p.translation)[:3, 3]
+    return np.stack([expressions.evaluate(triad_offset[axis] if value is None else value, n)
+                     for axis, value in enumerate(p.translation_offsets)], axis=1)
+
+
+def _as_matrix(values: Sequence[float]) -> np.ndarray:
+    return np.asarray(values, dtype=float).reshape(4, 4)
+
+
+def _scale_powers(base: np.ndarray, n: int, first: int = 1) -> np.ndarray:
+    k = np.arange(first, n + 1, dtype=float)[:, None]
+    return base[None, :] ** k
+
+
+def _matrix_powers(matrix: np.ndarray, n: int, first: int = 1) -> np.ndarray:
+    """Returns the (n - first + 1, 4, 4) stack matrix^first .. matrix^n.
+
+    The triads only produce rigid transforms, whose powers have a closed form:
+    R^k is the same axis turned by k times the angle and the translation of
+    copy k is the sum of R^i t for i < k, a geometric series of rotations.
+    Anything else falls back to prefix products, so the whole stack costs O(n)
+    instead of O(n^2) products.
+    """
+    if is_rigid(matrix):
+        return _rigid_powers(matrix, n, first)
+    return _prefix_products(matrix, n)[first - 1:]
+
+
+def _rigid_powers(matrix: np.ndarray, n: int, first: int = 1) -> np.ndarray:
+    axis, angle = _rotation_axis_angle(matrix[:3, :3])
+    k = np.arange(first, n + 1, dtype=float)
+    powers = _axis_angle_matrices(np.tile(axis, (len(k), 1)), k * angle)
+    # M^k = [R^k | t + R t + ... + R^(k-1) t]. The part of t along the axis
+    # adds up k times. The part across it turns in the plane of the rotation,
+    # R^i u = cos(i a) u + sin(i a) (axis x u), and the sums of cos(i a) and
+    # sin(i a) over i < k have a closed form, so every row stands on its own.
+    offset = matrix[:3, 3]
+    along = np.dot(axis, offset) * axis
+    across = offset - along
+    half = angle / 2
+    if abs(np.sin(half)) < 1e-12:
+        cos_sums, sin_sums = k, np.zeros_like(k)
+    else:
+        ratios = np.sin(k * half) / np.sin(half)
+        cos_sums = ratios * np.cos((k - 1) * half)
+        sin_sums = ratios * np.sin((k - 1) * half)
+    powers[:, :3, 3] = (k[:, None] * along + cos_sums[:, None] * across
+                        + sin_sums[:, None] * np.cross(axis, across))
+    return powers
+
+
+def _prefix_products(matrix: np.ndarray, n: int) -> np.ndarray:
+    powers = np.empty((n, 4, 4))
+    current = np.identity(4)
+    for k in range(n):
+        current = matrix @ current
+        powers[k] = current
+    return powers
+
+
+def _rotation_axis_angle(rotation: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Returns the unit axis and the angle (radians, 0..pi) of a 3x3 rotation."""
+    cos_angle = float(np.clip((np.trace(rotation) - 1) / 2, -1.0, 1.0))
+    skew = np.array([rotation[2, 1] - rotation[1, 2],
+                     rotation[0, 2] - rotation[2, 0],
+                     rotation[1, 0] - rotation[0, 1]])
+    norm = np.linalg.norm(skew)
+    # skew = 2 sin(angle) axis; atan2 keeps small angles accurate where arccos would not.
+    angle = float(np.arctan2(norm / 2, cos_angle))
+    if cos_angle >= 0:
+        if norm < 1e-12:
+            return np.array([1.0, 0.0, 0.0]), 0.0
+        return skew / norm, angle
+
+    # Past 90 degrees the skew part shrinks towards zero, so read the axis
+    # from the symmetric part a a^T = (sym(R) - cos I) / (1 - cos) instead
+    # and only take its sign from the skew part.
+    outer = ((rotation + rotation.T) / 2 - cos_angle * np.identity(3)) / (1 - cos_angle)
+    column = int(np.argmax(np.diag(outer)))
+    axis = outer[:, column] / np.sqrt(outer[column, column])
+    if np.dot(axis, skew) < 0:
+        axis = -axis
+    return axis, angle
+
+
+def _scale_series(p: PlanParameters, n: int, first: int = 1) -> np.ndarray:
+    # The (n - first + 1, 3) sums 1 + s_1 + s_1 s_2 + ... + s_1 ... s_(k-1) of
+    # the step ratios s of copies first..n, which is the geometric series when
+    # every ratio is the same.
+    if not _has_per_copy_scale(p):
+        return _geometric_series(_base_scale(p), n, first)
+    return np.cumsum(_previous_scale_products(p, n), axis=0)[first - 1:]
+
+
+def _previous_scale_products(p: PlanParameters, n: int) -> np.ndarray:
+    # The (n, 3) products s_1 ... s_(k-1) of the step ratios before each copy k.
+    if _has_per_copy_scale(p):
+        products = np.cumprod(_scale_ratios(p, n), axis=0)
+    else:
+        products = _scale_powers(_base_scale(p), n)
+    return np.vstack([np.ones((1, 3)), products[:-1]])
+
+
+def _geometric_series(ratio: np.ndarray, n: int, first: int = 1) -> np.ndarray:
+    k = np.arange(first, n + 1, dtype=float)[:, None]
+    unit = ratio[None, :] == 1
+    safe_ratio = np.where(unit, 2.0, ratio)[None, :]
+    return np.where(unit, k, (safe_ratio ** k - 1) / (safe_ratio - 1))
+
+
+def _stage_rng(p: PlanParameters, name: str) -> np.random.Generator:
+    # The generator of one stage, seeded with the plan seed and the stage's position.
+    return np.random.default_rng((int(p.seed), list(_STAGE_FIELDS).index(name)))
+
+
+def _sphere_points(uniform: np.ndarray) -> np.ndarray:
+    # Maps (n, 2) uniform [0, 1) draws to (n, 3) points spread uniformly over
+    # the unit sphere: z is uniform in [-1, 1] (Archimedes) and so is the
+    # longitude, so no draw is rejected.
+    z = 2.0 * uniform[:, 0] - 1.0
+    longitude = 2.0 * np.pi * uniform[:, 1]
+    radius = np.sqrt(np.maximum(1.0 - z * z, 0.0))
+    return np.stack([radius * np.cos(longitude), radius * np.sin(longitude), z], axis=1)
+
+
+def _axis_angle_matrices(axes: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """Returns the (n, 4, 4) rotations about the origin by angles (radians) around axes."""
+    axes = axes / np.linalg.norm(axes, axis=1)[:, None]
+    x, y, z = axes[:, 0], axes[:, 1], axes[:, 2]
+    c = np.cos(angles)
+    s = np.sin(angles)
+    t = 1 - c
+    matrices = np.zeros((len(angles), 4, 4))
+    matrices[:, 0, 0] = t * x * x + c
+    matrices[:, 0, 1] = t * x * y - s * z
+    matrices[:, 0, 2] = t * x * z + s * y
+    matrices[:, 1, 0] = t * x * y + s * z
+    matrices[:, 1, 1] = t * y * y + c
+    matrices[:, 1, 2] = t * y * z - s * x
+    matrices[:, 2, 0] = t * x * z - s * y
+    matrices[:, 2, 1] = t * y * z + s * x
+    matrices[:, 2, 2] = t * z * z + c
+    matrices[:, 3, 3] = 1.0
+    return matrices
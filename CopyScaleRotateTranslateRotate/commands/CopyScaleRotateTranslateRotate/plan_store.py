@@ -0,0 +1,208 @@
+# On-disk transform plans for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. A stored plan is a pair of
+# files: NAME.json, a small header with the format version, the key the plan
+# was computed from (the plan parameters, seed included, and any fractal
+# settings) and the shape of the matrices, and NAME.f8, the raw little-endian
+# float64 (num_instances, 4, 4) net matrices. The matrices are written once, a
+# chunk at a time, and read back as a read-only memory map, so a plan is
+# replayed without recomputing it. Consumers that walk it with row_chunks()
+# only ever hold one chunk of it in memory.
+#
+# The add-in keeps the large fractal expansions it computes in a folder of
+# its own (save, load and prune), and the dialog can save the current plan
+# to a file of the user's choosing and replay it later (write and read).
+
+import dataclasses
+import hashlib
+import json
+import os
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from . import plan
+
+FORMAT = 'CopyScaleRotateTranslateRotate plan'
+VERSION = 1
+DTYPE = np.dtype('<f8')
+
+# The header is written last, so matrices without a header are an unfinished
+# write and are never read.
+_HEADER_SUFFIX = '.json'
+_MATRICES_SUFFIX = '.f8'
+
+# Rows of a stored plan read at once by row_chunks().
+CHUNK_ROWS = 65536
+
+
+class PlanStoreError(ValueError):
+    """Raised for a stored plan that cannot be read or does not match its header."""
+
+
+@dataclasses.dataclass
+class StoredPlan:
+    """A plan read back from disk."""
+    header: dict
+    matrices: np.ndarray  # (num_instances, 4, 4) read-only memory map of the net matrices
+
+    @property
+    def num_instances(self) -> int:
+        return len(self.matrices)
+
+    def generations(self) -> np.ndarray:
+        """Returns the (num_instances,) generation of each instance.
+
+        Instances are stored in generation order, so the header only keeps
+        the number of instances per generation. Without it every instance is
+        a generation of its own.
+        """
+        counts = self.header.get('generation_counts')
+        if counts is None:
+            return np.arange(self.num_instances)
+        return np.repeat(np.arange(len(counts)), counts)
+
+
+def plan_key(parameters: plan.PlanParameters, **settings) -> dict:
+    """Returns the JSON normalized key of a plan: its parameters and any further settings."""
+    key = {'parameters': dataclasses.asdict(parameters), 'settings': settings}
+    return json.loads(json.dumps(key, sort_keys=True))
+
+
+def path_for(folder: str, key: dict) -> str:
+    """Returns the path of the stored plan of key, without a suffix."""
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(folder, 'plan_' + digest)
+
+
+def save(folder: str, key: dict, matrices: np.ndarray, generation_counts: Optional[Sequence[int]] = None) -> StoredPlan:
+    """Writes the (num_instances, 4, 4) matrices of key and returns them read back from disk."""
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    return save_chunks(folder, key, len(matrices), [matrices], generation_counts)
+
+
+def save_chunks(folder: str, key: dict, num_instances: int, chunks: Iterable[np.ndarray],
+                generation_counts: Optional[Sequence[int]] = None) -> StoredPlan:
+    """Writes num_instances matrices, given as consecutive (rows, 4, 4) chunks, and returns them read back from disk.
+
+    Only one chunk is held in memory at a time, so plans far larger than
+    memory can be generated straight to disk.
+    """
+    os.makedirs(folder, exist_ok=True)
+    return write(path_for(folder, key), key, num_instances, chunks, generation_counts)
+
+
+def write(path: str, key: dict, num_instances: int, chunks: Iterable[np.ndarray],
+          generation_counts: Optional[Sequence[int]] = None) -> StoredPlan:
+    """Writes a plan to path, with or without a suffix, and returns it read back from disk.
+
+    See save_chunks() for the chunks.
+    """
+    path = _without_suffix(path)
+    # A previous header would describe matrices that are about to change.
+    if os.path.exists(path + _HEADER_SUFFIX):
+        os.remove(path + _HEADER_SUFFIX)
+    written = 0
+    if num_instances > 0:
+        matrices = np.memmap(path + _MATRICES_SUFFIX, dtype=DTYPE, mode='w+', shape=(num_instances, 4, 4))
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype=float).reshape(-1, 4, 4)
+            if written + len(chunk) > num_instances:
+                raise PlanStoreError(f'more than the {num_instances} matrices announced were written')
+            matrices[written:written + len(chunk)] = chunk
+            written += len(chunk)
+        matrices.flush()
+        del matrices
+    else:
+        open(path + _MATRICES_SUFFIX, 'wb').close()
+    if written != num_instances:
+        raise PlanStoreError(f'{written} of the {num_instances} matrices announced were written')
+
+    header = {
+        'format': FORMAT,
+        'version': VERSION,
+        'dtype': DTYPE.str,
+        'shape': [num_instances, 4, 4],
+        'key': key,
+        'generation_counts': None if generation_counts is None else [int(count) for count in generation_counts],
+    }
+    with open(path + _HEADER_SUFFIX, 'w') as file:
+        json.dump(header, file, indent=1)
+    return read(path)
+
+
+def load(folder: str, key: dict) -> Optional[StoredPlan]:
+    """Returns the stored plan of key, or None if there is none that can be read."""
+    path = path_for(folder, key)
+    if not os.path.exists(path + _HEADER_SUFFIX):
+        return None
+    try:
+        stored = read(path)
+    except (OSError, PlanStoreError):
+        return None
+    # Two keys that share a digest are told apart by the key in the header.
+    return stored if stored.header.get('key') == key else None
+
+
+def read(path: str) -> StoredPlan:
+    """Reads the stored plan at path, with or without a suffix, mapping its matrices instead of loading them."""
+    path = _without_suffix(path)
+    try:
+        with open(path + _HEADER_SUFFIX) as file:
+            header = json.load(file)
+    except ValueError as error:
+        raise PlanStoreError(f'{path}{_HEADER_SUFFIX} is not a plan header: {error}') from None
+    if header.get('format') != FORMAT or header.get('version') != VERSION:
+        raise PlanStoreError(f'{path}{_HEADER_SUFFIX} is not a version {VERSION} plan')
+    if header.get('dtype') != DTYPE.str:
+        raise PlanStoreError(f'{path}{_HEADER_SUFFIX} stores {header.get("dtype")} matrices')
+    shape = tuple(header.get('shape') or ())
+    if len(shape) != 3 or shape[1:] != (4, 4):
+        raise PlanStoreError(f'{path}{_HEADER_SUFFIX} has matrices of shape {shape}')
+    if os.path.getsize(path + _MATRICES_SUFFIX) != int(np.prod(shape)) * DTYPE.itemsize:
+        raise PlanStoreError(f'{path}{_MATRICES_SUFFIX} does not hold the {shape[0]} matrices of its header')
+    if shape[0] == 0:
+        return StoredPlan(header, np.empty(shape, dtype=DTYPE))
+    return StoredPlan(header, np.memmap(path + _MATRICES_SUFFIX, dtype=DTYPE, mode='r', shape=shape))
+
+
+def row_chunks(matrices: np.ndarray, rows: Optional[Sequence[int]] = None,
+               chunk_rows: int = CHUNK_ROWS) -> Iterable[np.ndarray]:
+    """Yields the (rows, 4, 4) matrices of rows, all of them by default, chunk_rows at a time.
+
+    Indexing a memory map with all rows at once would read the whole plan into
+    memory, so its consumers go through it a chunk at a time instead.
+    """
+    if rows is None:
+        rows = range(len(matrices))
+    if isinstance(rows, range) and rows.step == 1:
+        # Consecutive rows are sliced, without an array of their indices.
+        for start in range(rows.start, rows.stop, chunk_rows):
+            yield np.asarray(matrices[start:min(start + chunk_rows, rows.stop)], dtype=float)
+        return
+    rows = np.asarray(rows, dtype=np.int64)
+    for start in range(0, len(rows), chunk_rows):
+        yield np.asarray(matrices[rows[start:start + chunk_rows]], dtype=float).reshape(-1, 4, 4)
+
+
+def prune(folder: str, keep: int):
+    """Removes all but the keep most recently written plans of folder."""
+    try:
+        names = [name for name in os.listdir(folder) if name.startswith('plan_') and name.endswith(_HEADER_SUFFIX)]
+    except OSError:
+        return
+    paths = sorted((os.path.join(folder, name[:-len(_HEADER_SUFFIX)]) for name in names),
+                   key=lambda path: os.path.getmtime(path + _HEADER_SUFFIX), reverse=True)
+    for path in paths[max(keep, 0):]:
+        for suffix in (_HEADER_SUFFIX, _MATRICES_SUFFIX):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+
+
+def _without_suffix(path: str) -> str:
+    for suffix in (_HEADER_SUFFIX, _MATRICES_SUFFIX):
+        if path.lower().endswith(suffix):
+            return path[:-len(suffix)]
+    return path
@@ -0,0 +1,84 @@
+# Preview latency budget for the Copy Scale Rotate Translate Rotate command.
+#
+# A body based preview of a heavy selection can take tens of seconds, and
+# Fusion runs it again on every input change. The preview therefore builds
+# copies at full fidelity only while it expects to stay within a time budget,
+# and draws the remaining copies as lightweight graphics instead.
+
+import time
+from typing import Dict, Optional
+
+# Copies that are always built at full fidelity, so there is something to
+# measure the cost of a copy with.
+MINIMUM_FULL_COPIES = 3
+
+
+class PreviewBudget:
+    """Tracks the time spent by one preview against its budget."""
+
+    def __init__(self, budget_seconds: float, minimum_copies: int = MINIMUM_FULL_COPIES):
+        """
+        Arguments:
+        budget_seconds -- The time the preview may take. Zero or less means no limit.
+        minimum_copies -- The copies that are built whatever they cost.
+        """
+        self.budget_seconds = budget_seconds
+        self.minimum_copies = minimum_copies
+        self.start = time.perf_counter()
+
+    @property
+    def is_limited(self) -> bool:
+        return self.budget_seconds > 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def allows_another(self, copies_built: int) -> bool:
+        """Returns True if one more copy is expected to fit in the budget.
+
+        The cost of the next copy is predicted as the average cost of the
+        copies built so far.
+        """
+        if not self.is_limited or copies_built < self.minimum_copies:
+            return True
+        elapsed = self.elapsed
+        return elapsed + elapsed / copies_built <= self.budget_seconds
+
+
+class CopyCostModel:
+    """Remembers how long one copy took to build with each output mode.
+
+    Backends that build all copies in one batch cannot stop half way, so they
+    use the cost measured by earlier previews to decide up front how many
+    copies fit in the budget.
+    """
+
+    def __init__(self):
+        self._seconds_per_copy: Dict[str, float] = {}
+
+    def record(self, mode: str, copies: int, seconds: float):
+        if copies <= 0:
+            return
+        measured = seconds / copies
+        previous = self._seconds_per_copy.get(mode)
+        # Smooth the estimate, since the first preview also pays one-off costs.
+        self._seconds_per_copy[mode] = measured if previous is None else (previous + measured) / 2
+
+    def estimate(self, mode: str) -> Optional[float]:
+        return self._seconds_per_copy.get(mode)
+
+    def affordable_copies(self, mode: str, budget: PreviewBudget, total: int) -> int:
+        """Returns how many of total copies are expected to fit in the remaining budget."""
+        seconds_per_copy = self.estimate(mode)
+        if not budget.is_limited:
+            return total
+        if seconds_per_copy is None:
+            # Nothing measured yet: build the minimum and learn from it.
+            return min(total, budget.minimum_copies)
+        remaining = budget.budget_seconds - budget.elapsed
+        affordable = int(remaining / seconds_per_copy) if seconds_per_copy > 0 else total
+        return min(total, max(budget.minimum_copies, affordable))
+
+    def clear(self):
+        self._seconds_per_copy.clear()
@@ -0,0 +1,95 @@
+# Per-phase timing for the Copy Scale Rotate Translate Rotate command.
+#
+# Like plan.py this module does not import adsk. A Profile is started for every
+# preview and execute, and the command wraps each of its phases (copying
+# bodies, scale and move features, removing the originals, interference, ...)
+# in Profile.phase(). Entering a phase costs two perf_counter() calls, so the
+# profiler is cheap enough to leave on: a slow preview can always be
+# attributed to the phase that got slower.
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class PhaseStats:
+    """What one phase of a command invocation cost."""
+    seconds: float = 0.0
+    calls: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)  # for example bodies or features created
+
+
+class Profile:
+    """The phases of one command invocation, in the order they were first entered."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.finished = None
+        self.phases: Dict[str, PhaseStats] = {}
+        # The phase the code is currently in, if any, see api_trace.ApiTrace.
+        self.active_phase = None
+
+    @contextmanager
+    def phase(self, name: str, **counts: int):
+        """Times the wrapped code as one call of the phase name and adds counts to it."""
+        outer_phase = self.active_phase
+        start = self.enter(name)
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, **counts)
+            self.active_phase = outer_phase
+
+    def enter(self, name: str) -> float:
+        """Enters the phase name and returns its start time, for phases ended with add()."""
+        self.active_phase = name
+        return time.perf_counter()
+
+    def add(self, name: str, seconds: float = 0.0, calls: int = 1, **counts: int):
+        """Adds calls taking seconds in total and counts to the phase name."""
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+        stats.seconds += seconds
+        stats.calls += calls
+        if self.active_phase == name:
+            self.active_phase = None
+        for key, value in counts.items():
+            stats.counts[key] = stats.counts.get(key, 0) + value
+
+    def count(self, name: str, **counts: int):
+        """Adds counts to the phase name without timing a call."""
+        self.add(name, calls=0, **counts)
+
+    def finish(self):
+        """Stops the clock of the whole invocation."""
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    @property
+    def total_seconds(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.start
+
+    def report_lines(self) -> List[str]:
+        """Returns one line for the invocation and one per phase, slowest phase first."""
+        total = self.total_seconds
+        lines = [f'{self.name}: {total:.3f} s']
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].seconds):
+            share = 100.0 * stats.seconds / total if total > 0 else 0.0
+            counts = ''.join(f', {value} {key}' for key, value in stats.counts.items())
+            lines.append(f'  {name}: {stats.seconds:.3f} s ({share:.0f}%), {stats.calls} calls{counts}')
+        return lines
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'started': self.started,
+            'seconds': self.total_seconds,
+            'phases': {name: {'seconds': stats.seconds, 'calls': stats.calls, 'counts': dict(stats.counts)}
+                       for name, stats in self.phases.items()},
+        }
@@ -0,0 +1,117 @@
+# Proxy bodies for the preview of the Copy Scale Rotate Translate Rotate command.
+#
+# A quick preview can stand in a cube, a sphere or the bounding box of the
+# selection for the selected bodies. The proxies are sized from the selection,
+# so the spacing and interference of the pattern match the real geometry. Each
+# proxy solid is built once per command session as a transient BRep and
+# reused, so a preview only has to add it to the design instead of creating a
+# sketch, a profile and an extrude or revolve feature every time.
+
+from typing import Dict, Optional
+
+import adsk.core, adsk.fusion
+import numpy as np
+
+from ...lib import fusion360utils as futil
+from .interference import CUBE, SPHERE
+
+BOUNDING_BOX = 'bounding box'
+
+# The edge length of the cube and the radius of the sphere without a selection.
+DEFAULT_SIZE = 0.5
+
+# Transient proxy solids by kind and shape. The selection does not change
+# while the command dialog is open, so each is only built once.
+_proxy_cache: Dict[tuple, adsk.fusion.BRepBody] = {}
+
+
+def proxy_shape(kind: str, minimum: Optional[np.ndarray] = None, maximum: Optional[np.ndarray] = None) -> np.ndarray:
+    """Returns the 4x4 matrix that maps the unit proxy onto the proxy of a selection.
+
+    The unit proxies are the cube [0, 1]^3 and the sphere of radius 1 around
+    the origin. The bounding box proxy is the box of the selection, the cube
+    has the box's largest edge and the sphere passes through its corners, both
+    centred on the box. Without a selection the cube spans [0, DEFAULT_SIZE]^3
+    and the sphere has radius DEFAULT_SIZE around the origin.
+
+    Arguments:
+    kind -- CUBE, SPHERE or BOUNDING_BOX.
+    minimum -- The lower corner of the selection's bounding box.
+    maximum -- The upper corner of the selection's bounding box.
+    """
+    shape = np.identity(4)
+    if minimum is None or maximum is None:
+        shape[:3, :3] *= DEFAULT_SIZE
+        return shape
+    minimum = np.asarray(minimum, dtype=float)
+    maximum = np.asarray(maximum, dtype=float)
+    extents = np.maximum(maximum - minimum, 1e-6)
+    centre = (minimum + maximum) / 2
+    if kind == BOUNDING_BOX:
+        shape[:3, :3] = np.diag(extents)
+        shape[:3, 3] = minimum
+    elif kind == SPHERE:
+        shape[:3, :3] *= np.linalg.norm(extents) / 2
+        shape[:3, 3] = centre
+    else:
+        shape[:3, :3] *= extents.max()
+        shape[:3, 3] = centre - extents.max() / 2
+    return shape
+
+
+def interference_kind(kind: str) -> str:
+    """Returns the interference test, CUBE or SPHERE, that applies to a proxy.
+
+    A bounding box proxy is a stretched cube, so it is tested as one.
+    """
+    return SPHERE if kind == SPHERE else CUBE
+
+
+def get_proxy(kind: str, shape: np.ndarray) -> adsk.fusion.BRepBody:
+    """Returns the (cached) transient solid of a proxy."""
+    key = (kind, tuple(np.round(shape.ravel(), 9)))
+    proxy = _proxy_cache.get(key)
+    if proxy is None:
+        temp_brep_manager = adsk.fusion.TemporaryBRepManager.get()
+        if kind == SPHERE:
+            centre = adsk.core.Point3D.create(*(float(value) for value in shape[:3, 3]))
+            proxy = temp_brep_manager.createSphere(centre, float(shape[0, 0]))
+        else:
+            extents = np.diag(shape)[:3]
+            centre = adsk.core.Point3D.create(*(float(value) for value in shape[:3, 3] + extents / 2))
+            box = adsk.core.OrientedBoundingBox3D.create(centre, adsk.core.Vector3D.create(1, 0, 0),
+                                                         adsk.core.Vector3D.create(0, 1, 0),
+                                                         float(extents[0]), float(extents[1]), float(extents[2]))
+            proxy = temp_brep_manager.createBox(box)
+        _proxy_cache[key] = proxy
+        futil.debug('  BUILT %s PROXY', kind.upper())
+    return proxy
+
+
+def add_proxy_body(component: adsk.fusion.Component, kind: str, shape: np.ndarray) -> adsk.fusion.BRepBody:
+    """Adds a copy of the cached proxy solid to the component and returns the new body.
+
+    In a parametric design the body is added inside a base feature, as
+    geometry.create_base_feature_copies() does.
+    """
+    proxy = get_proxy(kind, shape)
+    design = adsk.fusion.Design.cast(component.parentDesign)
+    base_feature = None
+    if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+        base_feature = component.features.baseFeatures.add()
+        base_feature.startEdit()
+    try:
+        if base_feature:
+            body = component.bRepBodies.add(proxy, base_feature)
+        else:
+            body = component.bRepBodies.add(proxy)
+    finally:
+        if base_feature:
+            base_feature.finishEdit()
+    body.name = kind.title() + ' Proxy'
+    return body
+
+
+def clear():
+    """Forgets the proxy solids of the command session."""
+    _proxy_cache.clear()
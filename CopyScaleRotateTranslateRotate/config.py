@@ -3,6 +3,7 @@
 # modules (global variables).
 
 import os
+import tempfile
 
 # Flag that indicates to run in Debug mode or not. When running in Debug mode
 # more information is written to the Text Command window. Generally, it's useful
@@ -10,6 +11,11 @@ import os
 # are ready to distribute it.
 DEBUG = True
 
+# Flag that indicates to also write the detailed messages of futil.debug() to
+# the Text Command window, which costs several writes per copy in a preview.
+# They are always kept in memory, see futil.recent_log_messages().
+VERBOSE = False
+
 # Gets the name of the add-in from the name of the folder the py file is in.
 # This is used when defining unique internal names for various UI elements 
 # that need a unique name. It's also recommended to use a company name as 
@@ -17,6 +23,40 @@ DEBUG = True
 ADDIN_NAME = os.path.basename(os.path.dirname(__file__))
 COMPANY_NAME = 'Abiogenix'
 
+# Folder the time spent in each phase of the last preview and execute is
+# written to as JSON. Set it to '' to only report it in the Text Command window.
+PROFILE_FOLDER = os.path.join(tempfile.gettempdir(), ADDIN_NAME)
+
+# Flag that indicates to count every Fusion API call of a preview or execute by
+# phase and method, reported next to the profile. Tracing slows every call down
+# a little, so it is off unless a slow combination of inputs is investigated.
+TRACE_API_CALLS = False
+
+# A traced preview or execute warns when it makes more API calls per copy than
+# this. Zero disables the warning.
+API_CALLS_PER_COPY_BUDGET = 50
+
+# Folder large fractal patterns are stored in, so an unchanged pattern is read
+# back from disk instead of expanded again, also in later sessions. Set it to ''
+# to always expand fractals in memory.
+PLAN_FOLDER = os.path.join(tempfile.gettempdir(), ADDIN_NAME, 'plans')
+
+# Only fractal patterns with at least this many copies are stored, and only the
+# most recent MAXIMUM_STORED_PLANS of them are kept.
+PLAN_STORE_MINIMUM_INSTANCES = 2000
+MAXIMUM_STORED_PLANS = 8
+
+# Fractals without a minimum scale are expanded straight to disk and may have
+# up to this many copies, instead of the 100000 of an expansion in memory.
+# Patterns this large are meant to be exported as meshes, building them as
+# bodies or graphics takes as long as Fusion needs for each copy.
+MAXIMUM_STORED_INSTANCES = 10000000
+
+# The custom graphics of a preview hold at most this many triangles. A larger
+# pattern is shown by every so many of its copies, spread evenly over it, so
+# the memory of the preview does not grow with the number of copies.
+MAXIMUM_GRAPHICS_TRIANGLES = 200000
+
 # Palettes
 sample_palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
 
@@ -9,6 +9,7 @@
 #  AUTODESK, INC. DOES NOT WARRANT THAT THE OPERATION OF THE PROGRAM WILL BE
 #  UNINTERRUPTED OR ERROR FREE.
 
+import collections
 import os
 import traceback
 import adsk.core
@@ -16,12 +17,22 @@ import adsk.core
 app = adsk.core.Application.get()
 ui = app.userInterface
 
-# Attempt to read DEBUG flag from parent config.
+# Attempt to read DEBUG and VERBOSE flags from parent config.
 try:
     from ... import config
     DEBUG = config.DEBUG
+    VERBOSE = getattr(config, 'VERBOSE', False)
 except:
     DEBUG = False
+    VERBOSE = False
+
+# Fusion has no log level below InfoLogLevel, so debug() messages are marked with this.
+DEBUG_LOG_LEVEL = -1
+
+# The most recent messages of log() and debug(), kept in memory whatever is
+# written to the Text Command window. Debug messages are stored unformatted.
+LOG_BUFFER_SIZE = 5000
+_log_buffer = collections.deque(maxlen=LOG_BUFFER_SIZE)
 
 
 def log(message: str, level: adsk.core.LogLevels = adsk.core.LogLevels.InfoLogLevel, force_console: bool = False):
@@ -32,6 +43,8 @@ def log(message: str, level: adsk.core.LogLevels = adsk.core.LogLevels.InfoLogLe
     level -- The logging severity level.
     force_console -- Forces the message to be written to the Text Command window. 
     """    
+    _log_buffer.append((level, message, ()))
+
     # Always print to console, only seen through IDE.
     print(message)  
 
@@ -46,6 +59,45 @@ def log(message: str, level: adsk.core.LogLevels = adsk.core.LogLevels.InfoLogLe
         app.log(message, level, log_type)
 
 
+def debug(message: str, *args):
+    """Utility function to log detailed messages from hot loops at next to no cost.
+
+    The message is only formatted with message % args when it is read back
+    with recent_log_messages(), or when config.VERBOSE also writes it to the
+    Text Command window. Otherwise it is only kept in the in-memory log buffer.
+
+    Arguments:
+    message -- The message to log, with %-style placeholders for args.
+    args -- The values of the placeholders.
+    """
+    _log_buffer.append((DEBUG_LOG_LEVEL, message, args))
+    if VERBOSE:
+        formatted = _format_message(message, args)
+        print(formatted)
+        app.log(formatted, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
+
+
+def recent_log_messages(count: int = LOG_BUFFER_SIZE, minimum_level: int = DEBUG_LOG_LEVEL) -> list:
+    """Returns the formatted text of the most recent messages, oldest first.
+
+    Arguments:
+    count -- The number of messages to return at most.
+    minimum_level -- Leaves out messages below this level, for example
+                     adsk.core.LogLevels.InfoLogLevel to leave out debug() messages.
+    """
+    records = [record for record in _log_buffer if record[0] >= minimum_level]
+    return [_format_message(message, args) for level, message, args in records[-count:]]
+
+
+def clear_log_buffer():
+    """Forgets the messages kept in memory."""
+    _log_buffer.clear()
+
+
+def _format_message(message: str, args: tuple) -> str:
+    return message % args if args else message
+
+
 def handle_error(name: str, show_message_box: bool = False):
     """Utility function to simplify error handling.
 
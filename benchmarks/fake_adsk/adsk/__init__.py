@@ -0,0 +1,4 @@
+# A fake of the parts of the Fusion 360 API the add-in uses, so its command
+# handlers can be benchmarked outside of Fusion 360. See benchmarks/run_preview.py.
+
+from . import fake, core, fusion, cam
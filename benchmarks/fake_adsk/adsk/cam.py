@@ -0,0 +1 @@
+# Fake adsk.cam: the add-in imports it but does not use it.
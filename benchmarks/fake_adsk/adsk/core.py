@@ -0,0 +1,475 @@
+# Fake adsk.core for the benchmarks: only the surface the add-in uses.
+
+from typing import Dict, List
+
+import numpy as np
+
+from .fake import ApiObject, api
+
+
+class LogLevels:
+    InfoLogLevel = 0
+    WarningLogLevel = 1
+    ErrorLogLevel = 2
+
+
+class LogTypes:
+    ConsoleLogType = 0
+    FileLogType = 1
+
+
+class Point3D(ApiObject):
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    @staticmethod
+    @api
+    def create(x: float = 0.0, y: float = 0.0, z: float = 0.0) -> 'Point3D':
+        return Point3D(x, y, z)
+
+    @api
+    def asArray(self):
+        return (self.x, self.y, self.z)
+
+
+class Vector3D(ApiObject):
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    @staticmethod
+    @api
+    def create(x: float = 0.0, y: float = 0.0, z: float = 0.0) -> 'Vector3D':
+        return Vector3D(x, y, z)
+
+
+class BoundingBox3D(ApiObject):
+    def __init__(self, minimum, maximum):
+        self.minPoint = Point3D(*minimum)
+        self.maxPoint = Point3D(*maximum)
+
+
+# Only axis aligned boxes are needed, so the directions are not kept.
+class OrientedBoundingBox3D(ApiObject):
+    def __init__(self, centre: Point3D, length: float, width: float, height: float):
+        self.centerPoint = centre
+        self.length, self.width, self.height = float(length), float(width), float(height)
+
+    @staticmethod
+    @api
+    def create(centre: Point3D, length_direction: Vector3D, width_direction: Vector3D,
+               length: float, width: float, height: float) -> 'OrientedBoundingBox3D':
+        return OrientedBoundingBox3D(centre, length, width, height)
+
+
+class Matrix3D(ApiObject):
+    def __init__(self, values=None):
+        self._matrix = np.identity(4) if values is None else np.array(values, dtype=float).reshape(4, 4)
+
+    @staticmethod
+    @api
+    def create() -> 'Matrix3D':
+        return Matrix3D()
+
+    @api
+    def asArray(self):
+        return tuple(float(value) for value in self._matrix.ravel())
+
+    @api
+    def setWithArray(self, values) -> bool:
+        self._matrix = np.array(values, dtype=float).reshape(4, 4)
+        return True
+
+    @api
+    def transformBy(self, matrix: 'Matrix3D') -> bool:
+        self._matrix = matrix._matrix @ self._matrix
+        return True
+
+    @api
+    def copy(self) -> 'Matrix3D':
+        return Matrix3D(self._matrix)
+
+
+class ObjectCollection(ApiObject):
+    def __init__(self):
+        self._items = []
+
+    @staticmethod
+    @api
+    def create() -> 'ObjectCollection':
+        return ObjectCollection()
+
+    @api
+    def add(self, item) -> bool:
+        self._items.append(item)
+        return True
+
+    @api
+    def item(self, index: int):
+        return self._items[index]
+
+    @property
+    def count(self) -> int:
+        return len(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+
+class ValueInput(ApiObject):
+    def __init__(self, real_value: float = 0.0, expression: str = ''):
+        self.realValue = real_value
+        self.stringValue = expression
+
+    @staticmethod
+    @api
+    def createByReal(value: float) -> 'ValueInput':
+        return ValueInput(float(value))
+
+    @staticmethod
+    @api
+    def createByString(expression: str) -> 'ValueInput':
+        return ValueInput(float(expression.split()[0]), expression)
+
+
+# ---------------------------------------------------------------- application
+
+class Selection(ApiObject):
+    def __init__(self, entity):
+        self.entity = entity
+
+
+class Selections(ApiObject):
+    def __init__(self):
+        self._selections: List[Selection] = []
+
+    def _add(self, entity):
+        self._selections.append(Selection(entity))
+
+    @property
+    def count(self) -> int:
+        return len(self._selections)
+
+    @api
+    def item(self, index: int) -> Selection:
+        return self._selections[index]
+
+
+class Viewport(ApiObject):
+    @api
+    def fit(self) -> bool:
+        return True
+
+
+class UserInterface(ApiObject):
+    def __init__(self):
+        self.activeSelections = Selections()
+        self.messages: List[str] = []
+
+    @api
+    def messageBox(self, text: str, title: str = '', *args) -> int:
+        self.messages.append(text)
+        return 0
+
+
+class Application(ApiObject):
+    _instance = None
+
+    def __init__(self):
+        self.userInterface = UserInterface()
+        self.activeViewport = Viewport()
+        self.activeProduct = None
+        self.logged: List[str] = []
+
+    @staticmethod
+    def get() -> 'Application':
+        if Application._instance is None:
+            Application._instance = Application()
+            from . import fusion
+            Application._instance.activeProduct = fusion.Design()
+        return Application._instance
+
+    @api
+    def log(self, message: str, level: int = LogLevels.InfoLogLevel, log_type: int = LogTypes.ConsoleLogType):
+        self.logged.append(message)
+
+
+# ------------------------------------------------------------- command inputs
+
+class CommandInput(ApiObject):
+    def __init__(self, inputs: 'CommandInputs', input_id: str, name: str):
+        self.id = input_id
+        self.name = name
+        self.isEnabled = True
+        self.isVisible = True
+        self.commandInputs = inputs
+
+
+class CommandInputs(ApiObject):
+    def __init__(self, registry: Dict[str, CommandInput] = None):
+        # Children share the registry of the dialog, so itemById finds every input.
+        self._registry = {} if registry is None else registry
+        self._inputs: List[CommandInput] = []
+
+    def _add(self, command_input: CommandInput) -> CommandInput:
+        self._registry[command_input.id] = command_input
+        self._inputs.append(command_input)
+        return command_input
+
+    @api
+    def itemById(self, input_id: str) -> CommandInput:
+        return self._registry.get(input_id)
+
+    @property
+    def count(self) -> int:
+        return len(self._inputs)
+
+    @api
+    def addTabCommandInput(self, input_id: str, name: str, resource_folder: str = '') -> 'TabCommandInput':
+        return self._add(TabCommandInput(self, input_id, name))
+
+    @api
+    def addGroupCommandInput(self, input_id: str, name: str) -> 'GroupCommandInput':
+        return self._add(GroupCommandInput(self, input_id, name))
+
+    @api
+    def addTextBoxCommandInput(self, input_id: str, name: str, text: str, num_rows: int,
+                               is_read_only: bool) -> 'TextBoxCommandInput':
+        command_input = TextBoxCommandInput(self, input_id, name)
+        command_input.text = text
+        command_input.isReadOnly = is_read_only
+        return self._add(command_input)
+
+    @api
+    def addSelectionInput(self, input_id: str, name: str, prompt: str) -> 'SelectionCommandInput':
+        return self._add(SelectionCommandInput(self, input_id, name))
+
+    @api
+    def addIntegerSliderCommandInput(self, input_id: str, name: str, minimum: int, maximum: int,
+                                     has_two_sliders: bool = False) -> 'IntegerSliderCommandInput':
+        command_input = IntegerSliderCommandInput(self, input_id, name)
+        command_input.minimumValue = minimum
+        command_input.maximumValue = maximum
+        command_input.valueOne = minimum
+        return self._add(command_input)
+
+    @api
+    def addIntegerSpinnerCommandInput(self, input_id: str, name: str, minimum: int, maximum: int, spin_step: int,
+                                      initial_value: int) -> 'IntegerSpinnerCommandInput':
+        command_input = IntegerSpinnerCommandInput(self, input_id, name)
+        command_input.minimumValue = minimum
+        command_input.maximumValue = maximum
+        command_input.value = initial_value
+        return self._add(command_input)
+
+    @api
+    def addRadioButtonGroupCommandInput(self, input_id: str, name: str = '') -> 'RadioButtonGroupCommandInput':
+        return self._add(RadioButtonGroupCommandInput(self, input_id, name))
+
+    @api
+    def addBoolValueInput(self, input_id: str, name: str, is_check_box: bool, resource_folder: str = '',
+                          initial_value: bool = False) -> 'BoolValueCommandInput':
+        command_input = BoolValueCommandInput(self, input_id, name)
+        command_input.value = initial_value
+        return self._add(command_input)
+
+    @api
+    def addTriadCommandInput(self, input_id: str, transform: Matrix3D) -> 'TriadCommandInput':
+        command_input = TriadCommandInput(self, input_id, '')
+        command_input.transform = transform
+        return self._add(command_input)
+
+    @api
+    def addValueInput(self, input_id: str, name: str, unit_type: str, initial_value: ValueInput) -> 'ValueCommandInput':
+        command_input = ValueCommandInput(self, input_id, name)
+        command_input.unitType = unit_type
+        command_input.value = initial_value.realValue
+        return self._add(command_input)
+
+
+class TabCommandInput(CommandInput):
+    def __init__(self, inputs, input_id, name):
+        super().__init__(inputs, input_id, name)
+        self.children = CommandInputs(inputs._registry)
+        self.isActive = False
+
+
+class GroupCommandInput(CommandInput):
+    def __init__(self, inputs, input_id, name):
+        super().__init__(inputs, input_id, name)
+        self.children = CommandInputs(inputs._registry)
+        self.isExpanded = True
+        self.isEnabledCheckBoxDisplayed = False
+        self.isEnabledCheckBoxChecked = True
+
+
+class TextBoxCommandInput(CommandInput):
+    text = ''
+    isReadOnly = False
+
+
+class SelectionCommandInput(CommandInput):
+    @api
+    def setSelectionLimits(self, minimum: int, maximum: int = 0) -> bool:
+        return True
+
+    @api
+    def addSelectionFilter(self, filter_name: str) -> bool:
+        return True
+
+
+class IntegerSliderCommandInput(CommandInput):
+    valueOne = 0
+
+
+class IntegerSpinnerCommandInput(CommandInput):
+    value = 0
+
+
+class BoolValueCommandInput(CommandInput):
+    value = False
+
+
+class ValueCommandInput(CommandInput):
+    value = 0.0
+    unitType = ''
+    minimumValue = 0.0
+    isMinimumValueInclusive = True
+
+
+class TriadCommandInput(CommandInput):
+    transform = None
+
+    @api
+    def hideAll(self) -> bool:
+        return True
+
+    @api
+    def setRotateVisibility(self, visible: bool) -> bool:
+        return True
+
+    @api
+    def setTranslateVisibility(self, visible: bool) -> bool:
+        return True
+
+
+class ListItem(ApiObject):
+    def __init__(self, items: 'ListItems', name: str, selected: bool):
+        self._items = items
+        self.name = name
+        self._selected = selected
+
+    @property
+    def isSelected(self) -> bool:
+        return self._selected
+
+    @isSelected.setter
+    def isSelected(self, selected: bool):
+        if selected:
+            for item in self._items._items:
+                item._selected = False
+        self._selected = selected
+
+
+class ListItems(ApiObject):
+    def __init__(self):
+        self._items: List[ListItem] = []
+
+    @api
+    def add(self, name: str, is_selected: bool, icon: str = '') -> ListItem:
+        item = ListItem(self, name, False)
+        self._items.append(item)
+        if is_selected:
+            item.isSelected = True
+        return item
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+class RadioButtonGroupCommandInput(CommandInput):
+    def __init__(self, inputs, input_id, name):
+        super().__init__(inputs, input_id, name)
+        self.listItems = ListItems()
+
+    @property
+    def selectedItem(self) -> ListItem:
+        for item in self.listItems:
+            if item.isSelected:
+                return item
+        return None
+
+
+# --------------------------------------------------------------------- events
+
+class Event(ApiObject):
+    def __init__(self):
+        self._handlers = []
+
+    def _fire(self, args):
+        for handler in self._handlers:
+            handler.notify(args)
+
+
+class CommandEventHandler:
+    def notify(self, args):
+        pass
+
+
+class InputChangedEventHandler:
+    def notify(self, args):
+        pass
+
+
+class CommandCreatedEventHandler:
+    def notify(self, args):
+        pass
+
+
+class CommandEvent(Event):
+    def add(self, handler: 'CommandEventHandler') -> bool:
+        self._handlers.append(handler)
+        return True
+
+
+class InputChangedEvent(Event):
+    def add(self, handler: 'InputChangedEventHandler') -> bool:
+        self._handlers.append(handler)
+        return True
+
+
+class CommandCreatedEvent(Event):
+    def add(self, handler: 'CommandCreatedEventHandler') -> bool:
+        self._handlers.append(handler)
+        return True
+
+
+class Command(ApiObject):
+    def __init__(self):
+        self.commandInputs = CommandInputs()
+        self.execute = CommandEvent()
+        self.executePreview = CommandEvent()
+        self.inputChanged = InputChangedEvent()
+        self.destroy = CommandEvent()
+
+
+class CommandEventArgs(ApiObject):
+    def __init__(self, command: Command):
+        self.command = command
+        self.isValidResult = False
+
+
+class CommandCreatedEventArgs(ApiObject):
+    def __init__(self, command: Command):
+        self.command = command
+
+
+class InputChangedEventArgs(ApiObject):
+    def __init__(self, command: Command, changed_input: CommandInput):
+        self.input = changed_input
+        self.inputs = command.commandInputs
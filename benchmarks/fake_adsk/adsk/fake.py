@@ -0,0 +1,113 @@
+# Control surface of the fake adsk package used by the benchmarks.
+#
+# Every fake API method is wrapped with api(), which counts the call by name
+# and charges it the simulated cost of the active cost model. Property reads
+# and writes are API calls in Fusion 360 too, so the fake classes derive from
+# ApiObject, which counts them the same way. The benchmark runner resets the
+# counters before each scenario and reads them afterwards.
+
+import functools
+import sys
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+
+class CallLog:
+    """Counts fake API calls and the simulated time they would take in Fusion 360."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.simulated_seconds = 0.0
+        # Seconds charged per call by name ('BRepBody.copyToComponent'), and for
+        # every call without an entry of its own.
+        self.costs: Dict[str, float] = {}
+        self.default_cost = 0.0
+        # Actually sleep for the simulated cost, so time based logic such as the
+        # preview budget sees it too.
+        self.realize_costs = False
+
+    def configure(self, costs: Optional[Dict[str, float]] = None, default_cost: float = 0.0,
+                  realize_costs: bool = False):
+        self.costs = dict(costs or {})
+        self.default_cost = default_cost
+        self.realize_costs = realize_costs
+
+    def record(self, name: str):
+        self.counts[name] += 1
+        cost = self.costs.get(name, self.default_cost)
+        self.simulated_seconds += cost
+        if self.realize_costs and cost > 0:
+            time.sleep(cost)
+
+    def reset(self):
+        self.counts.clear()
+        self.simulated_seconds = 0.0
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.counts.values())
+
+
+calls = CallLog()
+
+
+def api(function):
+    """Marks a fake method as a Fusion API call."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        calls.record(name)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+class ApiObject:
+    """Base of the fake API classes, whose public attributes stand for properties.
+
+    Reads and writes of a public attribute other than a method are counted
+    as 'Class.attribute' calls, but only when the add-in makes them: the
+    fake's own bookkeeping is not an API call.
+    """
+
+    def __getattribute__(self, name: str):
+        if name[0] != '_' and not callable(getattr(type(self), name, None)) and _called_by_add_in():
+            calls.record(type(self).__name__ + '.' + name)
+        return object.__getattribute__(self, name)
+
+    def __setattr__(self, name: str, value):
+        if name[0] != '_' and _called_by_add_in():
+            calls.record(type(self).__name__ + '.' + name)
+        object.__setattr__(self, name, value)
+
+
+def _called_by_add_in() -> bool:
+    # True unless the attribute is accessed from the fake package itself,
+    # two frames up: this function, then __getattribute__ or __setattr__.
+    return sys._getframe(2).f_globals.get('__name__', '').split('.')[0] != 'adsk'
+
+
+def reset():
+    """Forgets the design, the selection and the call counts."""
+    from . import core, fusion
+    calls.reset()
+    application = core.Application.get()
+    application.activeProduct = fusion.Design()
+    application.userInterface.activeSelections = core.Selections()
+    application.userInterface.messages.clear()
+
+
+def select_boxes(count: int, size: float = 1.0, spacing: float = 2.0):
+    """Adds count box bodies of edge length size to the root component and selects them."""
+    from . import core
+    application = core.Application.get()
+    root = application.activeProduct.rootComponent
+    selections = application.userInterface.activeSelections
+    bodies = []
+    for index in range(count):
+        body = root.bRepBodies._create(f'Body{index + 1}', (index * spacing, 0.0, 0.0),
+                                       (index * spacing + size, size, size))
+        selections._add(body)
+        bodies.append(body)
+    return bodies
@@ -0,0 +1,600 @@
+# Fake adsk.fusion for the benchmarks: only the surface the add-in uses.
+#
+# A body is an axis aligned box in its own coordinates plus the 4x4 matrix that
+# places it, which is all the add-in reads back (bounding boxes, meshes,
+# interference). Features apply their transform to that matrix.
+
+import itertools
+from typing import List
+
+import numpy as np
+
+from . import core
+from .fake import ApiObject, api
+
+
+class DesignTypes:
+    DirectDesignType = 0
+    ParametricDesignType = 1
+
+
+class FeatureOperations:
+    JoinFeatureOperation = 0
+    CutFeatureOperation = 1
+    IntersectFeatureOperation = 2
+    NewBodyFeatureOperation = 3
+    NewComponentFeatureOperation = 4
+
+
+class TriangleMeshQualityOptions:
+    LowQualityTriangleMesh = 8
+    NormalQualityTriangleMesh = 11
+    HighQualityTriangleMesh = 13
+    VeryHighQualityTriangleMesh = 15
+
+
+_tokens = itertools.count(1)
+
+
+def _matrix_of(matrix) -> np.ndarray:
+    return matrix._matrix if isinstance(matrix, core.Matrix3D) else np.asarray(matrix, dtype=float)
+
+
+# ---------------------------------------------------------------------- bodies
+
+class TriangleMesh(ApiObject):
+    def __init__(self, coordinates, indices, normals):
+        self.nodeCoordinatesAsDouble = coordinates
+        self.nodeIndices = indices
+        self.normalVectorsAsDouble = normals
+
+
+# The 8 corners of the unit cube and its 12 triangles, wound outwards.
+_CUBE_CORNERS = np.array(list(itertools.product((0.0, 1.0), repeat=3)))
+_CUBE_TRIANGLES = [0, 2, 1, 1, 2, 3, 4, 5, 6, 5, 7, 6, 0, 1, 4, 1, 5, 4,
+                   2, 6, 3, 3, 6, 7, 0, 4, 2, 2, 4, 6, 1, 3, 5, 3, 7, 5]
+
+
+class MeshCalculator(ApiObject):
+    def __init__(self, body: 'BRepBody'):
+        self._body = body
+
+    @api
+    def setQuality(self, quality: int) -> bool:
+        return True
+
+    @api
+    def calculate(self) -> TriangleMesh:
+        corners = self._body._world_corners()
+        centre = corners.mean(axis=0)
+        normals = corners - centre
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        return TriangleMesh(corners.ravel().tolist(), list(_CUBE_TRIANGLES), normals.ravel().tolist())
+
+
+class MeshManager(ApiObject):
+    def __init__(self, body: 'BRepBody'):
+        self._body = body
+
+    @api
+    def createMeshCalculator(self) -> MeshCalculator:
+        return MeshCalculator(self._body)
+
+
+class BRepBody(ApiObject):
+    def __init__(self, component: 'Component', name: str, minimum, maximum, matrix=None):
+        self.parentComponent = component
+        self.name = name
+        self._minimum = np.asarray(minimum, dtype=float)
+        self._maximum = np.asarray(maximum, dtype=float)
+        self._matrix = np.identity(4) if matrix is None else np.array(matrix, dtype=float)
+        self.entityToken = f'body{next(_tokens)}'
+        self.isValid = True
+        self.meshManager = MeshManager(self)
+
+    @staticmethod
+    def cast(entity) -> 'BRepBody':
+        return entity if isinstance(entity, BRepBody) else None
+
+    def _world_corners(self) -> np.ndarray:
+        corners = self._minimum + _CUBE_CORNERS * (self._maximum - self._minimum)
+        return corners @ self._matrix[:3, :3].T + self._matrix[:3, 3]
+
+    @property
+    def boundingBox(self) -> core.BoundingBox3D:
+        corners = self._world_corners()
+        return core.BoundingBox3D(corners.min(axis=0), corners.max(axis=0))
+
+    @property
+    def volume(self) -> float:
+        return float(np.prod(self._maximum - self._minimum) * abs(np.linalg.det(self._matrix[:3, :3])))
+
+    @api
+    def copyToComponent(self, target) -> 'BRepBody':
+        component = target.component if isinstance(target, Occurrence) else target
+        return component.bRepBodies._add(BRepBody(component, self.name, self._minimum, self._maximum, self._matrix))
+
+    @api
+    def createComponent(self) -> 'BRepBody':
+        occurrence = self.parentComponent.occurrences._add_new()
+        self.parentComponent.bRepBodies._remove(self)
+        self.parentComponent = occurrence.component
+        return occurrence.component.bRepBodies._add(self)
+
+    @api
+    def moveToComponent(self, target) -> 'BRepBody':
+        component = target.component if isinstance(target, Occurrence) else target
+        self.parentComponent.bRepBodies._remove(self)
+        self.parentComponent = component
+        return component.bRepBodies._add(self)
+
+    @api
+    def deleteMe(self) -> bool:
+        self.parentComponent.bRepBodies._remove(self)
+        self.isValid = False
+        return True
+
+
+class BRepBodies(ApiObject):
+    def __init__(self, component: 'Component'):
+        self._component = component
+        self._bodies: List[BRepBody] = []
+
+    def _add(self, body: BRepBody) -> BRepBody:
+        self._bodies.append(body)
+        return body
+
+    def _remove(self, body: BRepBody):
+        if body in self._bodies:
+            self._bodies.remove(body)
+
+    def _create(self, name: str, minimum, maximum) -> BRepBody:
+        return self._add(BRepBody(self._component, name, minimum, maximum))
+
+    @api
+    def add(self, body: BRepBody, base_feature: 'BaseFeature' = None) -> BRepBody:
+        if base_feature is not None and not base_feature._is_editing:
+            raise RuntimeError('bodies can only be added to a base feature while it is edited')
+        return self._add(BRepBody(self._component, body.name, body._minimum, body._maximum, body._matrix))
+
+    @api
+    def item(self, index: int) -> BRepBody:
+        return self._bodies[index]
+
+    @property
+    def count(self) -> int:
+        return len(self._bodies)
+
+    def __iter__(self):
+        return iter(list(self._bodies))
+
+    def __len__(self):
+        return len(self._bodies)
+
+
+class TemporaryBRepManager(ApiObject):
+    _instance = None
+
+    @staticmethod
+    def get() -> 'TemporaryBRepManager':
+        if TemporaryBRepManager._instance is None:
+            TemporaryBRepManager._instance = TemporaryBRepManager()
+        return TemporaryBRepManager._instance
+
+    @api
+    def copy(self, body: BRepBody) -> BRepBody:
+        return BRepBody(None, body.name, body._minimum, body._maximum, body._matrix)
+
+    @api
+    def createBox(self, box: core.OrientedBoundingBox3D) -> BRepBody:
+        centre = np.array(box.centerPoint.asArray())
+        half = np.array([box.length, box.width, box.height]) / 2
+        return BRepBody(None, 'Body', centre - half, centre + half)
+
+    # A sphere is kept as its bounding box, which is all the benchmarks look at.
+    @api
+    def createSphere(self, centre: core.Point3D, radius: float) -> BRepBody:
+        centre = np.array(centre.asArray())
+        return BRepBody(None, 'Body', centre - radius, centre + radius)
+
+    @api
+    def transform(self, body: BRepBody, matrix: core.Matrix3D) -> bool:
+        body._matrix = _matrix_of(matrix) @ body._matrix
+        return True
+
+
+# -------------------------------------------------------------------- features
+
+class Feature(ApiObject):
+    def __init__(self, bodies=()):
+        self.bodies = list(bodies)
+        self.name = ''
+        self.isValid = True
+
+
+class ScaleFeatureInput(ApiObject):
+    def __init__(self, bodies, point, scale: core.ValueInput):
+        self._bodies = list(bodies)
+        self._point = point
+        self._scales = (scale.realValue,) * 3
+
+    @api
+    def setToNonUniform(self, x: core.ValueInput, y: core.ValueInput, z: core.ValueInput) -> bool:
+        self._scales = (x.realValue, y.realValue, z.realValue)
+        return True
+
+
+class ScaleFeatures(ApiObject):
+    def __init__(self, design: 'Design'):
+        self._design = design
+
+    @api
+    def createInput(self, bodies, point, scale: core.ValueInput) -> ScaleFeatureInput:
+        return ScaleFeatureInput(bodies, point, scale)
+
+    @api
+    def add(self, feature_input: ScaleFeatureInput) -> Feature:
+        base = np.asarray(feature_input._point.geometry.asArray())
+        scale = np.identity(4)
+        scale[:3, :3] = np.diag(feature_input._scales)
+        scale[:3, 3] = base - np.diag(feature_input._scales) @ base
+        for body in feature_input._bodies:
+            body._matrix = scale @ body._matrix
+        return self._design._add_feature(Feature(feature_input._bodies))
+
+
+class MoveFeatureInput(ApiObject):
+    def __init__(self, bodies, matrix: core.Matrix3D):
+        self._bodies = list(bodies)
+        self._matrix = _matrix_of(matrix).copy()
+
+
+class MoveFeatures(ApiObject):
+    def __init__(self, design: 'Design'):
+        self._design = design
+
+    @api
+    def createInput(self, bodies, matrix: core.Matrix3D) -> MoveFeatureInput:
+        return MoveFeatureInput(bodies, matrix)
+
+    @api
+    def add(self, feature_input: MoveFeatureInput) -> Feature:
+        for body in feature_input._bodies:
+            body._matrix = feature_input._matrix @ body._matrix
+        return self._design._add_feature(Feature(feature_input._bodies))
+
+
+class RemoveFeatures(ApiObject):
+    def __init__(self, design: 'Design'):
+        self._design = design
+
+    @api
+    def add(self, body: BRepBody) -> Feature:
+        body.parentComponent.bRepBodies._remove(body)
+        return self._design._add_feature(Feature([body]))
+
+
+class ExtrudeFeatures(ApiObject):
+    def __init__(self, component: 'Component'):
+        self._component = component
+
+    @api
+    def addSimple(self, profile: 'Profile', distance: core.ValueInput, operation: int) -> Feature:
+        minimum = np.append(profile._minimum, 0.0)
+        maximum = np.append(profile._maximum, distance.realValue)
+        body = self._component.bRepBodies._create('Body' + str(self._component.bRepBodies.count + 1), minimum, maximum)
+        return self._component.parentDesign._add_feature(Feature([body]))
+
+
+class RevolveFeatureInput(ApiObject):
+    def __init__(self, profile: 'Profile'):
+        self._profile = profile
+
+    @api
+    def setAngleExtent(self, is_symmetric: bool, angle: core.ValueInput) -> bool:
+        return True
+
+
+class RevolveFeatures(ApiObject):
+    def __init__(self, component: 'Component'):
+        self._component = component
+
+    @api
+    def createInput(self, profile: 'Profile', axis, operation: int) -> RevolveFeatureInput:
+        return RevolveFeatureInput(profile)
+
+    @api
+    def add(self, feature_input: RevolveFeatureInput) -> Feature:
+        radius = feature_input._profile._radius
+        body = self._component.bRepBodies._create('Body' + str(self._component.bRepBodies.count + 1), (-radius,) * 3, (radius,) * 3)
+        return self._component.parentDesign._add_feature(Feature([body]))
+
+
+class BaseFeature(Feature):
+    def __init__(self):
+        super().__init__()
+        self._is_editing = False
+
+    @api
+    def startEdit(self) -> bool:
+        self._is_editing = True
+        return True
+
+    @api
+    def finishEdit(self) -> bool:
+        self._is_editing = False
+        return True
+
+
+class BaseFeatures(ApiObject):
+    def __init__(self, design: 'Design'):
+        self._design = design
+
+    @api
+    def add(self) -> BaseFeature:
+        return self._design._add_feature(BaseFeature())
+
+
+class Features(ApiObject):
+    def __init__(self, component: 'Component'):
+        design = component.parentDesign
+        self.scaleFeatures = ScaleFeatures(design)
+        self.moveFeatures = MoveFeatures(design)
+        self.removeFeatures = RemoveFeatures(design)
+        self.baseFeatures = BaseFeatures(design)
+        self.extrudeFeatures = ExtrudeFeatures(component)
+        self.revolveFeatures = RevolveFeatures(component)
+
+
+# -------------------------------------------------------------------- sketches
+
+class SketchPoint(ApiObject):
+    def __init__(self, point: core.Point3D):
+        self.geometry = point
+
+
+class SketchPoints(ApiObject):
+    def __init__(self):
+        self._points = [SketchPoint(core.Point3D())]
+
+    @api
+    def item(self, index: int) -> SketchPoint:
+        return self._points[index]
+
+
+class Profile(ApiObject):
+    def __init__(self, minimum=(0.0, 0.0), maximum=(0.0, 0.0), radius: float = 0.0):
+        self._minimum = np.asarray(minimum, dtype=float)
+        self._maximum = np.asarray(maximum, dtype=float)
+        self._radius = radius
+
+
+class Profiles(ApiObject):
+    def __init__(self):
+        self._profiles: List[Profile] = []
+
+    @api
+    def item(self, index: int) -> Profile:
+        return self._profiles[index]
+
+    @property
+    def count(self) -> int:
+        return len(self._profiles)
+
+
+class SketchLines(ApiObject):
+    def __init__(self, sketch: 'Sketch'):
+        self._sketch = sketch
+
+    @api
+    def addTwoPointRectangle(self, first: core.Point3D, second: core.Point3D):
+        corners = np.array([[first.x, first.y], [second.x, second.y]])
+        self._sketch.profiles._profiles.append(Profile(corners.min(axis=0), corners.max(axis=0)))
+        return []
+
+    @api
+    def addByTwoPoints(self, first: core.Point3D, second: core.Point3D):
+        return object()
+
+
+class SketchCircles(ApiObject):
+    def __init__(self, sketch: 'Sketch'):
+        self._sketch = sketch
+
+    @api
+    def addByCenterRadius(self, centre: core.Point3D, radius: float):
+        self._sketch.profiles._profiles.append(Profile(radius=radius))
+        return object()
+
+
+class SketchCurves(ApiObject):
+    def __init__(self, sketch: 'Sketch'):
+        self.sketchLines = SketchLines(sketch)
+        self.sketchCircles = SketchCircles(sketch)
+
+
+class Sketch(ApiObject):
+    def __init__(self):
+        self.profiles = Profiles()
+        self.sketchPoints = SketchPoints()
+        self.sketchCurves = SketchCurves(self)
+
+
+class Sketches(ApiObject):
+    def __init__(self):
+        self._sketches: List[Sketch] = []
+
+    @api
+    def add(self, plane) -> Sketch:
+        sketch = Sketch()
+        self._sketches.append(sketch)
+        return sketch
+
+
+# ------------------------------------------------------------ custom graphics
+
+class CustomGraphicsCoordinates(ApiObject):
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+
+    @staticmethod
+    @api
+    def create(coordinates) -> 'CustomGraphicsCoordinates':
+        return CustomGraphicsCoordinates(coordinates)
+
+
+class CustomGraphicsMesh(ApiObject):
+    def __init__(self, group: 'CustomGraphicsGroup', coordinates, indices):
+        self._group = group
+        self.numTriangles = len(indices) // 3
+        self.isValid = True
+
+    @api
+    def deleteMe(self) -> bool:
+        self.isValid = False
+        return True
+
+
+class CustomGraphicsGroup(ApiObject):
+    def __init__(self):
+        self.isValid = True
+        self._meshes: List[CustomGraphicsMesh] = []
+
+    @api
+    def addMesh(self, coordinates, indices, normals, normal_indices) -> CustomGraphicsMesh:
+        mesh = CustomGraphicsMesh(self, coordinates, indices)
+        self._meshes.append(mesh)
+        return mesh
+
+    @api
+    def deleteMe(self) -> bool:
+        self.isValid = False
+        for mesh in self._meshes:
+            mesh.isValid = False
+        return True
+
+
+class CustomGraphicsGroups(ApiObject):
+    def __init__(self):
+        self._groups: List[CustomGraphicsGroup] = []
+
+    @api
+    def add(self) -> CustomGraphicsGroup:
+        group = CustomGraphicsGroup()
+        self._groups.append(group)
+        return group
+
+
+# ------------------------------------------------------------------ components
+
+class Occurrence(ApiObject):
+    def __init__(self, component: 'Component', transform: core.Matrix3D = None):
+        self.component = component
+        self.transform = transform if transform is not None else core.Matrix3D()
+
+    @property
+    def bRepBodies(self) -> BRepBodies:
+        return self.component.bRepBodies
+
+    @api
+    def activate(self) -> bool:
+        return True
+
+
+class Occurrences(ApiObject):
+    def __init__(self, component: 'Component'):
+        self._component = component
+        self._occurrences: List[Occurrence] = []
+
+    def _add_new(self, transform: core.Matrix3D = None) -> Occurrence:
+        component = Component(self._component.parentDesign, 'Component' + str(len(self._occurrences) + 1))
+        occurrence = Occurrence(component, transform)
+        self._occurrences.append(occurrence)
+        return occurrence
+
+    @api
+    def addNewComponent(self, transform: core.Matrix3D) -> Occurrence:
+        return self._add_new(transform)
+
+    @api
+    def addExistingComponent(self, component: 'Component', transform: core.Matrix3D) -> Occurrence:
+        occurrence = Occurrence(component, transform)
+        self._occurrences.append(occurrence)
+        return occurrence
+
+    @property
+    def count(self) -> int:
+        return len(self._occurrences)
+
+
+class ConstructionPlane(ApiObject):
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Component(ApiObject):
+    def __init__(self, design: 'Design', name: str):
+        self.parentDesign = design
+        self.name = name
+        self.bRepBodies = BRepBodies(self)
+        self.occurrences = Occurrences(self)
+        self.sketches = Sketches()
+        self.customGraphicsGroups = CustomGraphicsGroups()
+        self.xYConstructionPlane = ConstructionPlane('XY')
+        self.xZConstructionPlane = ConstructionPlane('XZ')
+        self.yZConstructionPlane = ConstructionPlane('YZ')
+        self.features = Features(self)
+
+
+# ---------------------------------------------------------------------- design
+
+class UnitsManager(ApiObject):
+    defaultLengthUnits = 'cm'
+
+
+class InterferenceInput(ApiObject):
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        self.areCoincidentFacesIncluded = True
+
+
+class InterferenceResult(ApiObject):
+    def __init__(self, first: BRepBody, second: BRepBody, body: BRepBody):
+        self.entityOne = first
+        self.entityTwo = second
+        self.interferenceBody = body
+
+
+class Design(ApiObject):
+    def __init__(self):
+        self.designType = DesignTypes.ParametricDesignType
+        self.unitsManager = UnitsManager()
+        self.timeline: List[Feature] = []
+        self.rootComponent = Component(self, 'Root')
+
+    @staticmethod
+    def cast(product) -> 'Design':
+        return product if isinstance(product, Design) else None
+
+    def _add_feature(self, feature: Feature) -> Feature:
+        if self.designType == DesignTypes.ParametricDesignType:
+            self.timeline.append(feature)
+        return feature
+
+    @api
+    def createInterferenceInput(self, bodies) -> InterferenceInput:
+        return InterferenceInput(bodies)
+
+    @api
+    def analyzeInterference(self, interference_input: InterferenceInput) -> List[InterferenceResult]:
+        # Overlapping bounding boxes count as interference, which is exact for
+        # the unrotated boxes the benchmarks select.
+        results = []
+        bodies = interference_input.bodies
+        for first, second in itertools.combinations(bodies, 2):
+            first_box, second_box = first.boundingBox, second.boundingBox
+            lower = np.maximum(first_box.minPoint.asArray(), second_box.minPoint.asArray())
+            upper = np.minimum(first_box.maxPoint.asArray(), second_box.maxPoint.asArray())
+            if np.all(lower < upper):
+                results.append(InterferenceResult(first, second, BRepBody(None, 'Interference', lower, upper)))
+        return results
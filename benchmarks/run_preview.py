@@ -0,0 +1,290 @@
+"""Benchmarks the preview of the Copy Scale Rotate Translate Rotate command outside of Fusion 360.
+
+The command handlers of entry.py run unchanged against the fake adsk package in
+fake_adsk/, which counts every API call and charges it the cost of a per-call
+cost model. Every scenario of the grid (copies x bodies x stages x recursion x
+output) is previewed in a fresh design, and its wall time, simulated API time,
+API call counts, peak Python memory and per-phase profile are saved as JSON so
+runs before and after a change can be compared. The run fails when a copy
+costs more API calls than config.API_CALLS_PER_COPY_BUDGET:
+
+    python benchmarks/run_preview.py --copies 10 100 --output parametric base
+    python benchmarks/run_preview.py --compare results/before.json results/after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, 'fake_adsk'))
+sys.path.insert(0, REPOSITORY_FOLDER)
+
+import numpy as np
+
+import adsk.core
+from adsk import fake
+from CopyScaleRotateTranslateRotate import config
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import entry
+
+# Rough seconds per call in Fusion 360 for the calls that dominate a preview.
+# Every other call is charged DEFAULT_COST. Calibrate them with the phase
+# profiles the add-in writes to config.PROFILE_FOLDER and pass them with --costs.
+DEFAULT_COSTS = {
+    'BRepBody.copyToComponent': 0.020,
+    'BRepBody.createComponent': 0.050,
+    'ScaleFeatures.add': 0.030,
+    'MoveFeatures.add': 0.030,
+    'RemoveFeatures.add': 0.010,
+    'BRepBodies.add': 0.005,
+    'TemporaryBRepManager.copy': 0.001,
+    'TemporaryBRepManager.transform': 0.0005,
+    'Occurrences.addNewComponent': 0.020,
+    'Occurrences.addExistingComponent': 0.010,
+    'CustomGraphicsGroup.addMesh': 0.002,
+    'MeshCalculator.calculate': 0.005,
+    'Design.analyzeInterference': 0.050,
+}
+DEFAULT_COST = 0.00005
+
+OUTPUTS = {
+    'parametric': 'parametric features for each copy',
+    'base': 'single base feature for all copies',
+    'occurrences': 'component occurrences for each copy',
+    'graphics': None,
+}
+
+# The transform of each stage letter: s scales, i rotates internally, t
+# translates and e rotates externally.
+STAGE_LETTERS = 'site'
+
+
+def rotation_z(degrees: float) -> list:
+    angle = math.radians(degrees)
+    matrix = np.identity(4)
+    matrix[:2, :2] = [[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]]
+    return matrix.ravel().tolist()
+
+
+def translation(x: float, y: float = 0.0, z: float = 0.0) -> list:
+    matrix = np.identity(4)
+    matrix[:3, 3] = (x, y, z)
+    return matrix.ravel().tolist()
+
+
+def scenario_key(scenario: dict) -> str:
+    return '{copies} copies, {bodies} bodies, stages {stages}, {recursion}, {output}'.format(
+        recursion='recursive' if scenario['recursive'] else 'not recursive', **scenario)
+
+
+def scenarios(arguments) -> list:
+    return [dict(copies=copies, bodies=bodies, stages=stages, recursive=recursive, output=output)
+            for copies in arguments.copies
+            for bodies in arguments.bodies
+            for stages in arguments.stages
+            for recursive in arguments.recursive
+            for output in arguments.output]
+
+
+# futil.log prints every message, which would drown the results, so the
+# command handlers run with stdout redirected.
+def open_dialog(scenario: dict, scale: float):
+    """Starts the command in a fresh design with the scenario's inputs and returns its command."""
+    fake.reset()
+    fake.select_boxes(scenario['bodies'])
+    command = adsk.core.Command()
+    with contextlib.redirect_stdout(io.StringIO()):
+        entry.command_created(adsk.core.CommandCreatedEventArgs(command))
+    inputs = command.commandInputs
+
+    inputs.itemById('num_copies').valueOne = scenario['copies']
+    inputs.itemById('apply transformations recursively').value = scenario['recursive']
+    inputs.itemById('preview_budget').valueOne = 0
+    output = OUTPUTS[scenario['output']]
+    preview_option = 'use actual bodies' if output else 'draw actual bodies as graphics'
+    for item in inputs.itemById('previewRadioButtonGroup').listItems:
+        item.isSelected = (item.name == preview_option)
+    for item in inputs.itemById('outputRadioButtonGroup').listItems:
+        item.isSelected = (item.name == (output or OUTPUTS['parametric']))
+
+    stages = scenario['stages']
+    inputs.itemById('scale').isEnabledCheckBoxChecked = 's' in stages
+    inputs.itemById('scale_value').text = str(scale)
+    inputs.itemById('internal rotation').isEnabledCheckBoxChecked = 'i' in stages
+    entry.internal_rotation_transform.setWithArray(rotation_z(30.0))
+    inputs.itemById('translation').isEnabledCheckBoxChecked = 't' in stages
+    entry.translation_transform.setWithArray(translation(3.0))
+    inputs.itemById('external rotation').isEnabledCheckBoxChecked = 'e' in stages
+    entry.external_rotation_transform.setWithArray(rotation_z(20.0))
+    return command
+
+
+def preview(command, trace_memory: bool) -> dict:
+    """Runs one preview of the command and returns what it cost."""
+    args = adsk.core.CommandEventArgs(command)
+    fake.calls.reset()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        entry.command_preview(args)
+    wall_seconds = time.perf_counter() - start
+    peak_bytes = None
+    if trace_memory:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        entry.command_destroy(args)
+    return {
+        'wall_seconds': wall_seconds,
+        'simulated_api_seconds': fake.calls.simulated_seconds,
+        'api_calls': fake.calls.total_calls,
+        'api_call_counts': dict(fake.calls.counts.most_common()),
+        'peak_bytes': peak_bytes,
+        'messages': list(adsk.core.Application.get().userInterface.messages),
+    }
+
+
+def run_scenario(scenario: dict, arguments) -> dict:
+    runs = []
+    for repeat in range(arguments.repeat):
+        runs.append(preview(open_dialog(scenario, arguments.scale), trace_memory=False))
+    best = min(runs, key=lambda run: run['wall_seconds'])
+    # tracemalloc slows every allocation down, so memory is measured in a run of its own.
+    traced = preview(open_dialog(scenario, arguments.scale), trace_memory=True)
+    with open(os.path.join(config.PROFILE_FOLDER, 'preview_profile.json')) as file:
+        phases = json.load(file)['phases']
+    design = adsk.core.Application.get().activeProduct
+    result = dict(scenario)
+    result.update(best)
+    result['peak_bytes'] = traced['peak_bytes']
+    result['total_seconds'] = best['wall_seconds'] + best['simulated_api_seconds']
+    result['timeline_features'] = len(design.timeline)
+    result['phases'] = phases
+    result['api_calls_per_copy'] = api_calls_per_copy(scenario, arguments, best['api_calls'])
+    return result
+
+
+def api_calls_per_copy(scenario: dict, arguments, api_calls: int) -> float:
+    """Returns the API calls each copy of a scenario adds.
+
+    Reading the dialog costs the same calls however many copies there are, so
+    the calls of the same scenario with a single copy are taken off first.
+    """
+    if scenario['copies'] <= 1:
+        return float(api_calls)
+    single = preview(open_dialog(dict(scenario, copies=1), arguments.scale), trace_memory=False)
+    return (api_calls - single['api_calls']) / (scenario['copies'] - 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_FOLDER,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(arguments):
+    costs = dict(DEFAULT_COSTS)
+    if arguments.costs:
+        with open(arguments.costs) as file:
+            costs.update(json.load(file))
+    fake.calls.configure(costs, arguments.default_cost, arguments.realize_costs)
+    config.PROFILE_FOLDER = tempfile.mkdtemp(prefix='preview_benchmark_')
+    config.PLAN_FOLDER = os.path.join(config.PROFILE_FOLDER, 'plans')
+
+    results = []
+    print(f'{"scenario":<70} {"total s":>9} {"wall s":>8} {"calls":>8} {"per copy":>8} {"peak MB":>8}')
+    for scenario in scenarios(arguments):
+        result = run_scenario(scenario, arguments)
+        results.append(result)
+        print(f'{scenario_key(scenario):<70} {result["total_seconds"]:9.3f} {result["wall_seconds"]:8.3f} '
+              f'{result["api_calls"]:8d} {result["api_calls_per_copy"]:8.1f} {result["peak_bytes"] / 1e6:8.2f}')
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'costs': costs,
+        'default_cost': arguments.default_cost,
+        'realize_costs': arguments.realize_costs,
+        'repeat': arguments.repeat,
+        'api_calls_per_copy_budget': config.API_CALLS_PER_COPY_BUDGET,
+        'results': results,
+    }
+    path = arguments.save or os.path.join(BENCHMARKS_FOLDER, 'results', time.strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'saved {len(results)} scenarios to {path}')
+
+    over_budget = [result for result in results
+                   if 0 < config.API_CALLS_PER_COPY_BUDGET < result['api_calls_per_copy']]
+    for result in over_budget:
+        print(f'{scenario_key(result)} makes {result["api_calls_per_copy"]:.1f} API calls per copy, '
+              f'more than the budget of {config.API_CALLS_PER_COPY_BUDGET}')
+    assert not over_budget, f'{len(over_budget)} scenarios are over the API call budget'
+
+
+def compare(before_path: str, after_path: str):
+    """Prints how each scenario of both result files changed, as after / before."""
+    with open(before_path) as file:
+        before = {scenario_key(result): result for result in json.load(file)['results']}
+    with open(after_path) as file:
+        after = {scenario_key(result): result for result in json.load(file)['results']}
+    print(f'{"scenario":<70} {"total":>8} {"wall":>8} {"calls":>8} {"memory":>8}')
+    for key, new in after.items():
+        old = before.get(key)
+        if old is None:
+            continue
+        ratios = [new[name] / old[name] if old[name] else float('nan')
+                  for name in ('total_seconds', 'wall_seconds', 'api_calls', 'peak_bytes')]
+        print(f'{key:<70} ' + ' '.join(f'{ratio:7.2f}x' for ratio in ratios))
+    missing = len(set(before) ^ set(after))
+    if missing:
+        print(f'{missing} scenarios are only in one of the files')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--bodies', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--stages', nargs='+', default=['st', 'site'],
+                        help='letters of the enabled stages: s scale, i internal rotation, t translation, e external rotation')
+    parser.add_argument('--recursive', type=lambda text: text.lower() in ('1', 'true', 'yes', 'on'),
+                        nargs='+', default=[False, True])
+    parser.add_argument('--output', nargs='+', choices=sorted(OUTPUTS), default=['parametric', 'base', 'graphics'])
+    parser.add_argument('--scale', type=float, default=0.9, help='scale ratio of the scale stage')
+    parser.add_argument('--repeat', type=int, default=3, help='previews per scenario, the fastest is kept')
+    parser.add_argument('--costs', help='JSON file of seconds per API call overriding the default cost model')
+    parser.add_argument('--default-cost', type=float, default=DEFAULT_COST,
+                        help='seconds charged for every call without a cost of its own')
+    parser.add_argument('--realize-costs', action='store_true',
+                        help='sleep for the simulated cost of every call, so the preview time budget sees it')
+    parser.add_argument('--save', help='where to write the results (default benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files and exit')
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        compare(*arguments.compare)
+        return
+    for stages in arguments.stages:
+        if set(stages) - set(STAGE_LETTERS):
+            parser.error(f'unknown stage letters in {stages}')
+    run(arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+# The command package imports adsk when it is imported, so the tests run
+# against the fake adsk package of the benchmarks, like run_preview.py does.
+
+import os
+import sys
+
+TESTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(TESTS_FOLDER)
+sys.path.insert(0, os.path.join(REPOSITORY_FOLDER, 'benchmarks', 'fake_adsk'))
+sys.path.insert(0, REPOSITORY_FOLDER)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import expressions
+
+
+@pytest.mark.parametrize('text', [
+    "__import__('os')",
+    '().__class__',
+    'sin.__globals__',
+    '(1, 2)[0]',
+    'k[0]',
+    'lambda: 1',
+    '[k for k in (1, 2)]',
+    'sum(k for k in (1, 2))',
+    'open',
+    'x + 1',
+    'sin(k, out=k)',
+    'True',
+    "'k'",
+])
+def test_text_outside_the_whitelist_is_refused(text):
+    with pytest.raises(expressions.ExpressionError):
+        expressions.Expression(text)
+
+
+@pytest.mark.parametrize('text', ['10**10**10', '9**9**9**9', '2.0**k**k'])
+def test_huge_powers_have_no_finite_value(text):
+    with pytest.raises(expressions.ExpressionError, match='no finite value'):
+        expressions.evaluate(text, 20)
+
+
+def test_long_text_is_refused_before_it_is_parsed():
+    with pytest.raises(expressions.ExpressionError, match='longer than'):
+        expressions.Expression('(' * expressions.MAXIMUM_LENGTH + '1' + ')' * expressions.MAXIMUM_LENGTH)
+
+
+def test_evaluate_returns_float64_over_the_copies():
+    values = expressions.evaluate('0.9**k + k/n + sin(pi*k)', 7)
+    k = np.arange(1, 8, dtype=float)
+    assert values.dtype == np.float64
+    assert values.shape == (7,)
+    np.testing.assert_allclose(values, 0.9**k + k / 7 + np.sin(np.pi * k), rtol=1e-15)
+
+    constant = expressions.evaluate('1/3', 4)
+    assert constant.dtype == np.float64
+    np.testing.assert_array_equal(constant, np.full(4, 1 / 3))
+    assert expressions.evaluate(2, 3).dtype == np.float64
+    assert expressions.evaluate('k', 0).shape == (0,)
+
+
+def test_constant_and_per_copy_expressions():
+    assert expressions.compile_expression('2*pi').is_constant
+    assert expressions.compile_expression('2*pi').value() == 2 * np.pi
+    assert expressions.compile_expression('k/n').variables == {'k', 'n'}
+    with pytest.raises(expressions.ExpressionError, match='depends on k'):
+        expressions.compile_expression('k').value()
@@ -0,0 +1,97 @@
+import dataclasses
+
+import numpy as np
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import fractal, plan
+
+
+def similarity_maps(scales, seed=0):
+    # Maps that rotate, scale by the given factors and translate at random.
+    rng = np.random.default_rng(seed)
+    maps = np.empty((len(scales), 4, 4))
+    for index, scale in enumerate(scales):
+        rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        maps[index] = np.identity(4)
+        maps[index, :3, :3] = scale * rotation
+        maps[index, :3, 3] = rng.normal(size=3)
+    return maps
+
+
+def test_leaf_chunks_are_the_leaves_of_a_full_expansion_in_order():
+    maps = similarity_maps([0.5, 0.6, 0.7])
+    expansion = fractal.expand(maps, 5)
+    chunks = list(fractal.leaf_chunks(maps, 5, chunk_size=50))
+    assert len(chunks) == 5
+    np.testing.assert_allclose(np.concatenate(chunks), expansion.matrices, rtol=0.0, atol=1e-12)
+    # The first generation's map is the most significant digit of a leaf index.
+    leaf = 2 * 3 ** 4 + 0 * 3 ** 3 + 1 * 3 ** 2 + 2 * 3 + 1
+    np.testing.assert_allclose(expansion.matrices[leaf], maps[2] @ maps[0] @ maps[1] @ maps[2] @ maps[1],
+                               rtol=0.0, atol=1e-12)
+    np.testing.assert_array_equal(expansion.generations, np.full(3 ** 5, 5))
+
+
+def test_full_depth_is_the_generation_expand_stops_at():
+    maps = similarity_maps([0.5, 0.5, 0.5])
+    for depth, maximum_instances in ((20, 100), (3, 100), (4, 81), (4, 80), (0, 100)):
+        expansion = fractal.expand(maps, depth, maximum_instances=maximum_instances)
+        assert fractal.full_depth(3, depth, maximum_instances) == expansion.depth
+        assert expansion.num_leaves == 3 ** expansion.depth
+    assert fractal.full_depth(0, 5) == 0
+    assert fractal.full_depth(10, 10, 10 ** 9) == 5
+    assert fractal.full_depth(10, 10, 10 ** 9, limit=10 ** 7) == 7
+
+
+def test_expansion_never_exceeds_the_instance_limit():
+    maps = similarity_maps([0.9, 0.9])
+    expansion = fractal.expand(maps, 40, maximum_instances=10 ** 9)
+    assert expansion.num_leaves == 2 ** 16 <= fractal.MAXIMUM_INSTANCES
+    assert expansion.depth == 16
+
+
+def test_instances_below_the_minimum_scale_are_pruned():
+    maps = similarity_maps([0.3, 0.6, 0.9], seed=1)
+    minimum_scale = 0.1
+    expansion = fractal.expand(maps, 30, minimum_scale=minimum_scale)
+
+    # Breadth first by hand: an instance without a child large enough stays a leaf.
+    finished, generations, active, pruned = [], [], [np.identity(4)], 0
+    for generation in range(30):
+        children = []
+        for parent in active:
+            kept = [parent @ child for child in maps if fractal.largest_scales(parent @ child) >= minimum_scale]
+            if kept:
+                pruned += len(maps) - len(kept)
+                children.extend(kept)
+            else:
+                finished.append(parent)
+                generations.append(generation)
+        active = children
+        if not active:
+            break
+    generations.extend([generation + 1] * len(active))
+
+    np.testing.assert_allclose(expansion.matrices, np.array(finished + active).reshape(-1, 4, 4),
+                               rtol=0.0, atol=1e-12)
+    np.testing.assert_array_equal(expansion.generations, generations)
+    assert expansion.pruned == pruned > 0
+    assert np.all(fractal.largest_scales(expansion.matrices) >= minimum_scale)
+    assert expansion.depth == max(generations)
+
+
+def test_distinct_maps_drop_repeats():
+    maps = similarity_maps([0.5, 0.6, 0.7])
+    repeated = np.stack([maps[0], maps[1], maps[0] + 1e-12, maps[2], maps[1]])
+    np.testing.assert_array_equal(fractal.distinct_maps(repeated), maps)
+    np.testing.assert_array_equal(fractal.distinct_maps(maps), maps)
+    assert fractal.distinct_maps(np.empty((0, 4, 4))).shape == (0, 4, 4)
+
+
+def test_maps_of_constant_modes_are_one_map():
+    parameters = plan.PlanParameters(num_copies=3, do_scaling=True, scale_mode=plan.CONSTANT, scale_values=(0.5, 0.5, 0.5),
+                                     do_translation=True, translation_mode=plan.CONSTANT,
+                                     translation=tuple(np.identity(4).ravel() + np.eye(4, k=3).ravel()))
+    maps = plan.build_plan(parameters).stage_matrices()[1:]
+    assert len(fractal.distinct_maps(maps)) == 1
+    parameters = dataclasses.replace(parameters, translation_mode=plan.COMPOUND)
+    maps = plan.build_plan(parameters).stage_matrices()[1:]
+    assert len(fractal.distinct_maps(maps)) == 3
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import interference
+
+
+def brute_force_pairs(minimums, maximums):
+    overlapping = np.all((minimums[:, None] <= maximums[None]) & (maximums[:, None] >= minimums[None]), axis=2)
+    first, second = np.nonzero(np.triu(overlapping, k=1))
+    return np.stack([first, second], axis=1)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_candidate_pairs_are_the_overlapping_boxes(seed):
+    rng = np.random.default_rng(seed)
+    count = 300
+    # Boxes on a coarse grid, so some of them only touch.
+    minimums = rng.integers(0, 20, size=(count, 3)).astype(float)
+    minimums[:, seed % 3] *= 5
+    maximums = minimums + rng.integers(0, 4, size=(count, 3))
+    pairs = interference.candidate_pairs(minimums, maximums)
+    expected = brute_force_pairs(minimums, maximums)
+    assert len(expected) > 0
+    assert pairs.dtype == np.int64
+    assert np.all(pairs[:, 0] < pairs[:, 1])
+    assert sorted(map(tuple, pairs)) == sorted(map(tuple, expected))
+
+
+def test_candidate_pairs_of_fewer_than_two_boxes():
+    assert interference.candidate_pairs(np.zeros((1, 3)), np.ones((1, 3))).shape == (0, 2)
+    assert interference.candidate_pairs(np.zeros((0, 3)), np.zeros((0, 3))).shape == (0, 2)
+
+
+def transform(linear=np.identity(3), offset=(0.0, 0.0, 0.0)):
+    matrix = np.identity(4)
+    matrix[:3, :3] = linear
+    matrix[:3, 3] = offset
+    return matrix
+
+
+def rotation_z(degrees):
+    angle = np.radians(degrees)
+    return np.array([[np.cos(angle), -np.sin(angle), 0.0],
+                     [np.sin(angle), np.cos(angle), 0.0],
+                     [0.0, 0.0, 1.0]])
+
+
+def interferes(kind, size, first, second):
+    pairs = interference.interfering_proxy_pairs(kind, size, np.stack([first, second]))
+    return [tuple(pair) for pair in pairs] == [(0, 1)]
+
+
+@pytest.mark.parametrize('offset, expected', [
+    ((1.9, 0.0, 0.0), True),
+    ((2.0, 0.0, 0.0), False),     # touching
+    ((2.1, 0.0, 0.0), False),
+    ((1.5, 1.5, 0.0), False),     # the bounding boxes overlap
+    ((1.4, 1.4, 0.0), True),
+])
+def test_spheres(offset, expected):
+    assert interferes(interference.SPHERE, 1.0, transform(), transform(offset=offset)) == expected
+
+
+@pytest.mark.parametrize('distance, direction, expected', [
+    (3.9, 0, True),
+    (4.0, 0, False),              # touching the tip of the long axis
+    (4.1, 0, False),
+    (1.9, 1, True),
+    (2.0, 1, False),              # touching the side
+    (2.1, 1, False),
+])
+def test_sphere_against_a_rotated_ellipsoid(distance, direction, expected):
+    # A sphere stretched by 3 along x and turned by 45 degrees, so its
+    # bounding box overlaps the other sphere's in every case.
+    turn = rotation_z(45)
+    ellipsoid = transform(turn @ np.diag([3.0, 1.0, 1.0]))
+    sphere = transform(offset=distance * turn[:, direction])
+    assert interferes(interference.SPHERE, 1.0, ellipsoid, sphere) == expected
+    assert interferes(interference.SPHERE, 1.0, sphere, ellipsoid) == expected
+
+
+@pytest.mark.parametrize('offset, expected', [
+    ((0.9, 0.0, 0.0), True),
+    ((1.0, 0.0, 0.0), False),     # sharing a face
+    ((1.0, 1.0, 1.0), False),     # sharing a corner
+    ((0.5, 0.5, -0.9), True),
+])
+def test_cubes(offset, expected):
+    assert interferes(interference.CUBE, 1.0, transform(), transform(offset=offset)) == expected
+
+
+@pytest.mark.parametrize('gap, expected', [(-0.05, True), (0.0, False), (0.05, False)])
+def test_cube_against_a_turned_cube_separated_by_a_face(gap, expected):
+    # The turned cube stands on a corner next to the corner (1, 1) of the
+    # other, so only its face normal (1, 1, 0) can separate them.
+    turned = transform(rotation_z(45), offset=(1 + gap, 1 + gap, 0.0))
+    assert interferes(interference.CUBE, 1.0, transform(), turned) == expected
+
+
+@pytest.mark.parametrize('gap, expected', [(-0.05, True), (0.0, False), (0.05, False)])
+def test_cube_against_a_cube_separated_by_an_edge(gap, expected):
+    # The second cube points an edge along (1, -1, 0) at the vertical edge
+    # x = y = 1 of the first, so only the cross product of the two edges,
+    # (1, 1, 0), can separate them.
+    across = np.array([1.0, -1.0, 0.0]) / np.sqrt(2)
+    towards = np.array([1.0, 1.0, 0.0]) / np.sqrt(2)
+    up = np.array([0.0, 0.0, 1.0])
+    edges = np.stack([across, (towards + up) / np.sqrt(2), (up - towards) / np.sqrt(2)], axis=1)
+    middle_of_edge = np.array([1.0, 1.0, 0.5]) + gap * towards
+    second = transform(edges, offset=middle_of_edge - 0.5 * edges[:, 0] - edges[:, 2])
+    assert interferes(interference.CUBE, 1.0, transform(), second) == expected
+    # The same pair twice as large.
+    doubled = np.diag([2.0, 2.0, 2.0, 1.0])
+    assert interferes(interference.CUBE, 1.0, doubled, doubled @ second) == expected
@@ -0,0 +1,99 @@
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+import numpy as np
+import pytest
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import mesh_export, meshes
+
+NAMES = ('Tetrahedron', 'Triangle & <co>')
+
+
+@pytest.fixture
+def body_meshes():
+    tetrahedron = meshes.from_flat_arrays([0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1],
+                                          [0, 2, 1, 0, 1, 3, 0, 3, 2, 1, 2, 3], [])
+    triangle = meshes.from_flat_arrays([0, 0, 2, 1, 0, 2, 0, 1, 2], [0, 1, 2], [])
+    return [tetrahedron, triangle]
+
+
+@pytest.fixture
+def matrices():
+    rng = np.random.default_rng(7)
+    matrices = np.tile(np.identity(4), (5, 1, 1))
+    rotations, _ = np.linalg.qr(rng.normal(size=(5, 3, 3)))
+    matrices[:, :3, :3] = rotations * rng.uniform(0.5, 2.0, (5, 1, 1))
+    matrices[:, :3, 3] = rng.normal(size=(5, 3))
+    return matrices
+
+
+def expected_triangles(mesh, matrices, rows):
+    # The (num_triangles, 3, 3) corners of the copies of a mesh in millimetres, copy by copy.
+    corners = meshes.transform_points(mesh.coordinates, matrices[rows])[:, mesh.indices]
+    return corners.reshape(-1, 3, 3) * mesh_export.UNIT_SCALE
+
+
+def test_stl(tmp_path, body_meshes, matrices):
+    path = tmp_path / 'pattern.stl'
+    rows = [3, 0, 4]
+    assert mesh_export.export(str(path), body_meshes, NAMES, matrices, rows, chunk_copies=2) == 15
+    data = path.read_bytes()
+    assert len(data) == 80 + 4 + 50 * 15
+    assert data[:80].startswith(b'Copy Scale Rotate Translate Rotate pattern')
+    assert data[80:84] == (15).to_bytes(4, 'little')
+    records = np.frombuffer(data, dtype=[('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')],
+                            offset=84)
+    # Each chunk of copies holds the triangles of the first body, then of the second.
+    corners = np.concatenate([expected_triangles(mesh, matrices, chunk)
+                              for chunk in ([3, 0], [4]) for mesh in body_meshes])
+    np.testing.assert_allclose(records['vertices'], corners, rtol=1e-6, atol=1e-5)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    np.testing.assert_allclose(records['normal'], normals, atol=1e-6)
+    assert not np.any(records['attribute'])
+
+
+def test_obj(tmp_path, body_meshes, matrices):
+    path = tmp_path / 'pattern.obj'
+    assert mesh_export.export(str(path), body_meshes, NAMES, matrices, chunk_copies=2) == 25
+    lines = path.read_text().splitlines()
+    assert [line for line in lines if line.startswith('o ')] == ['o ' + name for name in NAMES]
+    vertices = np.array([line.split()[1:] for line in lines if line.startswith('v ')], dtype=float)
+    faces = np.array([line.split()[1:] for line in lines if line.startswith('f ')], dtype=np.int64)
+    assert len(vertices) == 5 * (4 + 3)
+    assert len(faces) == 5 * (4 + 1)
+    assert faces.min() == 1 and faces.max() == len(vertices)
+    expected = np.concatenate([expected_triangles(mesh, matrices, np.arange(5)) for mesh in body_meshes])
+    np.testing.assert_allclose(vertices[faces - 1], expected, rtol=1e-5, atol=1e-5)
+
+
+def test_3mf_instances_each_mesh_once_and_transforms_the_build_items(tmp_path, body_meshes, matrices):
+    path = tmp_path / 'pattern.3mf'
+    rows = [4, 1, 2]
+    assert mesh_export.export(str(path), body_meshes, NAMES, matrices, rows) == 15
+    with zipfile.ZipFile(path) as package:
+        assert {'[Content_Types].xml', '_rels/.rels', '3D/3dmodel.model'} <= set(package.namelist())
+        model = ElementTree.fromstring(package.read('3D/3dmodel.model'))
+    namespace = {'m': 'http://schemas.microsoft.com/3dmanufacturing/core/2015/02'}
+    assert model.get('unit') == 'millimeter'
+    objects = model.findall('m:resources/m:object', namespace)
+    assert [item.get('name') for item in objects[:2]] == list(NAMES)
+    for item, mesh in zip(objects, body_meshes):
+        assert len(item.findall('m:mesh/m:vertices/m:vertex', namespace)) == mesh.num_nodes
+        assert len(item.findall('m:mesh/m:triangles/m:triangle', namespace)) == mesh.num_triangles
+    items = model.findall('m:build/m:item', namespace)
+    assert len(items) == len(rows)
+
+    # 3MF transforms act on row vectors: p' = [x y z 1] @ [m00 m01 m02; m10 ...; m30 m31 m32].
+    points = body_meshes[0].coordinates * mesh_export.UNIT_SCALE
+    for item, row in zip(items, rows):
+        assert item.get('objectid') == objects[-1].get('id')
+        transform = np.array(item.get('transform').split(), dtype=float).reshape(4, 3)
+        placed = points @ transform[:3] + transform[3]
+        np.testing.assert_allclose(placed, meshes.transform_points(body_meshes[0].coordinates, matrices[row])[0]
+                                   * mesh_export.UNIT_SCALE, rtol=1e-7, atol=1e-7)
+
+
+def test_unknown_formats_are_refused(tmp_path, body_meshes, matrices):
+    with pytest.raises(ValueError, match='cannot export .ply'):
+        mesh_export.export(str(tmp_path / 'pattern.ply'), body_meshes, NAMES, matrices)
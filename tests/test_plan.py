@@ -0,0 +1,167 @@
+import dataclasses
+
+import numpy as np
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import plan
+
+STAGES = ('scales', 'internal_rotations', 'translations', 'external_rotations')
+
+
+def assert_same_plan(cached: plan.TransformPlan, built: plan.TransformPlan):
+    for name in STAGES:
+        np.testing.assert_allclose(getattr(cached, name), getattr(built, name), rtol=0.0, atol=1e-12)
+    np.testing.assert_allclose(cached.net_matrices(), built.net_matrices(), rtol=0.0, atol=1e-12)
+
+
+def test_cache_follows_scale_expressions_of_the_copy_count():
+    cache = plan.PlanCache()
+    parameters = plan.PlanParameters(num_copies=5, do_scaling=True, scale_mode=plan.CONSTANT,
+                                     scale_values=('1-k/(2*n)',) * 3,
+                                     do_translation=True, translation_mode=plan.COMPOUND_SCALE,
+                                     translation=(1.0, 0.0, 0.0, 2.0,
+                                                  0.0, 1.0, 0.0, 0.0,
+                                                  0.0, 0.0, 1.0, 0.0,
+                                                  0.0, 0.0, 0.0, 1.0))
+    cache.get(parameters)
+    for num_copies in (10, 3, 10):
+        parameters = dataclasses.replace(parameters, num_copies=num_copies)
+        cached, first_changed_row = cache.get(parameters)
+        assert_same_plan(cached, plan.build_plan(parameters))
+        assert first_changed_row == 1
+
+
+def test_cache_appends_rows_of_stages_without_the_copy_count():
+    cache = plan.PlanCache()
+    parameters = plan.PlanParameters(num_copies=40, do_scaling=True, scale_values=('0.99**k',) * 3,
+                                     scale_randomization=(5.0, 5.0, 5.0), seed=3)
+    cache.get(parameters)
+    parameters = dataclasses.replace(parameters, num_copies=41)
+    cached, first_changed_row = cache.get(parameters)
+    assert_same_plan(cached, plan.build_plan(parameters))
+    assert first_changed_row == 41
+
+
+def test_cache_follows_angle_and_offset_expressions_of_the_copy_count():
+    cache = plan.PlanCache()
+    parameters = plan.PlanParameters(num_copies=5, do_internal_rotation=True, internal_rotation_angle='360*k/n',
+                                     do_translation=True, translation_mode=plan.CONSTANT,
+                                     translation_offsets=('k/n', None, '1'),
+                                     do_external_rotation=True, external_rotation_mode=plan.COMPOUND,
+                                     external_rotation_angle='90/n')
+    cache.get(parameters)
+    for num_copies in (10, 3):
+        parameters = dataclasses.replace(parameters, num_copies=num_copies)
+        cached, first_changed_row = cache.get(parameters)
+        assert_same_plan(cached, plan.build_plan(parameters))
+        assert first_changed_row == 1
+
+
+def test_cache_only_builds_the_rows_and_stages_that_changed(monkeypatch):
+    cache = plan.PlanCache()
+    parameters = plan.PlanParameters(num_copies=40, do_scaling=True, scale_values=(0.9, 0.9, 0.9),
+                                     do_internal_rotation=True, internal_rotation_mode=plan.COMPOUND,
+                                     internal_rotation_angle=15.0)
+    cache.get(parameters)
+    built = []
+    build_stage = plan.build_stage
+    monkeypatch.setattr(plan, 'build_stage', lambda name, p, n, start=0: built.append((name, start)) or build_stage(name, p, n, start))
+
+    parameters = dataclasses.replace(parameters, num_copies=41)
+    cached, first_changed_row = cache.get(parameters)
+    assert sorted(built) == sorted((name, 41) for name in STAGES)
+    assert_same_plan(cached, plan.build_plan(parameters))
+
+    built.clear()
+    parameters = dataclasses.replace(parameters, scale_values=(0.8, 0.8, 0.8))
+    cached, first_changed_row = cache.get(parameters)
+    assert built == [('scales', 0)]
+    assert first_changed_row == 1
+    assert_same_plan(cached, plan.build_plan(parameters))
+
+
+def random_rotations(rng, count):
+    rotations, _ = np.linalg.qr(rng.normal(size=(count, 3, 3)))
+    # Turn the reflections QR returns into rotations.
+    rotations[:, :, 0] *= np.sign(np.linalg.det(rotations))[:, None]
+    return rotations
+
+
+def recompose(scales, moves):
+    # moves @ diag(scales), with the scales on the axes of the first three columns.
+    matrices = moves.copy()
+    matrices[:, :3, :3] *= scales[:, None, :]
+    return matrices
+
+
+def test_split_scales_and_moves_recomposes_similarity_transforms():
+    rng = np.random.default_rng(2)
+    count = 50
+    matrices = np.tile(np.identity(4), (count, 1, 1))
+    scales = rng.uniform(0.1, 3.0, (count, 3))
+    scales[:10] = scales[:10, :1]          # uniform
+    scales[10:20, 2] *= -1                 # mirrored
+    matrices[:, :3, :3] = random_rotations(rng, count) * scales[:, None, :]
+    matrices[:, :3, 3] = rng.normal(size=(count, 3))
+
+    split_scales, moves = plan.split_scales_and_moves(matrices)
+    np.testing.assert_allclose(recompose(split_scales, moves), matrices, rtol=0.0, atol=1e-12)
+    np.testing.assert_allclose(np.abs(split_scales), np.abs(scales), rtol=1e-12)
+    assert np.all(plan.rigid_rows(moves))
+    np.testing.assert_allclose(np.linalg.det(moves[:, :3, :3]), 1.0, rtol=1e-12)
+
+
+def test_split_scales_and_moves_of_a_plan():
+    parameters = plan.PlanParameters(num_copies=12, do_scaling=True, scale_values=('0.9**k', 0.8, '1+k/n'),
+                                     do_internal_rotation=True, internal_rotation_angle='30*k',
+                                     do_translation=True, translation_mode=plan.COMPOUND,
+                                     translation_offsets=(2.0, 'k', 0.0))
+    matrices = plan.build_plan(parameters).net_matrices()
+    scales, moves = plan.split_scales_and_moves(matrices)
+    np.testing.assert_allclose(recompose(scales, moves), matrices, rtol=0.0, atol=1e-12)
+
+
+def test_split_scales_and_moves_refuses_shear():
+    sheared = np.identity(4)
+    sheared[0, 1] = 0.3
+    assert plan.split_scales_and_moves(sheared) is None
+    # A rotation after a non-uniform scale is fine, a non-uniform scale after a rotation shears.
+    rotation = np.identity(4)
+    rotation[:3, :3] = random_rotations(np.random.default_rng(5), 1)[0]
+    stretch = np.diag([2.0, 1.0, 1.0, 1.0])
+    assert plan.split_scales_and_moves(rotation @ stretch) is not None
+    assert plan.split_scales_and_moves(np.stack([np.identity(4), stretch @ rotation])) is None
+
+
+def triad(degrees, axis, origin):
+    # The 16 element array of a triad turned by degrees about axis and moved to origin.
+    matrix = plan._axis_angle_matrices(np.array([axis], dtype=float), np.radians([degrees]))[0]
+    matrix[:3, 3] = origin
+    return tuple(matrix.ravel())
+
+
+def test_angle_rotations_turn_about_the_triad_origin():
+    origin = np.array([2.0, -1.0, 3.0])
+    for mode in (plan.CONSTANT, plan.COMPOUND):
+        parameters = plan.PlanParameters(num_copies=6, do_internal_rotation=True, internal_rotation_mode=mode,
+                                         internal_rotation=triad(30, (1, 1, 0), origin),
+                                         internal_rotation_angle='15*k')
+        rotations = plan.build_plan(parameters).internal_rotations[1:]
+        # The origin of the triad and every point on its axis stay put.
+        for point in (origin, origin + 3 * np.array([1.0, 1.0, 0.0])):
+            np.testing.assert_allclose(rotations[:, :3, :3] @ point + rotations[:, :3, 3],
+                                       np.tile(point, (6, 1)), rtol=0.0, atol=1e-12)
+        angles = 15 * np.arange(1, 7)
+        if mode == plan.COMPOUND:
+            angles = np.cumsum(angles)
+        expected = plan._axis_angle_matrices(np.tile([1.0, 1.0, 0.0], (6, 1)), np.radians(angles))
+        np.testing.assert_allclose(rotations[:, :3, :3], expected[:, :3, :3], rtol=0.0, atol=1e-12)
+
+
+def test_angle_rotations_of_a_triad_at_the_world_origin_have_no_translation():
+    parameters = plan.PlanParameters(num_copies=4, do_external_rotation=True, external_rotation_angle='90')
+    rotations = plan.build_plan(parameters).external_rotations[1:]
+    np.testing.assert_array_equal(rotations[:, :3, 3], 0.0)
+    # Without a turn of its own the triad turns the copies about Z through its origin.
+    parameters = dataclasses.replace(parameters, external_rotation=triad(0, (0, 0, 1), (1.0, 0.0, 0.0)))
+    rotations = plan.build_plan(parameters).external_rotations[1:]
+    np.testing.assert_allclose(rotations[0] @ [2.0, 0.0, 5.0, 1.0], [1.0, 1.0, 5.0, 1.0], rtol=0.0, atol=1e-12)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from CopyScaleRotateTranslateRotate.commands.CopyScaleRotateTranslateRotate import plan, plan_store
+
+
+def test_written_plan_is_replayed_as_a_memory_map(tmp_path):
+    parameters = plan.PlanParameters(num_copies=9, do_scaling=True, scale_values=(0.9, 0.9, 0.9), seed=4)
+    matrices = plan.build_plan(parameters).net_matrices()
+    key = plan_store.plan_key(parameters)
+    chunks = plan_store.row_chunks(matrices, chunk_rows=4)
+    plan_store.write(str(tmp_path / 'pattern.json'), key, len(matrices), chunks, [1] * len(matrices))
+
+    stored = plan_store.read(str(tmp_path / 'pattern.json'))
+    assert isinstance(stored.matrices, np.memmap)
+    assert stored.header['key'] == key
+    assert stored.header['key']['parameters']['seed'] == 4
+    np.testing.assert_array_equal(stored.matrices, matrices)
+    np.testing.assert_array_equal(stored.generations(), np.arange(len(matrices)))
+
+
+def test_row_chunks_read_the_rows_asked_for():
+    matrices = np.arange(10 * 16, dtype=float).reshape(10, 4, 4)
+    rows = [7, 1, 3, 9, 0]
+    chunks = list(plan_store.row_chunks(matrices, rows, chunk_rows=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    np.testing.assert_array_equal(np.concatenate(chunks), matrices[rows])